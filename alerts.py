@@ -0,0 +1,178 @@
+
+import heapq # For the reorder priority queue
+import json # For the settings file
+import os # For atomic replace of the settings file
+
+# Low-stock and category capacity alerts for the stocktaking app
+# Settings (stock_data.json.alerts.json) give items a reorder level and a category, and categories a
+# capacity. Alerts are worked out for the items touched by each change only: the item's place in the
+# reorder queue is updated and its category's running total is adjusted by the change. The reorder
+# queue is a heap ordered by how far below its reorder level each item is, so "what needs reordering
+# now" reads the top of the heap instead of checking every item.
+
+# Settings used when there is no settings file (a reorder level of 0 means "never alert")
+DEFAULT_SETTINGS = {
+    "default_reorder_level": 0,
+    "reorder_levels": {},
+    "item_categories": {},
+    "category_capacities": {},
+}
+
+
+# Function to return a fresh copy of the default settings
+def default_settings():
+    return {key: (value.copy() if isinstance(value, dict) else value) for key, value in DEFAULT_SETTINGS.items()}
+
+
+# Function to load alert settings from a JSON file (defaults for anything missing)
+def load_settings(path):
+    settings = default_settings()
+    try:
+        with open(path, "r") as file:
+            saved = json.load(file)
+    except FileNotFoundError:
+        return settings
+    if isinstance(saved, dict):
+        settings.update({key: value for key, value in saved.items() if key in DEFAULT_SETTINGS})
+    return settings
+
+
+# Function to check that alert settings have every expected key with values of the right type (raises
+# ValueError describing the first problem)
+def check_settings(settings):
+    if not isinstance(settings, dict) or set(settings) != set(DEFAULT_SETTINGS):
+        raise ValueError(f"Alert settings must have exactly these keys: {', '.join(sorted(DEFAULT_SETTINGS))}.")
+    if not _is_count(settings["default_reorder_level"]):
+        raise ValueError("The default reorder level must be a whole number of 0 or more.")
+    for key, check in (("reorder_levels", _is_count), ("item_categories", _is_name), ("category_capacities", _is_count)):
+        values = settings[key]
+        if not isinstance(values, dict) or not all(_is_name(name) and check(value) for name, value in values.items()):
+            raise ValueError(f"Alert setting '{key}' has a bad entry.")
+
+
+# Function to check for a whole number of 0 or more (true/false don't count)
+def _is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+# Function to check for a non-empty name
+def _is_name(value):
+    return isinstance(value, str) and bool(value.strip())
+
+
+# Function to write alert settings to a JSON file without ever leaving a half-written one
+def save_settings(path, settings):
+    with open(path + ".tmp", "w") as file:
+        json.dump(settings, file, indent=4, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+# Define the AlertEngine class that tracks items to reorder and category totals
+class AlertEngine:
+    # Reorder heap plus running category totals, updated one item at a time.
+
+    # Initialize the AlertEngine with its settings
+    def __init__(self, settings=None):
+        self.settings = settings if settings is not None else default_settings()
+        self.reset()
+
+    # Method to clear everything tracked
+    def reset(self):
+        # Heap of [quantity / reorder level, item, quantity, level]; entries are replaced, not removed
+        self._heap = []
+        # Item -> its current heap entry (an entry no longer here is stale and skipped)
+        self._entries = {}
+        # Last quantity seen for items in a category, and each category's running total
+        self._quantities = {}
+        self.category_totals = {}
+
+    # Method to return an item's reorder level (0 = no alert)
+    def reorder_level(self, item):
+        return int(self.settings["reorder_levels"].get(item, self.settings["default_reorder_level"]))
+
+    # Method to return an item's category (None if it has none)
+    def category_of(self, item):
+        return self.settings["item_categories"].get(item)
+
+    # Method to work out every alert from scratch (after loading, or when the settings change)
+    def rebuild(self, inventory):
+        self.reset()
+        # Items with their own level or a category are looked up one by one (as many as the settings list)
+        named = set(self.settings["reorder_levels"]) | set(self.settings["item_categories"])
+        items = {}
+        for item in named:
+            quantity = inventory.get(item, None)
+            if quantity is not None:
+                items[item] = quantity
+        default_level = self.settings["default_reorder_level"]
+        if default_level > 0:
+            # Any other item can only alert at or below the default level, so only those are read
+            items.update((item, quantity) for item, quantity in inventory.at_or_below(default_level) if item not in items)
+        for item, quantity in items.items():
+            self.update(item, quantity)
+        # Items with a reorder level that ran out (and were deleted) still need reordering
+        for item in self.settings["reorder_levels"]:
+            if item not in inventory:
+                self.update(item, 0)
+
+    # Method to take in an item's new quantity; returns messages for alerts that have just started
+    def update(self, item, quantity):
+        messages = []
+        level = self.reorder_level(item)
+        was_low = item in self._entries
+        if level > 0 and quantity <= level:
+            # Push a new entry; the old one (if any) becomes stale
+            entry = [quantity / level, item, quantity, level]
+            self._entries[item] = entry
+            heapq.heappush(self._heap, entry)
+            if len(self._heap) > 2 * len(self._entries) + 64:
+                # Mostly stale entries; rebuild the heap from the current ones
+                self._heap = list(self._entries.values())
+                heapq.heapify(self._heap)
+            if not was_low:
+                messages.append(f"'{item}' is down to {quantity} (reorder level {level}).")
+        elif was_low:
+            del self._entries[item]
+        category = self.category_of(item)
+        if category is not None:
+            # Adjust the category's running total by this item's change only
+            before = self.category_totals.get(category, 0)
+            after = before + quantity - self._quantities.get(item, 0)
+            self._quantities[item] = quantity
+            self.category_totals[category] = after
+            capacity = self.settings["category_capacities"].get(category)
+            if capacity is not None and before <= capacity < after:
+                messages.append(f"Category '{category}' is over its capacity ({after}/{capacity}).")
+        return messages
+
+    # Method to return how much more of an item its category has room for (None if no limit)
+    def category_room(self, item):
+        category = self.category_of(item)
+        capacity = self.settings["category_capacities"].get(category)
+        if capacity is None:
+            return None
+        return capacity - self.category_totals.get(category, 0)
+
+    # Method to return [(item, quantity, level)] most urgent first (empty items first)
+    def reorder_list(self, limit=None):
+        # Drop stale entries off the top, then take the top valid ones and put them back
+        taken = []
+        while self._heap and (limit is None or len(taken) < limit):
+            entry = heapq.heappop(self._heap)
+            if self._entries.get(entry[1]) is entry:
+                taken.append(entry)
+        for entry in taken:
+            heapq.heappush(self._heap, entry)
+        return [(item, quantity, level) for _, item, quantity, level in taken]
+
+    # Method to return how many items are at or below their reorder level
+    def low_count(self):
+        return len(self._entries)
+
+    # Method to return [(category, total, capacity)] for every category over its capacity
+    def over_capacity(self):
+        return [
+            (category, self.category_totals.get(category, 0), capacity)
+            for category, capacity in sorted(self.settings["category_capacities"].items())
+            if self.category_totals.get(category, 0) > capacity
+        ]
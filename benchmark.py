@@ -0,0 +1,209 @@
+
+import argparse # For the command line options
+import json # For the results file and the legacy load baseline
+import os # For temporary file paths
+import platform # For recording where the benchmark ran
+import sys # For the Python version and exit code
+import tempfile # For a scratch directory for the stock files
+import time # For timing
+from datetime import datetime # For the timestamp in the results
+
+from stock_engine import StockEngine # Headless engine used by the GUI and CLI
+from inventory import Inventory # For writing the starting binary snapshot
+from snapshot import BinarySnapshot # Binary snapshot format
+
+# Benchmark suite for the stocktaking app
+# Generates synthetic catalogues at several sizes and times the operations the app does all the time:
+# load, save, add, remove, total, a full revaluation, a full display refresh and the GUI startup (time
+# until the window shell is built and until the stock is listed; both against a hidden Tk window when a
+# display is available). Results are written as JSON so two runs can be compared with --compare.
+# Examples:
+#   python benchmark.py                                  (1k, 100k and 1M items)
+#   python benchmark.py --sizes 1000 10000 --output new.json --compare old.json
+#   python benchmark.py --backend binary                 (binary snapshot instead of JSON)
+
+# Default catalogue sizes
+DEFAULT_SIZES = [1000, 100000, 1000000]
+# Number of single adds/removes timed per size
+DEFAULT_OPERATIONS = 1000
+# A result this much slower than the previous run is reported as a regression
+REGRESSION_FACTOR = 1.25
+# Stock file extension for each storage backend
+EXTENSIONS = {"json": "json", "binary": "stock", "sqlite": "db"}
+
+
+# Function to make a synthetic catalogue of item name -> quantity
+def make_catalogue(size):
+    return {f"item {index:07d}": (index * 7919) % 500 + 1 for index in range(size)}
+
+
+# Function to time one call of a function, returning (seconds, result)
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+# Function to load a JSON stock file the way stock_v4.py used to (json.load plus a cleaned copy)
+def legacy_load(path):
+    with open(path, "r") as file:
+        data = json.load(file)
+    cleaned = {}
+    for k, v in data.items():
+        try:
+            cleaned[str(k).strip().lower()] = int(v)
+        except (ValueError, TypeError):
+            cleaned[str(k).strip().lower()] = 0
+    return cleaned
+
+
+# Function to time a full display refresh in a hidden Tk window (None if there is no display)
+def time_refresh(inventory):
+    try:
+        import tkinter as tk
+        from virtual_list import VirtualListbox
+        root = tk.Tk()
+    except Exception:
+        # No display (e.g. a server without X); the refresh benchmark is skipped
+        return None
+    try:
+        root.withdraw()
+        listbox = VirtualListbox(root, height=15, width=50)
+        seconds, _ = timed(listbox.set_rows, ((item, f"{item}: {quantity}") for item, quantity in inventory.items()))
+        root.update_idletasks()
+        return seconds
+    finally:
+        root.destroy()
+
+
+# Function to time the GUI startup in a hidden Tk window: (seconds until the window shell is built,
+# seconds until the stock is loaded and listed), or None if there is no display
+def time_startup(path, timeout=120.0):
+    try:
+        import tkinter as tk
+        from stock_v4 import StockTakingApp
+        root = tk.Tk()
+    except Exception:
+        # No display (e.g. a server without X); the startup benchmark is skipped
+        return None
+    root.withdraw()
+    start = time.perf_counter()
+    app = StockTakingApp(root, path)
+    root.update_idletasks()
+    shell = time.perf_counter() - start
+    # Run the main loop until every startup stage has finished
+    while (not app.loaded or app.fill_job is not None) and time.perf_counter() - start < timeout:
+        root.update()
+        time.sleep(0.001)
+    ready = time.perf_counter() - start
+    app.on_closing()
+    return shell, ready
+
+
+# Function to run every benchmark for one catalogue size and return a dictionary of timings (seconds)
+def run_size(size, operations, directory, backend="json"):
+    results = {}
+    catalogue = make_catalogue(size)
+    path = os.path.join(directory, f"stock_{size}.{EXTENSIONS[backend]}")
+    capacity = sum(catalogue.values()) + operations * 10
+
+    # Save: a full snapshot of the catalogue (for SQLite: writing every row in one transaction)
+    engine = StockEngine(path, capacity)
+    if backend == "json":
+        # Saving folds what is on disk into a new snapshot, so start from a plain snapshot file
+        with open(path, "w") as file:
+            json.dump(catalogue, file)
+        results["save"], _ = timed(engine.save)
+    elif backend == "binary":
+        with open(path, "wb") as file:
+            file.write(BinarySnapshot.dump(Inventory(catalogue, capacity)))
+        results["save"], _ = timed(engine.save)
+    else:
+        engine.load()
+        results["save"], _ = timed(lambda: ([engine.inventory.set(item, quantity) for item, quantity in catalogue.items()], engine.save()))
+    engine.close()
+
+    # Load: the streaming loader (plus the old json.load path for comparison)
+    engine = StockEngine(path, capacity)
+    results["load"], _ = timed(engine.load)
+    if backend == "json":
+        results["load_legacy"], _ = timed(legacy_load, path)
+
+    # Add and remove: average time of one journalled change
+    names = list(catalogue)[: operations]
+    seconds, _ = timed(lambda: [engine.add(name, 1) for name in names])
+    results["add"] = seconds / len(names)
+    seconds, _ = timed(lambda: [engine.remove(name, 1) for name in names])
+    results["remove"] = seconds / len(names)
+
+    # Total: the running total (and a full recount for comparison)
+    results["total"], _ = timed(engine.total)
+    results["total_recount"], _ = timed(lambda: sum(engine.inventory.values()))
+
+    # Value: a full revaluation with every item priced (the running totals are kept per change instead)
+    engine.valuation.set_prices({item: (1.25, 2.0) for item in catalogue}, engine.inventory)
+    results["revalue"], _ = timed(engine.valuation.revalue)
+
+    # Refresh: rebuild every row of the list widget
+    refresh = time_refresh(engine.inventory)
+    if refresh is not None:
+        results["refresh"] = refresh
+    engine.close()
+
+    # Startup: the window shell first, then the stock loaded and listed in the background
+    startup = time_startup(path)
+    if startup is not None:
+        results["startup_shell"], results["startup_ready"] = startup
+    return results
+
+
+# Function to compare two result files and return a list of regression messages
+def compare(previous, current, factor=REGRESSION_FACTOR):
+    messages = []
+    for size, timings in current["results"].items():
+        for name, seconds in timings.items():
+            before = previous.get("results", {}).get(size, {}).get(name)
+            if before and seconds > before * factor:
+                messages.append(f"{size} items / {name}: {before:.6f}s -> {seconds:.6f}s ({seconds / before:.2f}x)")
+    return messages
+
+
+# Function to run the suite from the command line and return the exit code
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stocktaking app benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="catalogue sizes")
+    parser.add_argument("--operations", type=int, default=DEFAULT_OPERATIONS, help="adds/removes timed per size")
+    parser.add_argument("--backend", choices=sorted(EXTENSIONS), default="json", help="storage backend")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the results")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    args = parser.parse_args(argv)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "backend": args.backend,
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            timings = run_size(size, min(args.operations, size), directory, args.backend)
+            report["results"][str(size)] = timings
+            print(f"{size} items: " + ", ".join(f"{name}={seconds:.6f}s" for name, seconds in timings.items()))
+
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=4)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            regressions = compare(json.load(file), report)
+        for message in regressions:
+            print("REGRESSION: " + message)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
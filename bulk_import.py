@@ -0,0 +1,120 @@
+
+import csv # For reading CSV count sheets
+import os # For checking the file extension
+
+from stream_loader import iter_json_object, clean_quantity # Streams a JSON object one entry at a time
+
+# Bulk import of stock counts for the stocktaking app
+# After a physical count there are thousands of lines to enter. Instead of two dialogs per item, a
+# CSV file (item,quantity per line, header optional) or a JSON file ({"item": quantity, ...}) is
+# streamed, every row is checked against the same rules as add_stock, and the whole file is applied
+# in one go. If any row is invalid, nothing is applied, so a half-imported count never happens.
+
+# How many row errors to keep for the report
+MAX_ERRORS = 50
+
+
+# Define the ImportResult class that describes what an import did (or why it didn't)
+class ImportResult:
+    # Row counts, the per-item quantities to add and any row errors.
+
+    # Initialize the ImportResult with empty counts
+    def __init__(self):
+        # Number of rows read from the file
+        self.rows = 0
+        # Dictionary of item name -> total quantity to add (rows for the same item are combined)
+        self.quantities = {}
+        # Number of invalid rows and a list of (row number, message) for the first few
+        self.error_count = 0
+        self.errors = []
+        # True once the quantities were added to the inventory
+        self.applied = False
+
+    # Method to note an invalid row
+    def add_error(self, row, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((row, message))
+
+    # Method to return the total quantity being imported
+    def total(self):
+        return sum(self.quantities.values())
+
+    # Method to make a short message for the user
+    def summary(self):
+        if self.applied:
+            return f"Imported {self.total()} units of {len(self.quantities)} items from {self.rows} rows."
+        lines = [f"Nothing was imported: {self.error_count} of {self.rows} rows have errors."]
+        for row, message in self.errors[:10]:
+            # Row 0 is used for problems with the file as a whole (such as capacity)
+            lines.append(f"Row {row}: {message}" if row else message)
+        return "\n".join(lines)
+
+
+# Function to yield (row number, name, raw quantity) from a CSV file
+def iter_csv_rows(path):
+    with open(path, "r", newline="") as file:
+        for row_number, row in enumerate(csv.reader(file), start=1):
+            # Skip blank lines
+            if not row or not any(cell.strip() for cell in row):
+                continue
+            # Skip a header line such as "item,quantity"
+            if row_number == 1 and len(row) >= 2 and clean_quantity(row[1]) is None:
+                continue
+            if len(row) < 2:
+                yield row_number, row[0], None
+            else:
+                yield row_number, row[0], row[1]
+
+
+# Function to yield (row number, name, raw quantity) from a JSON object file
+def iter_json_rows(path):
+    with open(path, "r") as file:
+        for row_number, (name, value) in enumerate(iter_json_object(file), start=1):
+            yield row_number, name, value
+
+
+# Function to pick the row reader from the file extension
+def iter_rows(path):
+    if os.path.splitext(path)[1].lower() == ".json":
+        return iter_json_rows(path)
+    return iter_csv_rows(path)
+
+
+# Function to check every row of a file without changing anything; returns an ImportResult
+def validate_file(path, inventory):
+    result = ImportResult()
+    for row_number, name, value in iter_rows(path):
+        result.rows += 1
+        # Same rules as add_stock: the name can't be empty ...
+        item = inventory.normalise(name) if name is not None else ""
+        if not item:
+            result.add_error(row_number, "Item name cannot be empty.")
+            continue
+        # ... and the quantity must be a positive whole number
+        quantity = clean_quantity(value)
+        if quantity is None or quantity <= 0:
+            result.add_error(row_number, f"Quantity for '{item}' must be a positive integer (got {value!r}).")
+            continue
+        result.quantities[item] = result.quantities.get(item, 0) + quantity
+    # The whole import must fit in the remaining capacity, the same check add_stock does per item
+    if not result.error_count and not inventory.can_add(result.total()):
+        result.add_error(0, f"Adding {result.total()} would exceed capacity ({inventory.capacity}). Max add: {inventory.remaining()}.")
+    return result
+
+
+# Function to import a CSV or JSON count file into an inventory in one transaction; check_room, if given,
+# is called with {item: quantity} and returns why the import doesn't fit (e.g. a category's capacity) or None
+def import_file(path, inventory, check_room=None):
+    # Nothing is added unless every row is valid; the caller saves and refreshes once afterwards
+    result = validate_file(path, inventory)
+    if not result.error_count and check_room is not None:
+        problem = check_room(result.quantities)
+        if problem:
+            result.add_error(0, problem)
+    if result.error_count:
+        return result
+    for item, quantity in result.quantities.items():
+        inventory.add(item, quantity)
+    result.applied = True
+    return result
@@ -0,0 +1,321 @@
+
+import bisect # For keeping the order column sorted as items come and go
+import operator # For comparing a column with a level without a Python loop
+from array import array # For the id, offset and quantity columns
+from itertools import accumulate, chain, compress, islice, repeat # For building and filtering the columns without Python loops
+
+from inventory import Inventory # For the shared name normalisation
+
+# Column-based inventory for very large catalogues
+# Inventory keeps a dict of name -> quantity, which costs about 100 bytes per item in Python objects
+# (the name string, the dict entry and often a boxed int). ColumnInventory keeps the same data in a
+# few flat columns instead:
+#   _names       every name as UTF-8 followed by a NUL byte, in the order the items were added
+#   _starts      array of where each item's name starts in _names (the item's id is its position)
+#   _quantities  array('q') of quantities, by id
+#   _alive       one byte per id, 0 once the item was deleted
+#   _order       array of the live ids in name order, kept sorted as items are added and deleted
+#   _slots       open-addressing hash table of ids, for looking a name up
+# which is roughly a third of the memory. keys(), values() and the total are worked out with one
+# C-level pass over the columns (decode + split, compress, sum) instead of one Python step per item,
+# and the sorted list and exports read the names and quantities through the order column the same way.
+# A bulk load builds the order column and the hash table straight away, so the first lookup or sorted
+# view doesn't stall.
+# The methods match Inventory, so the engine, the storage and the GUI can use either.
+
+# Marker for a free hash table slot
+EMPTY = -1
+# Smallest hash table size (always a power of two)
+MIN_SLOTS = 1024
+
+
+# Define the ColumnInventory class that stores the stock in flat columns
+class ColumnInventory:
+    # Drop-in replacement for Inventory using arrays instead of a dict of Python objects.
+
+    # Method to turn a user-entered item name into the key used in the store
+    normalise = staticmethod(Inventory.normalise)
+
+    # Initialize the ColumnInventory with optional starting items and a capacity limit
+    def __init__(self, items=None, capacity=1000):
+        # Maximum total stock allowed (same meaning as StockTakingApp.total_capacity)
+        self.capacity = capacity
+        self._clear()
+        if items:
+            for name, quantity in items.items():
+                self.set(name, quantity)
+
+    # Method to empty every column
+    def _clear(self):
+        self._names = bytearray()
+        self._starts = array("Q")
+        self._quantities = array("q")
+        self._alive = bytearray()
+        self._order = array("i")
+        # Hash table of ids (built by the first lookup when items are added one at a time)
+        self._slots = None
+        # Number of items in the stock, and the running total of their quantities
+        self._count = 0
+        self._total = 0
+
+    # Method to return the name of an id
+    def _name(self, item_id):
+        start = self._starts[item_id]
+        return self._names[start:self._names.index(0, start)].decode()
+
+    # Method to return every name by id (deleted ids included), decoded in one go
+    def _all_names(self):
+        if not self._names:
+            return []
+        return self._names[:-1].decode().split("\0")
+
+    # Method to return the hash table, building it if needed
+    def _table(self):
+        if self._slots is None:
+            size = MIN_SLOTS
+            while size < self._count * 2:
+                size *= 2
+            self._fill_table(size)
+        return self._slots
+
+    # Method to build a hash table of the given size from the live ids
+    def _fill_table(self, size):
+        slots = array("i", [EMPTY]) * size
+        mask = size - 1
+        names = self._all_names()
+        ids = compress(range(len(names)), self._alive)
+        # Every home slot is worked out in one C-level pass; only the probing steps through Python
+        for item_id, slot in zip(ids, map(mask.__and__, map(hash, compress(names, self._alive)))):
+            while slots[slot] != EMPTY:
+                slot = (slot + 1) & mask
+            slots[slot] = item_id
+        self._slots = slots
+
+    # Method to find a (normalised) name; returns (hash table slot, id or EMPTY if it isn't there)
+    def _find(self, key):
+        slots = self._table()
+        mask = len(slots) - 1
+        # Compare with the NUL after the name too, so "rice" doesn't match "rice flour"
+        wanted = key.encode() + b"\0"
+        slot = hash(key) & mask
+        while True:
+            item_id = slots[slot]
+            if item_id == EMPTY:
+                return slot, EMPTY
+            start = self._starts[item_id]
+            if self._names[start:start + len(wanted)] == wanted:
+                return slot, item_id
+            slot = (slot + 1) & mask
+
+    # Method to add a new item at the free slot _find returned; returns its id
+    def _insert(self, slot, key, quantity):
+        if "\0" in key:
+            raise ValueError("Item names can't contain NUL characters.")
+        item_id = len(self._quantities)
+        self._starts.append(len(self._names))
+        self._names += key.encode() + b"\0"
+        self._quantities.append(quantity)
+        self._alive.append(1)
+        self._slots[slot] = item_id
+        bisect.insort(self._order, item_id, key=self._name)
+        self._count += 1
+        if self._count * 3 > len(self._slots) * 2:
+            # Keep the table at most two thirds full so lookups stay short
+            self._fill_table(len(self._slots) * 2)
+        return item_id
+
+    # Method to delete the item in a hash table slot (the total is left to the caller)
+    def _delete(self, slot, item_id):
+        # Its name stays in _names, so its place in the order column can still be found
+        del self._order[bisect.bisect_left(self._order, self._name(item_id), key=self._name)]
+        self._quantities[item_id] = 0
+        self._alive[item_id] = 0
+        self._count -= 1
+        # Shift later entries of the same probe run back so lookups never stop at the hole
+        slots = self._slots
+        mask = len(slots) - 1
+        hole = slot
+        while True:
+            slot = (slot + 1) & mask
+            moved = slots[slot]
+            if moved == EMPTY:
+                break
+            home = hash(self._name(moved)) & mask
+            # Leave it if its home slot is cyclically between the hole and where it is now
+            if (hole < slot and hole < home <= slot) or (hole > slot and (home > hole or home <= slot)):
+                continue
+            slots[hole] = moved
+            hole = slot
+        slots[hole] = EMPTY
+        if len(self._alive) > 1024 and self._count * 2 < len(self._alive):
+            # Mostly deleted ids; rewrite the columns without them
+            names, quantities = self.keys(), self.values()
+            self._clear()
+            self.set_many(names, quantities)
+
+    # Method to return the total quantity of all stock items in O(1)
+    def total(self):
+        return self._total
+
+    # Method to return how much more stock can be added before hitting the capacity
+    def remaining(self):
+        return self.capacity - self._total
+
+    # Method to check in O(1) whether a quantity can be added without exceeding the capacity
+    def can_add(self, quantity):
+        return self._total + int(quantity) <= self.capacity
+
+    # Method to get the quantity of an item (0 or default if it doesn't exist)
+    def get(self, name, default=0):
+        _, item_id = self._find(self.normalise(name))
+        return default if item_id == EMPTY else self._quantities[item_id]
+
+    # Method to set the quantity of an item directly (used when loading and replaying saved data)
+    def set(self, name, quantity):
+        key = self.normalise(name)
+        quantity = int(quantity)
+        slot, item_id = self._find(key)
+        if item_id == EMPTY:
+            self._insert(slot, key, quantity)
+            self._total += quantity
+        else:
+            self._total += quantity - self._quantities[item_id]
+            self._quantities[item_id] = quantity
+        return quantity
+
+    # Method to set many items at once from distinct names that are already normalised (used when
+    # loading a binary snapshot); an empty inventory takes them in one step
+    def set_many(self, names, quantities):
+        if self._count or len(self._quantities):
+            for name, quantity in zip(names, quantities):
+                self.set(name, quantity)
+            return
+        names = list(names)
+        if not names:
+            return
+        self._names = bytearray("\0".join(names).encode() + b"\0")
+        if self._names.count(0) != len(names):
+            self._clear()
+            raise ValueError("Item names can't contain NUL characters.")
+        if len(self._names) == sum(map(len, names)) + len(names):
+            # Plain ASCII names: characters and bytes are the same length
+            lengths = map(len, names)
+        else:
+            lengths = [len(name.encode()) for name in names]
+        # Each name starts one byte (the NUL) after the end of the one before it
+        self._starts = array("Q", islice(accumulate(chain((0,), map((1).__add__, lengths))), len(names)))
+        self._quantities = array("q", quantities)
+        self._alive = bytearray(b"\1") * len(names)
+        # Snapshots are written in name order, so usually the order column is just every id in turn
+        if all(map(str.__lt__, names, islice(names, 1, None))):
+            self._order = array("i", range(len(names)))
+        else:
+            self._order = array("i", sorted(range(len(names)), key=names.__getitem__))
+        self._count = len(names)
+        self._total = sum(self._quantities)
+        self._slots = None
+        self._table()
+
+    # Method to delete an item completely, returning the quantity it had (0 if it didn't exist)
+    def discard(self, name):
+        slot, item_id = self._find(self.normalise(name))
+        if item_id == EMPTY:
+            return 0
+        quantity = self._quantities[item_id]
+        self._total -= quantity
+        self._delete(slot, item_id)
+        return quantity
+
+    # Method to add a quantity to an item and return the new quantity of that item
+    def add(self, name, quantity):
+        key = self.normalise(name)
+        quantity = int(quantity)
+        slot, item_id = self._find(key)
+        self._total += quantity
+        if item_id == EMPTY:
+            self._insert(slot, key, quantity)
+            return quantity
+        self._quantities[item_id] += quantity
+        return self._quantities[item_id]
+
+    # Method to remove a quantity from an item and return what is left (0 means the item was deleted)
+    def remove(self, name, quantity):
+        key = self.normalise(name)
+        slot, item_id = self._find(key)
+        if item_id == EMPTY:
+            raise KeyError(key)
+        current = self._quantities[item_id]
+        # Never remove more than there is
+        quantity = min(int(quantity), current)
+        remaining = current - quantity
+        self._total -= quantity
+        if remaining <= 0:
+            # Remove the item entirely
+            self._delete(slot, item_id)
+            return 0
+        self._quantities[item_id] = remaining
+        return remaining
+
+    # Method to return [(item, quantity)] for the items with at most this quantity; the ids are picked
+    # with one C-level pass over the quantity column, deleted ones (quantity 0) are dropped from those,
+    # and only their names are decoded
+    def at_or_below(self, level):
+        low = list(compress(range(len(self._quantities)), map(operator.le, self._quantities, repeat(level))))
+        low = list(compress(low, map(self._alive.__getitem__, low)))
+        return list(zip(map(self._name, low), map(self._quantities.__getitem__, low)))
+
+    # Method to recount the total from scratch and check it matches the running total (used by tests)
+    def check_consistency(self):
+        recount = sum(self._quantities)
+        if recount != self._total:
+            raise AssertionError(f"Running total {self._total} does not match recount {recount}")
+        return True
+
+    # Method to return a plain dictionary copy
+    def to_dict(self):
+        return dict(zip(self.keys(), self.values()))
+
+    # Dictionary-style helpers so existing code can keep using self.stock like a dict
+    def __contains__(self, name):
+        return self._find(self.normalise(name))[1] != EMPTY
+
+    def __getitem__(self, name):
+        key = self.normalise(name)
+        item_id = self._find(key)[1]
+        if item_id == EMPTY:
+            raise KeyError(key)
+        return self._quantities[item_id]
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __bool__(self):
+        return self._count > 0
+
+    # Method to return (name, quantity) pairs in the order the items were added
+    def items(self):
+        return zip(self.keys(), self.values())
+
+    # Method to return a list of the item names in name order
+    def sorted_keys(self):
+        return list(map(self._all_names().__getitem__, self._order))
+
+    # Method to return a list of (name, quantity) pairs in name order
+    def sorted_items(self):
+        return list(zip(self.sorted_keys(), map(self._quantities.__getitem__, self._order)))
+
+    # Method to return a list of the item names
+    def keys(self):
+        names = self._all_names()
+        if self._count == len(names):
+            return names
+        return list(compress(names, self._alive))
+
+    # Method to return an array of the quantities, in the same order as keys()
+    def values(self):
+        if self._count == len(self._quantities):
+            return self._quantities[:]
+        return array("q", compress(self._quantities, self._alive))
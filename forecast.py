@@ -0,0 +1,178 @@
+
+import json # For the cached forecast
+import math # For rounding suggested quantities up
+import multiprocessing # For starting the forecast processes fresh
+import os # For the CPU count and atomic replace of the cache
+import time # For the time the forecast was made
+from concurrent.futures import ProcessPoolExecutor # For fitting big catalogues on every CPU
+from datetime import date # For the last day of the history window
+
+from history import MovementHistory # Daily in/out totals per item
+
+# Demand forecasting and reorder suggestions for the stocktaking app
+# Each item's demand rate (units out per day) is fitted from the daily "out" totals the movement history
+# already keeps, over the last HISTORY_DAYS days, with one of two methods:
+#   average    moving average: units out over the window divided by its days
+#   smoothing  exponential smoothing: recent days count more (each day back weighs 1 - ALPHA less)
+# Only the days an item moved are looked at: a run of days with nothing out just shrinks the smoothed
+# level by (1 - ALPHA) per day, so it is applied in one step. The fit is a batch job over the whole
+# catalogue (nightly from stock_cli.py forecast, or in a background process from the window); big
+# catalogues are split into chunks fitted by a pool of processes. The rates are cached in
+# stock_data.json.forecast.json, so showing suggestions only combines them with the current stock.
+# A suggestion tops an item up to COVER_DAYS days of demand; when the suggestions together don't fit in
+# the remaining capacity (or a category's capacity), the items that will run out soonest come first.
+
+# Methods that can be chosen
+FORECAST_METHODS = ("average", "smoothing")
+# Days of history the rates are fitted over
+HISTORY_DAYS = 56
+# Weight of the most recent day in exponential smoothing
+ALPHA = 0.2
+# Days of demand a suggestion tops an item up to (delivery time plus time until the next order)
+COVER_DAYS = 14
+# Number of items from which the fit is split across a process pool
+POOL_THRESHOLD = 50000
+
+
+# Function to fit the demand rate of each item in a chunk [(item, [(day ordinal, units out)])];
+# returns [(item, units per day)] for the items with any demand
+def fit_rates(chunk, first_day, last_day, method="smoothing", alpha=ALPHA):
+    days = last_day - first_day + 1
+    keep = 1.0 - alpha
+    rates = []
+    for item, movements in chunk:
+        mean = sum(units for _, units in movements) / days
+        if method == "average":
+            rate = mean
+        else:
+            # Start from the window's mean, then step through the days with movements only
+            level = mean
+            previous = first_day - 1
+            for day, units in sorted(movements):
+                level = alpha * units + keep ** (day - previous) * level
+                previous = day
+            rate = level * keep ** (last_day - previous)
+        if rate > 0:
+            rates.append((item, rate))
+    return rates
+
+
+# Function to fit every item's demand rate from a movement history; returns {item: units per day}.
+# Big catalogues are fitted by a pool of processes when there is more than one CPU
+def forecast_rates(history, method="smoothing", days=HISTORY_DAYS, alpha=ALPHA, workers=None):
+    if method not in FORECAST_METHODS:
+        raise ValueError(f"Forecast method must be one of: {', '.join(FORECAST_METHODS)}")
+    today = date.today()
+    last_day = today.toordinal()
+    first_day = last_day - days + 1
+    series = history.daily_out(date.fromordinal(first_day), today)
+    workers = workers or os.cpu_count() or 1
+    if len(series) < POOL_THRESHOLD or workers < 2:
+        return dict(fit_rates(series, first_day, last_day, method, alpha))
+    size = math.ceil(len(series) / workers)
+    chunks = [series[start:start + size] for start in range(0, len(series), size)]
+    rates = {}
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(fit_rates, chunk, first_day, last_day, method, alpha) for chunk in chunks]
+        for future in futures:
+            rates.update(future.result())
+    return rates
+
+
+# Function to write a forecast to the cache file without ever leaving a half-written one
+def save_forecast(path, rates, method, days):
+    forecast = {"made": time.strftime("%Y-%m-%d %H:%M"), "method": method, "days": days, "rates": rates}
+    with open(path + ".tmp", "w") as file:
+        json.dump(forecast, file, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+    return forecast
+
+
+# Function to load the cached forecast (None if there isn't one)
+def load_forecast(path):
+    try:
+        with open(path, "r") as file:
+            forecast = json.load(file)
+    except FileNotFoundError:
+        return None
+    return forecast if isinstance(forecast, dict) and isinstance(forecast.get("rates"), dict) else None
+
+
+# Background job: fit a stock file's movement history and cache the forecast (run in its own process
+# so the window keeps responding); returns the number of items with demand
+def forecast_job(stock_file, forecast_file, method="smoothing", days=HISTORY_DAYS):
+    rates = forecast_rates(MovementHistory(stock_file + ".history"), method, days)
+    save_forecast(forecast_file, rates, method, days)
+    return len(rates)
+
+
+# Define the ForecastRunner class that works out forecasts in a background process for the window
+class ForecastRunner:
+    # One process, started on first use; poll() is called from the main loop.
+
+    # Initialize the ForecastRunner with no process started
+    def __init__(self):
+        self._pool = None
+        # Future of the forecast being worked out, if any
+        self.future = None
+
+    # Method to start working out a stock file's forecast; False if one is already being worked out
+    def start(self, stock_file, forecast_file, method="smoothing", days=HISTORY_DAYS):
+        if self.future is not None:
+            return False
+        if self._pool is None:
+            # A fresh process rather than a fork of the GUI process (with its Tk and worker threads)
+            self._pool = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"))
+        self.future = self._pool.submit(forecast_job, stock_file, forecast_file, method, days)
+        return True
+
+    # Method to return (items with demand, error) once the forecast is done, else None
+    def poll(self):
+        if self.future is None or not self.future.done():
+            return None
+        future, self.future = self.future, None
+        if future.exception() is not None:
+            return None, future.exception()
+        return future.result(), None
+
+    # Method to stop the process (a forecast being worked out is finished and cached by it)
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+# Function to suggest reorder quantities from demand rates and the current stock, within the remaining
+# capacity (and, with alerts, each category's capacity). Returns [(item, quantity, units per day, days
+# of stock left, suggested quantity)], the items that run out soonest first
+def suggest_orders(rates, inventory, room, alerts=None, cover_days=COVER_DAYS, limit=None):
+    needs = []
+    for item, rate in rates.items():
+        quantity = inventory.get(item)
+        need = math.ceil(rate * cover_days) - quantity
+        if need > 0:
+            needs.append((quantity / rate, item, quantity, rate, need))
+    needs.sort()
+    suggestions = []
+    # Room left in each category once the earlier suggestions are in
+    category_room = {}
+    room = max(0, room)
+    for days_left, item, quantity, rate, need in needs:
+        if not room:
+            break
+        order = min(need, room)
+        if alerts is not None:
+            category = alerts.category_of(item)
+            if category not in category_room:
+                # None when the item's category (if any) has no capacity
+                category_room[category] = alerts.category_room(item)
+            if category_room[category] is not None:
+                order = min(order, category_room[category])
+                if order <= 0:
+                    continue
+                category_room[category] -= order
+        room -= order
+        suggestions.append((item, quantity, rate, days_left, order))
+        if limit is not None and len(suggestions) >= limit:
+            break
+    return suggestions
@@ -0,0 +1,257 @@
+
+import json # For the item name list and the aggregates checkpoint
+import os # For file sizes and atomic replace
+import struct # For the fixed-size movement records
+from datetime import date, datetime # For the daily and weekly buckets
+
+from locking import FileLock # Same advisory lock the journal uses, so terminals can share the files
+
+# Movement history for the stocktaking app
+# Every add, remove and import is appended to stock_data.json.history as one 24-byte record
+# (time, item number, change, previous record of the same item). Item names are stored once each in
+# stock_data.json.history.names and referred to by number. Alongside the log, daily and weekly
+# "in"/"out" totals per item are kept up to date as movements are recorded, so a report such as "how
+# much rice went out last week" adds up a handful of buckets instead of reading the whole log.
+# Each record points back to the previous record of the same item, so an item's recent movements
+# are found by following that chain rather than scanning.
+# The totals are checkpointed to stock_data.json.history.agg; on startup only the records written
+# after the checkpoint are read.
+
+# Record layout: seconds since 1970, item number, change in quantity, index of the item's previous record
+RECORD = struct.Struct("<qIqI")
+# "No previous record" marker
+NO_RECORD = 0xFFFFFFFF
+# Daily buckets older than this are dropped at each checkpoint (weekly buckets are kept)
+DAILY_DAYS = 400
+
+
+# Function to return the Monday of the week a day is in (as a date ordinal)
+def week_of(day):
+    return day - date.fromordinal(day).weekday()
+
+
+# Define the MovementHistory class that stores every stock movement and keeps the bucket totals
+class MovementHistory:
+    # Append-only movement log with per-item daily/weekly totals and a per-item record chain.
+
+    # Initialize the MovementHistory with the log path and load it
+    def __init__(self, path):
+        self.path = path
+        self.names_file = path + ".names"
+        self.checkpoint_file = path + ".agg"
+        # Guards the files against other terminals and the totals against the persistence thread
+        self.lock = FileLock(path + ".lock")
+        with self.lock:
+            self._reset()
+            self._load_checkpoint()
+            self._catch_up()
+
+    # Method to forget everything read so far
+    def _reset(self):
+        # Item number -> name, and name -> item number
+        self.names = []
+        self.ids = {}
+        # Bytes of the names file read so far
+        self._names_offset = 0
+        # Number of records read so far
+        self.count = 0
+        # Item number -> index of its latest record
+        self.last = {}
+        # Item number -> {day ordinal: [in, out]} and {Monday ordinal: [in, out]}
+        self.daily = {}
+        self.weekly = {}
+
+    # Method to start from the last checkpoint, if it still matches the log
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_file, "r") as file:
+                saved = json.load(file)
+            if saved["records"] * RECORD.size > self._log_size():
+                # The log is shorter than the checkpoint says (restored from a backup?); read it all
+                return
+            self._names_offset = saved["names_offset"]
+            self.names = saved["names"]
+            self.count = saved["records"]
+            self.last = {int(key): index for key, index in saved["last"].items()}
+            self.daily = self._buckets_from_json(saved["daily"])
+            self.weekly = self._buckets_from_json(saved["weekly"])
+            self.ids = {name: number for number, name in enumerate(self.names) if name is not None}
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            # No checkpoint (or a damaged one): build the totals from the log
+            self._reset()
+
+    # Method to turn checkpointed buckets (string keys) back into the in-memory form
+    @staticmethod
+    def _buckets_from_json(saved):
+        return {int(item): {int(day): pair for day, pair in days.items()} for item, days in saved.items()}
+
+    # Method to return the size of the log in bytes (0 if it doesn't exist yet)
+    def _log_size(self):
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    # Method to read the names and records other terminals (or earlier runs) added (lock must be held)
+    def _catch_up(self):
+        try:
+            names_size = os.path.getsize(self.names_file)
+        except FileNotFoundError:
+            names_size = 0
+        if names_size > self._names_offset:
+            with open(self.names_file, "rb") as file:
+                file.seek(self._names_offset)
+                data = file.read()
+            # Only whole lines; a crash mid-write leaves a partial one that becomes a dud number
+            end = data.rfind(b"\n") + 1
+            for raw in data[:end].splitlines():
+                try:
+                    name = json.loads(raw)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    name = None
+                if name is not None:
+                    self.ids[name] = len(self.names)
+                self.names.append(name)
+            self._names_offset += end
+        total = self._log_size() // RECORD.size
+        if total > self.count:
+            with open(self.path, "rb") as file:
+                file.seek(self.count * RECORD.size)
+                data = file.read((total - self.count) * RECORD.size)
+            for when, item, delta, _ in RECORD.iter_unpack(data):
+                self._add_to_buckets(item, when, delta)
+                self.last[item] = self.count
+                self.count += 1
+
+    # Method to add one movement to the item's daily and weekly totals
+    def _add_to_buckets(self, item, when, delta):
+        day = datetime.fromtimestamp(when).toordinal()
+        # Index 0 is stock in, index 1 is stock out
+        side = 0 if delta > 0 else 1
+        self.daily.setdefault(item, {}).setdefault(day, [0, 0])[side] += abs(delta)
+        self.weekly.setdefault(item, {}).setdefault(week_of(day), [0, 0])[side] += abs(delta)
+
+    # Method to return the number of an item, adding the name to the names file if it is new (lock held)
+    def _item_number(self, name, names_file):
+        number = self.ids.get(name)
+        if number is None:
+            number = len(self.names)
+            line = (json.dumps(name) + "\n").encode()
+            names_file.write(line)
+            self._names_offset += len(line)
+            self.names.append(name)
+            self.ids[name] = number
+        return number
+
+    # Method to append movements (item, change) that happened at the given time (seconds since 1970)
+    def record_many(self, changes, when):
+        when = int(when)
+        with self.lock:
+            # Pick up other terminals' movements first so numbers and record chains stay right
+            self._catch_up()
+            records = []
+            with open(self.names_file, "ab") as names_file:
+                if names_file.tell() > self._names_offset:
+                    # A partial name left by a crash; finish its line so our names start on their own
+                    names_file.write(b"\n")
+                    names_file.flush()
+                    self._catch_up()
+                for name, delta in changes:
+                    if not delta:
+                        continue
+                    item = self._item_number(name, names_file)
+                    records.append(RECORD.pack(when, item, int(delta), self.last.get(item, NO_RECORD)))
+                    self._add_to_buckets(item, when, delta)
+                    self.last[item] = self.count
+                    self.count += 1
+            with open(self.path, "ab") as file:
+                # Drop a partial record left by a crash so every record stays at index * RECORD.size
+                file.truncate((self.count - len(records)) * RECORD.size)
+                file.write(b"".join(records))
+
+    # Method to write the totals to the checkpoint file so the next start only reads newer records
+    def checkpoint(self):
+        with self.lock:
+            self._catch_up()
+            # Rolling window: old days are still in the weekly totals
+            oldest = date.today().toordinal() - DAILY_DAYS
+            for days in self.daily.values():
+                for day in [day for day in days if day < oldest]:
+                    del days[day]
+            saved = {
+                "records": self.count,
+                "names_offset": self._names_offset,
+                "names": self.names,
+                "last": self.last,
+                "daily": self.daily,
+                "weekly": self.weekly,
+            }
+            with open(self.checkpoint_file + ".tmp", "w") as file:
+                json.dump(saved, file, separators=(",", ":"))
+            os.replace(self.checkpoint_file + ".tmp", self.checkpoint_file)
+
+    # Method to return {item: (in, out)} for every item that moved between two dates (inclusive)
+    def totals(self, start, end):
+        start, end = start.toordinal(), end.toordinal()
+        result = {}
+        with self.lock:
+            self._catch_up()
+            for item, days in self.daily.items():
+                # Add up the day buckets in the range (at most one per day, however many movements)
+                moved_in = moved_out = 0
+                for day in range(start, end + 1):
+                    pair = days.get(day)
+                    if pair:
+                        moved_in += pair[0]
+                        moved_out += pair[1]
+                if moved_in or moved_out:
+                    result[self.names[item]] = (moved_in, moved_out)
+        return result
+
+    # Method to return [(item, [(day ordinal, out)])] for every item that had stock go out between two
+    # dates (inclusive), for fitting demand
+    def daily_out(self, start, end):
+        start, end = start.toordinal(), end.toordinal()
+        result = []
+        with self.lock:
+            self._catch_up()
+            for item, days in self.daily.items():
+                moved_out = [(day, pair[1]) for day, pair in days.items() if start <= day <= end and pair[1]]
+                if moved_out and self.names[item] is not None:
+                    result.append((self.names[item], moved_out))
+        return result
+
+    # Method to return [(date, in, out)] for an item's last few days, oldest first
+    def item_days(self, name, days=14):
+        return self._item_buckets(name, self.daily, date.today().toordinal(), days, 1)
+
+    # Method to return [(Monday's date, in, out)] for an item's last few weeks, oldest first
+    def item_weeks(self, name, weeks=8):
+        return self._item_buckets(name, self.weekly, week_of(date.today().toordinal()), weeks, 7)
+
+    # Method to read a run of an item's buckets ending at the given day ordinal
+    def _item_buckets(self, name, buckets, last, count, step):
+        with self.lock:
+            self._catch_up()
+            item_buckets = buckets.get(self.ids.get(name), {})
+            rows = []
+            for day in range(last - (count - 1) * step, last + 1, step):
+                moved_in, moved_out = item_buckets.get(day, (0, 0))
+                rows.append((date.fromordinal(day), moved_in, moved_out))
+        return rows
+
+    # Method to return an item's latest movements [(datetime, change)], newest first
+    def recent(self, name, limit=20):
+        movements = []
+        with self.lock:
+            self._catch_up()
+            index = self.last.get(self.ids.get(name), NO_RECORD)
+            if index == NO_RECORD:
+                return movements
+            with open(self.path, "rb") as file:
+                # Follow the item's chain backwards: one small read per movement, no scan
+                while index != NO_RECORD and len(movements) < limit:
+                    file.seek(index * RECORD.size)
+                    when, _, delta, index = RECORD.unpack(file.read(RECORD.size))
+                    movements.append((datetime.fromtimestamp(when), delta))
+        return movements
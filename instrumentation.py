@@ -0,0 +1,177 @@
+
+import bisect # For finding the histogram bucket of a time
+import functools # For keeping the name of wrapped methods
+import json # For dumping the timings to a file
+import os # For atomic replace of the dump file
+import threading # For recording from the persistence worker thread as well as the main thread
+import time # For the timer and the time stamps in the dump
+
+from stock_engine import StockEngine # Engine operations that can be timed
+from storage import JsonStorage, BinaryStorage, SqliteStorage # Storage jobs that can be timed
+
+# Opt-in timing for the stocktaking app
+# When users say the app feels slow, this shows where the time goes: how often each GUI callback,
+# engine operation and storage job runs and how long it takes, plus how late the Tk event loop is
+# in running a timer (a late timer means the loop was busy and the window couldn't respond).
+# Nothing is timed unless profiling is turned on (stock_v4.py --profile / stock_cli.py --profile):
+# instrument() then replaces the chosen methods on their classes with timed versions, so when it is
+# off the methods are the original ones and cost nothing extra. Times go into histograms with fixed
+# buckets, so recording is O(1) and memory doesn't grow with the number of calls.
+
+# Upper bounds of the histogram buckets in milliseconds (the last bucket holds everything slower)
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 10000)
+# Engine methods timed when profiling is on
+ENGINE_METHODS = ("load", "add", "remove", "add_many", "apply_changes", "poll_changes", "import_file", "export_file")
+# Storage methods timed when profiling is on (these run on the persistence worker for file backends)
+STORAGE_METHODS = ("load", "record_many", "save", "poll")
+# How often the event loop timer is set (ms)
+LOOP_INTERVAL_MS = 50
+
+
+# Define the Histogram class for the times of one operation
+class Histogram:
+    # Call count, total, maximum and a count per bucket.
+
+    # Initialize the Histogram with empty buckets
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    # Method to add one time in milliseconds
+    def add(self, ms):
+        self.buckets[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    # Method to return an upper bound for a percentile (e.g. 0.95), from the bucket it falls in
+    def percentile(self, fraction):
+        wanted = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= wanted:
+                return min(BUCKETS_MS[index], self.max_ms) if index < len(BUCKETS_MS) else self.max_ms
+        return 0.0
+
+    # Method to return the histogram as a plain dictionary (for the dump file)
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "buckets": self.buckets,
+        }
+
+
+# Define the Profiler class that collects the timings
+class Profiler:
+    # Name -> Histogram, filled by the timed wrappers that instrument() puts in place.
+
+    # Initialize the Profiler, turned off
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        # Wrappers run on the main thread and the persistence worker
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    # Method to add one time (in milliseconds) for an operation
+    def record(self, name, ms):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(ms)
+
+    # Method to forget every timing so far
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.started = time.time()
+
+    # Method to return a timed version of a function, recorded under the name
+    def timed(self, name, function):
+        clock = time.perf_counter
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, (clock() - start) * 1000)
+
+        wrapper.timed_name = name
+        return wrapper
+
+    # Method to replace methods of a class with timed versions (only when profiling is on; methods
+    # already timed are left alone)
+    def instrument(self, cls, names):
+        if not self.enabled:
+            return
+        for name in names:
+            method = getattr(cls, name)
+            if not hasattr(method, "timed_name"):
+                setattr(cls, name, self.timed(f"{cls.__name__}.{name}", method))
+
+    # Method to time the engine and every storage backend
+    def instrument_engine(self, engine_class=StockEngine):
+        self.instrument(engine_class, ENGINE_METHODS)
+        for storage_class in (JsonStorage, BinaryStorage, SqliteStorage):
+            self.instrument(storage_class, STORAGE_METHODS)
+
+    # Method to record how late a repeating Tk timer runs (how long the event loop was kept busy)
+    def watch_event_loop(self, root, interval_ms=LOOP_INTERVAL_MS):
+        if not self.enabled:
+            return
+        interval = interval_ms / 1000
+        due = [time.perf_counter() + interval]
+
+        # Timer callback: note how late it is and set the next one
+        def tick():
+            now = time.perf_counter()
+            self.record("Tk event loop delay", max(0.0, (now - due[0]) * 1000))
+            due[0] = now + interval
+            root.after(interval_ms, tick)
+
+        root.after(interval_ms, tick)
+
+    # Method to return a text table of the timings, most total time first
+    def summary_lines(self):
+        with self._lock:
+            rows = sorted(self.histograms.items(), key=lambda entry: -entry[1].total_ms)
+            lines = [f"Timings since {time.strftime('%H:%M:%S', time.localtime(self.started))} (ms)"]
+            lines.append(f"{'Operation':<36}{'Calls':>7}{'Mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'Max':>10}")
+            for name, histogram in rows:
+                lines.append(
+                    f"{name:<36}{histogram.count:>7}{histogram.total_ms / histogram.count:>10.2f}"
+                    f"{histogram.percentile(0.5):>10.2f}{histogram.percentile(0.95):>10.2f}"
+                    f"{histogram.percentile(0.99):>10.2f}{histogram.max_ms:>10.2f}"
+                )
+        if not rows:
+            lines.append("Nothing timed yet.")
+        return lines
+
+    # Method to write the timings to a JSON file without ever leaving a half-written one
+    def dump(self, path):
+        with self._lock:
+            data = {
+                "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+                "dumped": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "bucket_bounds_ms": list(BUCKETS_MS),
+                "timings": {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())},
+            }
+        with open(path + ".tmp", "w") as file:
+            json.dump(data, file, indent=4)
+        os.replace(path + ".tmp", path)
+
+
+# The profiler shared by the whole app (turned on by --profile)
+profiler = Profiler()
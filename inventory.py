@@ -0,0 +1,142 @@
+
+# Inventory model for the stocktaking app
+# Keeps the per-item quantities and a running total up to date as stock is added and removed,
+# so the app never has to re-sum the whole catalogue just to check the capacity or show the status label.
+
+# Define the Inventory class that holds all the stock quantities and the running total
+class Inventory:
+    # Dictionary-like store of item name -> quantity with an O(1) total.
+
+    # Initialize the Inventory with optional starting items and a capacity limit
+    def __init__(self, items=None, capacity=1000):
+        # Dictionary of item name -> quantity (names are stored lowercased and stripped)
+        self._items = {}
+        # Running total of all quantities, kept in step with every change
+        self._total = 0
+        # Maximum total stock allowed (same meaning as StockTakingApp.total_capacity)
+        self.capacity = capacity
+        # Load any starting items (e.g. from the JSON file)
+        if items:
+            for name, quantity in items.items():
+                self.set(name, quantity)
+
+    # Method to turn a user-entered item name into the key used in the store
+    @staticmethod
+    def normalise(name):
+        # Strip whitespace and lowercase so "Rice " and "rice" are the same item
+        return str(name).strip().lower()
+
+    # Method to return the total quantity of all stock items in O(1)
+    def total(self):
+        return self._total
+
+    # Method to return how much more stock can be added before hitting the capacity
+    def remaining(self):
+        return self.capacity - self._total
+
+    # Method to check in O(1) whether a quantity can be added without exceeding the capacity
+    def can_add(self, quantity):
+        return self._total + int(quantity) <= self.capacity
+
+    # Method to get the quantity of an item (0 or default if it doesn't exist)
+    def get(self, name, default=0):
+        return self._items.get(self.normalise(name), default)
+
+    # Method to set the quantity of an item directly (used when loading and replaying saved data)
+    def set(self, name, quantity):
+        key = self.normalise(name)
+        quantity = int(quantity)
+        # Take the old quantity off the total and add the new one
+        self._total += quantity - self._items.get(key, 0)
+        self._items[key] = quantity
+        return quantity
+
+    # Method to set many items at once from names that are already normalised (used when loading a
+    # binary snapshot); an empty inventory takes them in one step
+    def set_many(self, names, quantities):
+        if self._items:
+            for name, quantity in zip(names, quantities):
+                self.set(name, quantity)
+            return
+        self._items = dict(zip(names, quantities))
+        self._total = sum(self._items.values())
+
+    # Method to delete an item completely, returning the quantity it had (0 if it didn't exist)
+    def discard(self, name):
+        quantity = self._items.pop(self.normalise(name), 0)
+        self._total -= quantity
+        return quantity
+
+    # Method to add a quantity to an item and return the new quantity of that item
+    def add(self, name, quantity):
+        key = self.normalise(name)
+        quantity = int(quantity)
+        # Only the changed item and the total are touched
+        new_quantity = self._items.get(key, 0) + quantity
+        self._items[key] = new_quantity
+        self._total += quantity
+        return new_quantity
+
+    # Method to remove a quantity from an item and return what is left (0 means the item was deleted)
+    def remove(self, name, quantity):
+        key = self.normalise(name)
+        current = self._items[key]  # Raises KeyError if the item doesn't exist
+        # Never remove more than there is
+        quantity = min(int(quantity), current)
+        remaining = current - quantity
+        if remaining <= 0:
+            # Remove the item entirely
+            del self._items[key]
+            remaining = 0
+        else:
+            self._items[key] = remaining
+        self._total -= quantity
+        return remaining
+
+    # Method to return [(item, quantity)] for the items with at most this quantity
+    def at_or_below(self, level):
+        return [(item, quantity) for item, quantity in self._items.items() if quantity <= level]
+
+    # Method to recount the total from scratch and check it matches the running total (used by tests)
+    def check_consistency(self):
+        recount = sum(int(q) for q in self._items.values())
+        if recount != self._total:
+            raise AssertionError(f"Running total {self._total} does not match recount {recount}")
+        return True
+
+    # Method to return a plain dictionary copy (used when saving to JSON)
+    def to_dict(self):
+        return dict(self._items)
+
+    # Dictionary-style helpers so existing code can keep using self.stock like a dict
+    def __contains__(self, name):
+        return self.normalise(name) in self._items
+
+    def __getitem__(self, name):
+        return self._items[self.normalise(name)]
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __bool__(self):
+        return bool(self._items)
+
+    def items(self):
+        return self._items.items()
+
+    # Method to return a list of the item names in name order
+    def sorted_keys(self):
+        return sorted(self._items)
+
+    # Method to return a list of (name, quantity) pairs in name order
+    def sorted_items(self):
+        return sorted(self._items.items())
+
+    def keys(self):
+        return self._items.keys()
+
+    def values(self):
+        return self._items.values()
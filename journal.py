@@ -0,0 +1,345 @@
+
+import json # For the journal lines
+import os # For fsync, atomic replace and file paths
+import random # For a unique id per running app
+import socket # For the computer name in the writer id
+import time # For the fsync batching interval
+import zlib # For the snapshot checksum
+
+from locking import FileLock # Exclusive lock shared by every terminal using the same files
+from stream_loader import LoadReport # Counts of loaded and bad rows
+from snapshot import JsonSnapshot # Snapshot file format (JSON unless the storage picks another)
+
+# Write-ahead journal for the stocktaking app
+# Instead of rewriting the whole stock_data.json after every add or remove, each change is appended
+# as one small line to stock_data.json.journal. On startup the journal is replayed on top of the
+# snapshot, and every so often the two are compacted back into a fresh snapshot. The snapshot is read
+# and written by a snapshot format from snapshot.py (JSON, or the compact binary format).
+#
+# Several terminals can share the same files:
+#  * Every journal line is a change ("rice" +5, "dal" -2) with a version number and the id of the
+#    terminal that wrote it, so changes from different terminals add up instead of overwriting.
+#  * Appends and compactions happen under an exclusive lock (locking.FileLock).
+#  * Compaction builds the new snapshot from the files on disk (snapshot + every journal line), never
+#    from one terminal's memory, so it can't throw away another terminal's changes.
+#  * The first line of each journal is a header with a checksum of the snapshot it belongs to and a
+#    generation number. If a crash leaves a journal that was already folded into the snapshot, the
+#    checksum no longer matches and the journal is ignored, so no change is ever counted twice.
+#  * Other terminals' changes are picked up by poll(), which only stats the journal and reads the
+#    lines added since last time.
+
+# How many bytes from the end of the journal are read to find the last version number
+TAIL_BYTES = 4096
+
+
+# Function to work out the checksum of a file (None if it doesn't exist)
+def file_checksum(path):
+    if not os.path.exists(path):
+        return None
+    checksum = 0
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            checksum = zlib.crc32(chunk, checksum)
+    return checksum
+
+
+# Function to read the header line of a journal file (None if missing, {} for an old journal without one)
+def read_header(path):
+    try:
+        with open(path, "r") as file:
+            line = file.readline()
+    except FileNotFoundError:
+        return None
+    try:
+        entry = json.loads(line)
+    except json.JSONDecodeError:
+        return {}
+    return entry if isinstance(entry, dict) and "gen" in entry else {}
+
+
+# Function to apply one change to an inventory (the item is deleted when nothing is left)
+def apply_delta(inventory, item, delta):
+    quantity = inventory.get(item) + int(delta)
+    if quantity <= 0:
+        inventory.discard(item)
+    else:
+        inventory.set(item, quantity)
+
+
+# Define the StockJournal class that manages the snapshot file and its append-only journal
+class StockJournal:
+    # Append-only, lock-protected log of item changes with batched fsync and safe compaction.
+
+    # Initialize the StockJournal with the snapshot path, how often to fsync and compact, and the
+    # snapshot file format
+    def __init__(self, snapshot_file, sync_every=20, sync_interval=1.0, compact_after=1000, snapshot_format=JsonSnapshot):
+        # The snapshot (e.g. the same stock_data.json file the app always used)
+        self.snapshot_file = snapshot_file
+        self.snapshot_format = snapshot_format
+        # The journal lives next to the snapshot; the previous one is kept as .old after compaction
+        self.journal_file = snapshot_file + ".journal"
+        self.old_journal_file = self.journal_file + ".old"
+        # Lock shared by every terminal
+        self.lock = FileLock(snapshot_file + ".lock")
+        # Unique id written on each line so this app can skip its own changes when polling
+        self.writer_id = f"{socket.gethostname()}-{os.getpid()}-{random.getrandbits(32):08x}"
+        # fsync after this many appends ...
+        self.sync_every = sync_every
+        # ... or once this many seconds have passed since the last fsync
+        self.sync_interval = sync_interval
+        # Compact into a new snapshot once the journal has this many entries
+        self.compact_after = compact_after
+        # Appends written since the last fsync, and the time of the last fsync
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        # Entries in the current journal
+        self.entries = 0
+        # Highest version number seen or written (the version counter of the shared stock)
+        self.version = 0
+        # Journal size and version right after our last append (so we know if someone else appended)
+        self._append_state = None
+        # Reader state for poll(): generation and byte offset read so far, and the last stat seen
+        self.generation = 0
+        self._offset = 0
+        self._stat = None
+        # Snapshot stat and checksum, so the checksum is only worked out again after the snapshot changed
+        self._checksum_cache = (None, None)
+
+    # Method to load the snapshot and every journal that belongs to it into an inventory
+    def load(self, inventory, progress=None):
+        # Returns the LoadReport of the snapshot; raises IOError / json.JSONDecodeError
+        with self.lock:
+            report = LoadReport()
+            if os.path.exists(self.snapshot_file):
+                report = self.snapshot_format.load(self.snapshot_file, inventory, progress)
+            self.entries, self.generation, self._offset = self._replay_all(inventory)
+            self._stat = self._stat_journal()
+        return report
+
+    # Method to replay .old and the journal if they belong to the current snapshot (lock must be held)
+    # Returns (entries replayed, generation of the journal, bytes of the journal read)
+    def _replay_all(self, inventory):
+        checksum = self._snapshot_checksum()
+        entries, generation, journal_offset = 0, 0, 0
+        for path in (self.old_journal_file, self.journal_file):
+            header = read_header(path)
+            if header is None:
+                continue
+            # An old journal without a header (only possible for the main journal) is always replayed
+            if header and header.get("base") != checksum:
+                # Already folded into the snapshot by a compaction that was interrupted; count it as read
+                if path == self.journal_file:
+                    generation, journal_offset = header.get("gen", 0), os.path.getsize(path)
+                continue
+            if not header and path == self.old_journal_file:
+                continue
+            offset, count = self._replay_file(path, 0, inventory, skip_own=False)
+            entries += count
+            if path == self.journal_file:
+                generation, journal_offset = header.get("gen", 0), offset
+        return entries, generation, journal_offset
+
+    # Method to apply the complete lines of a journal from a byte offset; returns (new offset, lines applied)
+    def _replay_file(self, path, offset, inventory, skip_own, changed=None):
+        with open(path, "rb") as file:
+            file.seek(offset)
+            data = file.read()
+        # Only whole lines; a line still being written is read next time
+        end = data.rfind(b"\n") + 1
+        count = 0
+        for raw in data[:end].splitlines():
+            try:
+                entry = json.loads(raw)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                # A crash mid-append leaves a partial line; skip it, the other lines are still good
+                continue
+            if not isinstance(entry, dict):
+                continue
+            self.version = max(self.version, entry.get("v", 0))
+            if "gen" in entry:
+                # Header line
+                continue
+            if skip_own and entry.get("by") == self.writer_id:
+                # Our own change is already in memory (and was counted when it was written)
+                continue
+            count += 1
+            # Old journals stored the final quantity ("set"/"del"); new ones store the change
+            if "del" in entry:
+                item = entry["del"]
+                inventory.discard(item)
+            elif "set" in entry:
+                item = entry["set"]
+                inventory.set(item, entry["qty"])
+            else:
+                item = entry["item"]
+                apply_delta(inventory, item, entry["delta"])
+            if changed is not None:
+                changed.add(item)
+        return offset + end, count
+
+    # Method to append one change (delta) for an item
+    def record(self, item, delta, sync=False):
+        return self.record_many([(item, delta)], sync)
+
+    # Method to append several changes as one locked write (fsynced straight away when sync is set);
+    # returns True when it is time to compact
+    def record_many(self, changes, sync=False):
+        with self.lock:
+            self._ensure_journal()
+            version = self._last_version()
+            lines = []
+            for item, delta in changes:
+                version += 1
+                entry = {"v": version, "by": self.writer_id, "item": item, "delta": int(delta)}
+                # One short line per change instead of rewriting the whole catalogue
+                lines.append(json.dumps(entry, separators=(",", ":")) + "\n")
+            # The file is opened for each batch so compaction (in any terminal) can always replace it
+            with open(self.journal_file, "a") as file:
+                file.write("".join(lines))
+                file.flush()
+                self.entries += len(lines)
+                self._unsynced += len(lines)
+                # fsync in batches so a burst of changes costs one disk sync
+                if sync or self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+                    os.fsync(file.fileno())
+                    self._unsynced = 0
+                    self._last_sync = time.monotonic()
+            self.version = version
+            self._append_state = (os.path.getsize(self.journal_file), version)
+        return self.needs_compaction()
+
+    # Method to make sure there is a journal for the current snapshot to append to (lock must be held)
+    def _ensure_journal(self):
+        header = read_header(self.journal_file)
+        if header and header.get("base") != self._snapshot_checksum():
+            # Left behind by an interrupted compaction (its changes are already in the snapshot), so
+            # appending to it would lose the new changes; retire it and start a new one
+            os.replace(self.journal_file, self.old_journal_file)
+            header = None
+        if header is not None and os.path.getsize(self.journal_file) > 0:
+            # Start a new line if a crash left a partial one
+            with open(self.journal_file, "rb+") as file:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b"\n":
+                    file.write(b"\n")
+            return
+        old_header = read_header(self.old_journal_file) or {}
+        header = {"base": self._snapshot_checksum(), "gen": old_header.get("gen", 0) + 1, "v": self.version}
+        with open(self.journal_file, "w") as file:
+            file.write(json.dumps(header, separators=(",", ":")) + "\n")
+
+    # Method to find the highest version number in the journal (lock must be held)
+    def _last_version(self):
+        size = os.path.getsize(self.journal_file)
+        # If nobody appended since our last write, the cached version is still right
+        if self._append_state is not None and self._append_state[0] == size:
+            return self._append_state[1]
+        with open(self.journal_file, "rb") as file:
+            file.seek(max(0, size - TAIL_BYTES))
+            tail = file.read().splitlines()
+        for raw in reversed(tail):
+            try:
+                entry = json.loads(raw)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+            if isinstance(entry, dict) and "v" in entry:
+                return max(self.version, entry["v"])
+        return self.version
+
+    # Method to return the checksum of the snapshot, reading the file again only if it changed
+    def _snapshot_checksum(self):
+        try:
+            stat = os.stat(self.snapshot_file)
+            key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+        if self._checksum_cache[0] != key:
+            self._checksum_cache = (key, file_checksum(self.snapshot_file))
+        return self._checksum_cache[1]
+
+    # Method to check whether the journal has grown enough to be compacted
+    def needs_compaction(self):
+        return self.entries >= self.compact_after
+
+    # Method to fold the snapshot and journal on disk into a new snapshot and start a new journal
+    def compact(self):
+        with self.lock:
+            # Rebuild the stock from the files (every terminal's changes), not from this app's memory
+            merged = self.snapshot_format.inventory_class(capacity=0)
+            if os.path.exists(self.snapshot_file):
+                self.snapshot_format.load(self.snapshot_file, merged)
+            generation_before = read_header(self.journal_file) or {}
+            self._replay_all(merged)
+            data = self.snapshot_format.dump(merged)
+            header = {"base": zlib.crc32(data), "gen": generation_before.get("gen", 0) + 1, "v": self.version}
+            # Write both new files to temporary names first so a crash never truncates the snapshot
+            self._write_synced(self.snapshot_file + ".tmp", data)
+            self._write_synced(self.journal_file + ".tmp", (json.dumps(header, separators=(",", ":")) + "\n").encode())
+            # Swap them in. At every step the files on disk stay consistent: once the new snapshot is in
+            # place, the old journal's checksum no longer matches it, so it can't be replayed twice.
+            os.replace(self.snapshot_file + ".tmp", self.snapshot_file)
+            if os.path.exists(self.journal_file):
+                # Keep the old journal for terminals that haven't read its last lines yet
+                os.replace(self.journal_file, self.old_journal_file)
+            os.replace(self.journal_file + ".tmp", self.journal_file)
+            self.entries = 0
+            self._append_state = None
+
+    # Method to write bytes to a file and fsync it
+    @staticmethod
+    def _write_synced(path, data):
+        with open(path, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+
+    # Method to return something that changes whenever the journal changes (None if it doesn't exist)
+    def _stat_journal(self):
+        try:
+            stat = os.stat(self.journal_file)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    # Method to apply other terminals' changes made since the last call; returns the set of changed
+    # items, or None if the journal moved on too far and the stock has to be loaded again
+    def poll(self, inventory):
+        # Cheap check: one stat call when nothing changed
+        stat = self._stat_journal()
+        if stat is None or stat == self._stat:
+            return set()
+        # Read under the lock so a compaction can't swap the files halfway through
+        with self.lock:
+            header = read_header(self.journal_file)
+            if header is None:
+                return set()
+            generation = header.get("gen", 0)
+            changed = set()
+            if generation == self.generation:
+                self._offset, count = self._replay_file(self.journal_file, self._offset, inventory, True, changed)
+            elif generation == self.generation + 1 and (self._offset == 0 or self._old_generation() == self.generation):
+                # Someone compacted (or started the first journal): finish the old journal, then read
+                # the new one from the start
+                if self._offset:
+                    self._replay_file(self.old_journal_file, self._offset, inventory, True, changed)
+                self.generation = generation
+                self._offset, count = self._replay_file(self.journal_file, 0, inventory, True, changed)
+                self.entries = 0
+            else:
+                # More than one compaction since we last looked
+                return None
+            self.entries += count
+            self._stat = stat
+        return changed
+
+    # Method to return the generation of the .old journal (None if there isn't one)
+    def _old_generation(self):
+        header = read_header(self.old_journal_file)
+        return None if header is None else header.get("gen", 0)
+
+    # Method to sync outstanding appends (the journal is only open while writing, so nothing to close)
+    def close(self):
+        if self._unsynced and os.path.exists(self.journal_file):
+            with open(self.journal_file, "a") as file:
+                os.fsync(file.fileno())
+        self._unsynced = 0
@@ -0,0 +1,360 @@
+
+import json # For the locations file and the transfer log
+import os # For paths relative to the locations file, fsync of the transfer log and process checks
+import random # For a unique id per transfer
+import socket # For the computer name of the terminal that starts a transfer
+import sqlite3 # For catching load errors from the SQLite backend
+import threading # For loading each location only once when loads overlap
+import time # For telling a transfer that was cut off from one still being stored
+from concurrent.futures import ThreadPoolExecutor # For loading several locations at the same time
+
+from locking import FileLock # Exclusive lock shared by every terminal using the same files
+from stock_engine import StockEngine, StockError # Headless stock rules and storage
+
+# Multi-location stock for the stocktaking app
+# A business with a shop floor, a back room and a godown keeps one store per location, each with its
+# own stock file (so its own journal, movement history, alert settings and undo) and its own capacity.
+# locations.json, next to the stock file, lists them in the order they are shown:
+#   {"Shop Floor": {"file": "stock_data.json", "capacity": 1000},
+#    "Back Room": {"file": "back_room.json", "capacity": 500},
+#    "Godown": {"file": "godown.stock", "capacity": 50000}}
+# A location is only loaded when it is needed, so opening one doesn't parse the others; load_all loads
+# several at once, each on its own worker thread (the window runs it on its persistence worker, so it
+# doesn't wait for them either).
+# A transfer checks both sides before changing either. The two sides are stored in two different files,
+# so the transfer is first written to locations.transfers as one intent, and each side is marked there
+# once it is stored. If a terminal stops halfway, recover() (run when the locations are opened and before
+# each transfer) finishes the transfer from the side that was stored, or rolls it back if neither was,
+# so the stock never shows up in both locations or in neither. A transfer counts as cut off once the
+# terminal that started it has stopped (same computer, its process is gone) or after TRANSFER_TIMEOUT.
+
+# Name of the locations file (kept next to the stock file)
+LOCATIONS_FILE = "locations.json"
+# Name of the only location when there is no locations file
+DEFAULT_LOCATION = "Main"
+# Name of the transfer log (kept next to the locations file)
+TRANSFERS_FILE = "locations.transfers"
+# Seconds after which another terminal's unfinished transfer is taken to have been cut off
+TRANSFER_TIMEOUT = 30
+# Most locations loaded at the same time
+LOAD_WORKERS = 4
+
+
+# Function to return the path of the locations file that goes with a stock file
+def locations_path(stock_file):
+    return os.path.join(os.path.dirname(os.path.abspath(stock_file)), LOCATIONS_FILE)
+
+
+# Function to return the path of the transfer log that goes with a stock file
+def transfers_path(stock_file):
+    return os.path.join(os.path.dirname(os.path.abspath(stock_file)), TRANSFERS_FILE)
+
+
+# Function to check whether a process on this computer is still running (a pid the system has since
+# given to another process also looks alive; such a transfer waits for TRANSFER_TIMEOUT instead)
+def process_alive(pid):
+    if os.name == "nt":
+        # os.kill would end the process on Windows, so ask for its exit code instead
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            # Access denied means it exists; anything else means it is gone
+            return kernel32.GetLastError() == 5
+        code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Someone else's process
+        return True
+    return True
+
+
+# Function to read the locations file into {name: {"file": path, "capacity": n}} (in the file's order);
+# without a locations file the stock file is the only location
+def load_locations(path, stock_file="stock_data.json", capacity=1000):
+    try:
+        with open(path, "r") as file:
+            saved = json.load(file)
+    except FileNotFoundError:
+        return {DEFAULT_LOCATION: {"file": stock_file, "capacity": capacity}}
+    if not isinstance(saved, dict) or not saved:
+        raise ValueError(f"{path} should map each location name to its stock file and capacity")
+    # Stock files are relative to the folder the locations file is in
+    folder = os.path.dirname(os.path.abspath(path))
+    locations = {}
+    for name, entry in saved.items():
+        if not name.strip() or not isinstance(entry, dict) or not isinstance(entry.get("file"), str):
+            raise ValueError(f"Location '{name}' in {path} needs a name and a \"file\"")
+        location_capacity = entry.get("capacity", capacity)
+        if not isinstance(location_capacity, int) or location_capacity < 0:
+            raise ValueError(f"Location '{name}' in {path} has a bad capacity: {location_capacity!r}")
+        locations[name.strip()] = {"file": os.path.join(folder, entry["file"]), "capacity": location_capacity}
+    return locations
+
+
+# Define the TransferLog class that records each transfer as one intent until both sides are stored
+class TransferLog:
+    # Append-only, lock-protected log of transfer intents and of the sides stored so far.
+
+    # Initialize the TransferLog with the path of the log file
+    def __init__(self, path):
+        self.path = path
+        self.lock = FileLock(path + ".lock")
+        # Written on each intent so a terminal can tell whether the one that started a transfer is running
+        self.host = socket.gethostname()
+        self.pid = os.getpid()
+        # Transfer id -> sides ("from", "to") stored so far, for the transfers this terminal is storing
+        self.open = {}
+
+    # Method to append entries to the log and fsync it (lock must be held)
+    def _append(self, *entries):
+        with open(self.path, "a") as file:
+            file.write("".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries))
+            file.flush()
+            os.fsync(file.fileno())
+
+    # Method to record the intent to move stock; returns the transfer id
+    def begin(self, item, quantity, source, target):
+        transfer_id = f"{self.host}-{self.pid}-{random.getrandbits(32):08x}"
+        with self.lock:
+            entry = {"id": transfer_id, "item": item, "qty": quantity, "from": source, "to": target, "host": self.host, "pid": self.pid, "at": time.time()}
+            self._append(entry)
+            self.open[transfer_id] = set()
+        return transfer_id
+
+    # Method to record that one side ("from" or "to") of a transfer is stored; once both are, the
+    # transfer is done
+    def mark(self, transfer_id, side):
+        with self.lock:
+            sides = self.open.setdefault(transfer_id, set())
+            sides.add(side)
+            if len(sides) < 2:
+                self._append({"id": transfer_id, "stored": side})
+                return
+            self._append({"id": transfer_id, "stored": side}, {"id": transfer_id, "done": True})
+            del self.open[transfer_id]
+            self._trim()
+
+    # Method to record that a transfer was finished or rolled back
+    def finish(self, transfer_id):
+        with self.lock:
+            self._append({"id": transfer_id, "done": True})
+            self.open.pop(transfer_id, None)
+            self._trim()
+
+    # Method to empty the log once nothing in it is pending (lock must be held)
+    def _trim(self):
+        if not self._read():
+            with open(self.path + ".tmp", "w"):
+                pass
+            os.replace(self.path + ".tmp", self.path)
+
+    # Method to read the pending transfers: {id: (intent, sides stored)} (lock must be held)
+    def _read(self):
+        pending = {}
+        try:
+            with open(self.path, "rb") as file:
+                lines = file.read().splitlines()
+        except FileNotFoundError:
+            return pending
+        for raw in lines:
+            try:
+                entry = json.loads(raw)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                # A crash mid-append leaves a partial line; the intent it belonged to is never marked done
+                continue
+            if not isinstance(entry, dict) or "id" not in entry:
+                continue
+            if "item" in entry:
+                pending[entry["id"]] = (entry, set())
+            elif entry.get("done"):
+                pending.pop(entry["id"], None)
+            elif entry["id"] in pending:
+                pending[entry["id"]][1].add(entry.get("stored"))
+        return pending
+
+    # Method to check whether the terminal that started a transfer has stopped: it ran on this computer
+    # and its process is gone (an earlier run of this terminal, or another one that crashed)
+    def _starter_stopped(self, intent):
+        pid = intent.get("pid")
+        return intent.get("host") == self.host and isinstance(pid, int) and pid != self.pid and not process_alive(pid)
+
+    # Method to return the transfers that were cut off: pending, not being stored by this terminal, and
+    # either started by a terminal that has stopped or older than TRANSFER_TIMEOUT
+    def stale(self):
+        with self.lock:
+            pending = self._read()
+        now = time.time()
+        return [
+            (transfer_id, intent, sides) for transfer_id, (intent, sides) in pending.items()
+            if transfer_id not in self.open and (self._starter_stopped(intent) or now - intent.get("at", 0) > TRANSFER_TIMEOUT)
+        ]
+
+
+# Define the LocationSet class that holds one StockEngine per location
+class LocationSet:
+    # Engines are created and loaded on first use; transfers move stock between two of them.
+
+    # Initialize the LocationSet with the locations, optionally a function that returns the runner for an
+    # engine's storage jobs (the GUI runs them on its persistence worker when the backend allows), and the
+    # transfer log (default: next to the first location's stock file)
+    def __init__(self, locations, make_runner=None, transfers_file=None):
+        self.locations = locations
+        self.make_runner = make_runner
+        self.transfers = TransferLog(transfers_file or transfers_path(next(iter(locations.values()))["file"]))
+        # Name -> StockEngine, for the locations opened so far
+        self.engines = {}
+        # Name -> load report, for the locations loaded so far
+        self.reports = {}
+        # One lock per location, so a location that is being loaded in the background isn't loaded twice
+        self._locks = {name: threading.Lock() for name in locations}
+
+    # Method to return the location names in order
+    def names(self):
+        return list(self.locations)
+
+    # Method to return the location name matching what the user typed (any case)
+    def find(self, text):
+        for name in self.locations:
+            if name.lower() == text.strip().lower():
+                return name
+        raise StockError(f"Unknown location '{text}'. Locations: {', '.join(self.locations)}.", "Not Found")
+
+    # Method to return the location kept in a stock file (the first location if none is)
+    def location_of(self, stock_file):
+        path = os.path.abspath(stock_file)
+        for name, location in self.locations.items():
+            if os.path.abspath(location["file"]) == path:
+                return name
+        return self.names()[0]
+
+    # Method to return a location's engine, creating it (but not loading it) the first time
+    def engine(self, name):
+        engine = self.engines.get(name)
+        if engine is None:
+            location = self.locations[name]
+            engine = StockEngine(location["file"], location["capacity"])
+            if self.make_runner:
+                engine.runner = self.make_runner(engine)
+            self.engines[name] = engine
+        return engine
+
+    # Method to check whether a location's stock has been loaded
+    def is_loaded(self, name):
+        return name in self.reports
+
+    # Method to load one location (only once unless reload is set) and return its load report
+    def load(self, name, progress=None, reload=False):
+        engine = self.engine(name)
+        with self._locks[name]:
+            if reload or name not in self.reports:
+                self.reports[name] = engine.load(progress=progress)
+        return self.reports[name]
+
+    # Method to load several locations (default: all) in parallel; returns {name: (report, error)}
+    def load_all(self, names=None):
+        names = [name for name in (names or self.locations) if not self.is_loaded(name)]
+        engines = {name: self.engine(name) for name in names}
+        results = {}
+        with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as pool:
+            futures = {name: pool.submit(self._try, self.load, name) for name in names if engines[name].background_safe}
+            # Backends tied to the thread that opened them (SQLite) load on this thread in the meantime
+            for name in names:
+                if name not in futures:
+                    results[name] = self._try(self.load, name)
+            for name, future in futures.items():
+                results[name] = future.result()
+        return {name: results[name] for name in names}
+
+    # Method to run a load and return (report, error) instead of raising
+    @staticmethod
+    def _try(load, *args):
+        try:
+            return load(*args), None
+        except (ValueError, IOError, sqlite3.Error, StockError) as error:
+            return None, error
+
+    # Method to return [(name, total, capacity)] for the loaded locations
+    def totals(self):
+        return [(name, self.engines[name].total(), self.engines[name].capacity) for name in self.locations if self.is_loaded(name)]
+
+    # Method to return {location: quantity} of one item across the loaded locations
+    def item_totals(self, name):
+        item = StockEngine.check_name(name)
+        return {location: self.engines[location].get(item) for location in self.locations if self.is_loaded(location)}
+
+    # Method to move stock of an item from one location to another; returns what is left at the
+    # source and what is now at the target. Nothing changes unless both sides allow it.
+    def transfer(self, name, quantity, source, target):
+        if source == target:
+            raise StockError("Choose two different locations to move stock between.", "Transfer")
+        self.load(source)
+        self.load(target)
+        # Finish any transfer a stopped terminal left halfway first, so this one is checked against it
+        self.recover()
+        giver = self.engines[source]
+        taker = self.engines[target]
+        item = giver.check_name(name)
+        quantity = giver.check_quantity(quantity)
+        # Check both sides first: the source must have all of it and the target must have room for it
+        available = giver.get(item)
+        if available < quantity:
+            raise StockError(f"Only {available} of '{item}' at {source}.", "Transfer")
+        taker.check_room(item, quantity)
+        transfer_id = self.transfers.begin(item, quantity, source, target)
+        giver.apply_changes([(item, -quantity)], [lambda: self.transfers.mark(transfer_id, "from")])
+        try:
+            taker.apply_changes([(item, quantity)], [lambda: self.transfers.mark(transfer_id, "to")])
+        except StockError:
+            # Put the stock back so it isn't lost between the two locations
+            giver.apply_changes([(item, quantity)], [lambda: self.transfers.finish(transfer_id)])
+            raise
+        return giver.get(item), taker.get(item)
+
+    # Method to finish or roll back the transfers a stopped terminal left halfway; returns a message for
+    # each one
+    def recover(self):
+        messages = []
+        for transfer_id, intent, sides in self.transfers.stale():
+            item, quantity, source, target = intent["item"], intent["qty"], intent["from"], intent["to"]
+            moved = f"{quantity} of '{item}' from {source} to {target}"
+            if source not in self.locations or target not in self.locations:
+                messages.append(f"Could not finish moving {moved}: the location is no longer listed.")
+                continue
+            if not sides or sides == {"from", "to"}:
+                # Nothing was stored (nothing to undo), or both sides were and only the last mark is missing
+                self.transfers.finish(transfer_id)
+                messages.append(f"{'Finished' if sides else 'Rolled back'} moving {moved}.")
+                continue
+            self.load(source)
+            self.load(target)
+            self.transfers.open[transfer_id] = set(sides)
+            if "from" in sides:
+                try:
+                    self.engines[target].apply_changes([(item, quantity)], [lambda transfer_id=transfer_id: self.transfers.mark(transfer_id, "to")])
+                    messages.append(f"Finished moving {moved}.")
+                except StockError:
+                    # No room at the target any more: the stock goes back where it came from
+                    self.engines[source].apply_changes([(item, quantity)], [lambda transfer_id=transfer_id: self.transfers.finish(transfer_id)])
+                    messages.append(f"Rolled back moving {moved}: no room at {target}.")
+            else:
+                self.engines[source].apply_changes([(item, -quantity)], [lambda transfer_id=transfer_id: self.transfers.mark(transfer_id, "from")])
+                messages.append(f"Finished moving {moved}.")
+        return messages
+
+    # Method to save every loaded location (locations never loaded have nothing to save)
+    def save(self):
+        for name in self.names():
+            if self.is_loaded(name):
+                self.engines[name].save()
+
+    # Method to close every location that was opened
+    def close(self):
+        for engine in self.engines.values():
+            engine.close()
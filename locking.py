@@ -0,0 +1,93 @@
+
+import threading # For locking between threads of the same process
+import time # For the lock timeout
+
+# Advisory file locking for the stocktaking app
+# Several shop terminals can share one stock_data.json (for example on a network drive). Every
+# write to the shared files happens while holding an exclusive lock on a small ".lock" file next
+# to them, so two terminals never write at the same moment.
+# fcntl is only on Linux/macOS and msvcrt only on Windows, so whichever one exists is used.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+# Define the LockTimeout class raised when another terminal holds the lock for too long
+class LockTimeout(IOError):
+    # Raised by FileLock.acquire when the timeout runs out.
+    pass
+
+
+# Define the FileLock class that holds an exclusive advisory lock on a file
+class FileLock:
+    # Exclusive lock usable as a context manager ("with lock: ...").
+
+    # Initialize the FileLock with the path of the lock file and how long to wait for it
+    def __init__(self, path, timeout=10.0):
+        self.path = path
+        self.timeout = timeout
+        # Open lock file handle while the lock is held
+        self._file = None
+        # The OS lock is per process on some systems, so threads also take this lock first
+        self._thread_lock = threading.RLock()
+        # How many times this thread has entered the lock (so it can be nested)
+        self._depth = 0
+
+    # Method to take the lock, waiting up to the timeout
+    def acquire(self):
+        if not self._thread_lock.acquire(timeout=self.timeout):
+            raise LockTimeout(f"Timed out waiting for {self.path}")
+        self._depth += 1
+        if self._depth > 1:
+            return self
+        deadline = time.monotonic() + self.timeout
+        self._file = open(self.path, "a+")
+        while True:
+            try:
+                self._lock_file()
+                return self
+            except OSError:
+                # Someone else holds it; try again shortly
+                if time.monotonic() >= deadline:
+                    self._file.close()
+                    self._file = None
+                    self._depth -= 1
+                    self._thread_lock.release()
+                    raise LockTimeout(f"Timed out waiting for {self.path}")
+                time.sleep(0.02)
+
+    # Method to release the lock
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                self._unlock_file()
+            finally:
+                self._file.close()
+                self._file = None
+        self._thread_lock.release()
+
+    # Method to lock the open file without blocking (raises OSError if it is already locked)
+    def _lock_file(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+
+    # Method to unlock the open file
+    def _unlock_file(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    # Context manager helpers
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
@@ -0,0 +1,116 @@
+
+import threading # For the background worker thread
+import collections # For the ordered queue of pending jobs
+import time # For the bounded wait in flush
+
+# Background persistence worker for the stocktaking app
+# File writes used to run inside the Tk button callbacks, so a slow disk or network share froze the
+# whole window. Jobs are now handed to one worker thread that runs them in order. Jobs submitted with
+# the same key while an earlier one is still waiting replace it, so a burst of saves becomes one write.
+# Results and errors are handed back to the Tk main loop, which polls for them with root.after
+# (Tk widgets must only be touched from the main thread).
+
+# Define the PersistenceWorker class that runs storage jobs on a background thread
+class PersistenceWorker:
+    # One worker thread plus a queue of jobs with per-key coalescing.
+
+    # Initialize the PersistenceWorker with the Tk root and the error handler (both used on the main thread)
+    def __init__(self, root, on_error=None, poll_ms=100):
+        self.root = root
+        # Called on the main thread with the exception when a job fails
+        self.on_error = on_error
+        # How often the main thread checks for finished jobs
+        self.poll_ms = poll_ms
+        # Order of waiting jobs (each entry is the key of a job in _pending)
+        self._order = collections.deque()
+        # Dictionary of key -> (job, on_done) for the jobs that are waiting
+        self._pending = {}
+        # Finished jobs waiting to be reported on the main thread: (on_done, result, error)
+        self._finished = collections.deque()
+        # Number of jobs waiting or running
+        self._busy = 0
+        # Counter used to give jobs without a key their own unique key
+        self._next_id = 0
+        # Condition used to wake the worker and to wait for it in flush
+        self._condition = threading.Condition()
+        self._stopping = False
+        # Start the worker thread (daemon so a stuck disk can never keep the process alive)
+        self._thread = threading.Thread(target=self._run, name="stock-persistence", daemon=True)
+        self._thread.start()
+        # Start polling for finished jobs
+        self._poll_id = self.root.after(self.poll_ms, self._poll)
+
+    # Method to queue a job (a function with no arguments); on_done(result) runs on the main thread
+    def submit(self, job, key=None, on_done=None):
+        with self._condition:
+            if key is not None and key in self._pending:
+                # A job with this key is still waiting: replace it so only the newest one runs
+                self._pending[key] = (job, on_done)
+                return
+            if key is None:
+                self._next_id += 1
+                key = ("job", self._next_id)
+            self._pending[key] = (job, on_done)
+            self._order.append(key)
+            self._busy += 1
+            self._condition.notify_all()
+
+    # Method for the worker thread: run waiting jobs in order until stopped
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._order and not self._stopping:
+                    self._condition.wait()
+                if not self._order:
+                    return
+                key = self._order.popleft()
+                job, on_done = self._pending.pop(key)
+            # Run the job outside the lock so new jobs can be submitted meanwhile
+            result, error = None, None
+            try:
+                result = job()
+            except Exception as exc:
+                error = exc
+            with self._condition:
+                self._finished.append((on_done, result, error))
+                self._busy -= 1
+                self._condition.notify_all()
+
+    # Method that runs on the main thread via root.after and reports finished jobs
+    def _poll(self):
+        self.report_finished()
+        self._poll_id = self.root.after(self.poll_ms, self._poll)
+
+    # Method to call the completion and error handlers for finished jobs (main thread only)
+    def report_finished(self):
+        while self._finished:
+            on_done, result, error = self._finished.popleft()
+            if error is not None:
+                if self.on_error:
+                    self.on_error(error)
+            elif on_done:
+                on_done(result)
+
+    # Method to wait until every queued job has run; returns False if the timeout ran out first
+    def flush(self, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._busy:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self._condition.wait(left)
+        return True
+
+    # Method to flush the queue with a bounded wait and stop the worker and the polling
+    def stop(self, timeout=5.0):
+        flushed = self.flush(timeout)
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        try:
+            self.root.after_cancel(self._poll_id)
+        except Exception:
+            # The window may already be gone
+            pass
+        return flushed
@@ -0,0 +1,298 @@
+
+import csv # For CSV reports and the part files of reports across locations
+import heapq # For merging the sorted rows of several locations
+import html # For escaping item and location names in HTML reports
+import multiprocessing # For the progress queue shared with the report processes
+import os # For writing reports atomically and removing part files
+import time # For the time printed on HTML reports and the wait loop
+from concurrent.futures import ProcessPoolExecutor # For generating big reports outside the GUI process
+
+# Streaming stock reports for the stocktaking app
+# A report is a table with one row per item: "item, quantity" for one location, or "item, <a column per
+# location>, total" across locations. Rows come from generators and are written to the file one at a
+# time, as CSV or as a self-contained HTML page (inline styles, no scripts or linked files), so the
+# output is never held in memory. Big reports and reports across locations are generated by a pool of
+# worker processes (ReportPool): for a report across locations each location is loaded in its own
+# process and its sorted rows written to a part file, then the parts are merged into the report.
+# Progress comes back through a queue that the window polls.
+
+# Rows written between progress updates
+PROGRESS_EVERY = 10000
+# Number of items from which the app generates a report in the process pool instead of straight away
+POOL_THRESHOLD = 50000
+
+# Styles embedded in every HTML report
+HTML_STYLE = (
+    "body{font-family:Arial,sans-serif;margin:2em}"
+    "table{border-collapse:collapse}"
+    "th,td{border:1px solid #ccc;padding:4px 10px}"
+    "th{background:#eee}"
+    "td.n{text-align:right}"
+    "tfoot td{font-weight:bold}"
+)
+
+# Queue the report processes send progress through (set in each process by _start_worker)
+_progress_queue = None
+
+
+# Function to return "html" or "csv" for a report path (chosen by the file extension)
+def report_format(path):
+    return "html" if os.path.splitext(path)[1].lower() in (".html", ".htm") else "csv"
+
+
+# Function to pass rows through, calling progress(rows done, rows expected) every PROGRESS_EVERY rows
+def counted(rows, progress=None, expected=0):
+    done = 0
+    for row in rows:
+        yield row
+        done += 1
+        if progress and done % PROGRESS_EVERY == 0:
+            progress(done, max(done, expected))
+    if progress:
+        progress(done, done)
+
+
+# Function to tag each (item, quantity) of a source with the source's position, for merging
+def _tagged(source, index):
+    for item, quantity in source:
+        yield item, index, quantity
+
+
+# Function to merge several sources of (item, quantity) sorted by item into (item, [quantity per source])
+# rows, one item at a time
+def merge_columns(sources):
+    row_item, row = None, None
+    for item, index, quantity in heapq.merge(*[_tagged(source, index) for index, source in enumerate(sources)]):
+        if item != row_item:
+            if row is not None:
+                yield row_item, row
+            row_item, row = item, [0] * len(sources)
+        row[index] = quantity
+    if row is not None:
+        yield row_item, row
+
+
+# Function to write rows as CSV to an open file; returns the number of rows
+def write_csv(file, title, columns, rows):
+    writer = csv.writer(file)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+# Function to write rows as an HTML page to an open file, with a totals row at the end; returns the
+# number of rows
+def write_html(file, title, columns, rows):
+    file.write(
+        f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>{html.escape(title)}</title>"
+        f"<style>{HTML_STYLE}</style></head><body>\n"
+        f"<h1>{html.escape(title)}</h1>\n<p>Generated {time.strftime('%Y-%m-%d %H:%M')}</p>\n<table>\n"
+        "<thead><tr>" + "".join(f"<th>{html.escape(column)}</th>" for column in columns) + "</tr></thead>\n<tbody>\n"
+    )
+    # Column totals are added up while the rows go past
+    totals = [0] * (len(columns) - 1)
+    count = 0
+    for row in rows:
+        file.write(
+            f"<tr><td>{html.escape(row[0])}</td>" + "".join(f"<td class=\"n\">{value}</td>" for value in row[1:]) + "</tr>\n"
+        )
+        for index, value in enumerate(row[1:]):
+            totals[index] += value
+        count += 1
+    file.write(
+        "</tbody>\n<tfoot><tr>" + f"<td>Total ({count} items)</td>"
+        + "".join(f"<td class=\"n\">{value}</td>" for value in totals) + "</tr></tfoot>\n</table>\n</body></html>\n"
+    )
+    return count
+
+
+# Function to write a report (CSV or HTML by the extension) without ever leaving a half-written one;
+# returns the number of rows
+def write_report(path, title, columns, rows, progress=None, expected=0):
+    writer = write_html if report_format(path) == "html" else write_csv
+    with open(path + ".tmp", "w", newline="", encoding="utf-8") as file:
+        count = writer(file, title, columns, counted(rows, progress, expected))
+    os.replace(path + ".tmp", path)
+    return count
+
+
+# Function that sets up each report process with the progress queue
+def _start_worker(queue):
+    global _progress_queue
+    _progress_queue = queue
+
+
+# Function to return a progress callback that sends a job's progress to the window
+def _queue_progress(job_id):
+    return lambda done, total: _progress_queue.put((job_id, done, total))
+
+
+# Function to load a stock file and return its (item, quantity) rows sorted by item
+def _load_sorted(stock_file, capacity):
+    # Local import: stock_engine uses this module for its exports
+    from stock_engine import StockEngine
+    engine = StockEngine(stock_file, capacity)
+    try:
+        engine.load()
+        return engine.sorted_items()
+    finally:
+        engine.close()
+
+
+# Function to read a part file back as (item, quantity) rows
+def _read_part(path):
+    with open(path, "r", newline="", encoding="utf-8") as file:
+        for item, quantity in csv.reader(file):
+            yield item, int(quantity)
+
+
+# Report process job: write the report of one stock file
+def _single_job(job_id, path, title, stock_file, capacity):
+    items = _load_sorted(stock_file, capacity)
+    return write_report(path, title, ["item", "quantity"], items, _queue_progress(job_id), len(items))
+
+
+# Report process job: write one location's sorted rows to a part file; returns the number of rows
+def _part_job(stock_file, capacity, part_path):
+    items = _load_sorted(stock_file, capacity)
+    with open(part_path, "w", newline="", encoding="utf-8") as file:
+        csv.writer(file).writerows(items)
+    return len(items)
+
+
+# Report process job: merge the part files into the report across locations
+def _merge_job(job_id, path, title, columns, part_paths, expected):
+    rows = ((item, *quantities, sum(quantities)) for item, quantities in merge_columns([_read_part(part) for part in part_paths]))
+    return write_report(path, title, columns, rows, _queue_progress(job_id), expected)
+
+
+# Define the ReportJob class for one report being generated by the pool
+class ReportJob:
+    # Where the report goes, how far it has got, and how it ended.
+
+    # Initialize the ReportJob with its id, output path and title
+    def __init__(self, job_id, path, title):
+        self.id = job_id
+        self.path = path
+        self.title = title
+        # Future of the job writing the report (for a report across locations, set once the parts are done)
+        self.future = None
+        # Futures and paths of the part files of a report across locations
+        self.parts = []
+        self.part_paths = []
+        self.columns = []
+        # Rows written so far and rows expected
+        self.done = 0
+        self.total = 0
+        # Number of rows in the finished report, or the error that stopped it
+        self.rows = None
+        self.error = None
+
+    # Method to describe how far the job has got, e.g. "loading 1/3 locations" or "42%"
+    def progress_text(self):
+        if self.future is None and self.parts:
+            return f"loading {sum(part.done() for part in self.parts)}/{len(self.parts)} locations"
+        if self.total:
+            return f"{min(100, self.done * 100 // self.total)}%"
+        return "starting"
+
+
+# Define the ReportPool class that generates reports in worker processes
+class ReportPool:
+    # Process pool started on first use, plus a queue for progress; poll() is called from the main loop.
+
+    # Initialize the ReportPool with the number of worker processes (default: one per CPU)
+    def __init__(self, workers=None):
+        self.workers = workers
+        self._pool = None
+        self._queue = None
+        self._next_id = 0
+        # Job id -> ReportJob, for the reports still being generated
+        self.jobs = {}
+
+    # Method to return the process pool, starting it the first time
+    def _executor(self):
+        if self._pool is None:
+            # Fresh processes rather than forks of the GUI process (with its Tk and worker threads)
+            context = multiprocessing.get_context("spawn")
+            self._queue = context.Queue()
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=context, initializer=_start_worker, initargs=(self._queue,))
+        return self._pool
+
+    # Method to start a report of one or more stock files; sources is [(location name, stock file, capacity)].
+    # Returns the ReportJob
+    def submit(self, path, title, sources):
+        pool = self._executor()
+        self._next_id += 1
+        job = ReportJob(self._next_id, path, title)
+        if len(sources) == 1:
+            _, stock_file, capacity = sources[0]
+            job.future = pool.submit(_single_job, job.id, path, title, stock_file, capacity)
+        else:
+            # Every location is loaded at the same time in its own process; the merge starts in poll()
+            job.columns = ["item"] + [name for name, _, _ in sources] + ["total"]
+            job.part_paths = [f"{path}.part{index}" for index in range(len(sources))]
+            job.parts = [
+                pool.submit(_part_job, stock_file, capacity, part_path)
+                for (_, stock_file, capacity), part_path in zip(sources, job.part_paths)
+            ]
+        self.jobs[job.id] = job
+        return job
+
+    # Method to take in progress, start merges whose parts are ready, and return the jobs that finished
+    def poll(self):
+        while self._queue is not None and not self._queue.empty():
+            job_id, done, total = self._queue.get()
+            job = self.jobs.get(job_id)
+            if job is not None:
+                job.done, job.total = done, total
+        finished = []
+        for job in list(self.jobs.values()):
+            if job.future is None:
+                if not all(part.done() for part in job.parts):
+                    continue
+                errors = [part.exception() for part in job.parts if part.exception() is not None]
+                if errors:
+                    job.error = errors[0]
+                else:
+                    # The merged rows are at most the sum of the locations' rows
+                    expected = sum(part.result() for part in job.parts)
+                    job.future = self._pool.submit(_merge_job, job.id, job.path, job.title, job.columns, job.part_paths, expected)
+                    continue
+            elif not job.future.done():
+                continue
+            elif job.future.exception() is not None:
+                job.error = job.future.exception()
+            else:
+                job.rows = job.future.result()
+            self._remove_parts(job)
+            del self.jobs[job.id]
+            finished.append(job)
+        return finished
+
+    # Method to delete the part files of a finished job
+    @staticmethod
+    def _remove_parts(job):
+        for part_path in job.part_paths:
+            try:
+                os.remove(part_path)
+            except FileNotFoundError:
+                pass
+
+    # Method to wait for a job (used by the command line); on_progress(job) is called while waiting
+    def wait(self, job, on_progress=None, interval=0.2):
+        while job.id in self.jobs:
+            time.sleep(interval)
+            self.poll()
+            if on_progress and job.id in self.jobs:
+                on_progress(job)
+        return job
+
+    # Method to stop the pool (reports already being written are finished by their processes)
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
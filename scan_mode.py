@@ -0,0 +1,116 @@
+
+import csv # For loading a SKU list exported from a spreadsheet
+import json # For the SKU map file
+import os # For atomic replace of the SKU map file
+
+from inventory import Inventory # For normalising item names
+
+# Barcode scan mode for the stocktaking app
+# A keyboard-wedge scanner "types" each barcode followed by Enter. Scans are looked up in a SKU map
+# (barcode -> item name) and counted in memory; nothing is stored until the whole run of scans is
+# committed, which adds every item in one batch (one journal write, one undo step). Codes that aren't
+# in the map are counted separately so scanning never stops for a prompt; they can be assigned to
+# an item afterwards. A scan of the form "12*CODE" counts 12 at once (for cartons of a known size).
+
+
+# Define the SkuMap class that maps barcodes/SKUs to item names
+class SkuMap:
+    # Dictionary of code -> item name, saved as JSON.
+
+    # Initialize the SkuMap from its file (empty if the file doesn't exist yet)
+    def __init__(self, path):
+        self.path = path
+        self.codes = {}
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                saved = json.load(file)
+            self.codes = {str(code).strip(): Inventory.normalise(item) for code, item in saved.items()}
+
+    # Method to return the item for a code (None if unknown)
+    def get(self, code):
+        return self.codes.get(code.strip())
+
+    # Method to map a code to an item and save the map
+    def assign(self, code, item):
+        self.codes[code.strip()] = Inventory.normalise(item)
+        self.save()
+
+    # Method to add every "code,item" row of a CSV file (a header row is skipped); returns the count
+    def import_csv(self, path):
+        count = 0
+        with open(path, "r", newline="") as file:
+            for row in csv.reader(file):
+                if len(row) < 2 or not row[0].strip() or not row[1].strip():
+                    continue
+                if count == 0 and row[0].strip().lower() in ("sku", "code", "barcode"):
+                    continue
+                self.codes[row[0].strip()] = Inventory.normalise(row[1])
+                count += 1
+        self.save()
+        return count
+
+    # Method to write the map to its file
+    def save(self):
+        with open(self.path + ".tmp", "w") as file:
+            json.dump(self.codes, file, indent=4, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
+
+    # Method to return the number of codes in the map
+    def __len__(self):
+        return len(self.codes)
+
+
+# Define the ScanSession class that counts scans until they are committed
+class ScanSession:
+    # Running tally of scanned items and unknown codes.
+
+    # Initialize the ScanSession with the SKU map
+    def __init__(self, sku_map):
+        self.sku_map = sku_map
+        # Item -> units scanned, and unknown code -> times scanned
+        self.tally = {}
+        self.unknown = {}
+        # Number of scans taken (not units)
+        self.scans = 0
+
+    # Method to take one scan; returns (item or None if unknown, code, units) for the running display.
+    # A scan of an existing item's name (one of known_items) counts too, for items without a barcode
+    def scan(self, text, known_items=()):
+        code = text.strip()
+        if not code:
+            return None, code, 0
+        units = 1
+        count, star, rest = code.partition("*")
+        if star and count.strip().isdigit() and rest.strip():
+            units, code = max(1, int(count)), rest.strip()
+        self.scans += 1
+        item = self.sku_map.get(code)
+        if item is None and Inventory.normalise(code) in known_items:
+            item = Inventory.normalise(code)
+        if item is None:
+            self.unknown[code] = self.unknown.get(code, 0) + units
+            return None, code, units
+        self.tally[item] = self.tally.get(item, 0) + units
+        return item, code, units
+
+    # Method to move an unknown code's scans to an item (and remember the code for next time)
+    def assign(self, code, item):
+        item = Inventory.normalise(item)
+        self.sku_map.assign(code, item)
+        units = self.unknown.pop(code, 0)
+        if units:
+            self.tally[item] = self.tally.get(item, 0) + units
+        return item
+
+    # Method to return the total units counted for known items
+    def total(self):
+        return sum(self.tally.values())
+
+    # Method to add every counted item through the engine in one batch; returns {item: new quantity}
+    def commit(self, engine):
+        if not self.tally:
+            return {}
+        quantities = engine.add_many(self.tally, f"Scan of {self.total()} units")
+        self.tally = {}
+        self.scans = 0
+        return quantities
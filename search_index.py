@@ -0,0 +1,118 @@
+
+import bisect # For prefix lookups in the sorted list of names
+import heapq # For picking the best fuzzy candidates without sorting them all
+import itertools # For stopping early in very long posting lists
+
+# Search index for the stocktaking app
+# Finding an item used to mean scrolling the list or typing the exact name. This index keeps the
+# item names sorted (so every name starting with what was typed is found with bisect) plus a trigram
+# index (every 3-letter piece of each name -> the names containing it) for fuzzy matches such as
+# typos or words in the middle of a name. Both are updated one name at a time as items come and go.
+
+# At most this many (trigram, name) hits are counted per fuzzy search, so every keystroke costs about
+# the same however big the catalogue is
+MAX_HITS = 20000
+# Only this many names with the most shared trigrams are scored properly
+MAX_CANDIDATES = 300
+# Fuzzy matches must share at least this fraction of trigrams with the query
+MIN_SIMILARITY = 0.1
+
+
+# Function to split a name into its trigrams (padded so the start and end of the name count too)
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+# Define the SearchIndex class that finds item names by prefix or by fuzzy match
+class SearchIndex:
+    # Sorted names for prefix search plus a trigram index for fuzzy search.
+
+    # Initialize the SearchIndex with optional starting names
+    def __init__(self, names=()):
+        self.rebuild(names)
+
+    # Method to rebuild the whole index (used after loading or importing)
+    def rebuild(self, names):
+        # Sorted list of every name
+        self._names = sorted(set(names))
+        # Dictionary of trigram -> set of names containing it
+        self._trigrams = {}
+        for name in self._names:
+            for gram in trigrams(name):
+                self._trigrams.setdefault(gram, set()).add(name)
+
+    # Method to add one name (does nothing if it is already there)
+    def add(self, name):
+        index = bisect.bisect_left(self._names, name)
+        if index < len(self._names) and self._names[index] == name:
+            return
+        self._names.insert(index, name)
+        for gram in trigrams(name):
+            self._trigrams.setdefault(gram, set()).add(name)
+
+    # Method to remove one name (does nothing if it isn't there)
+    def discard(self, name):
+        index = bisect.bisect_left(self._names, name)
+        if index == len(self._names) or self._names[index] != name:
+            return
+        del self._names[index]
+        for gram in trigrams(name):
+            names = self._trigrams.get(gram)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del self._trigrams[gram]
+
+    # Method to return the number of names in the index
+    def __len__(self):
+        return len(self._names)
+
+    # Method to return up to limit names starting with the prefix, in name order
+    def prefix(self, text, limit=100):
+        start = bisect.bisect_left(self._names, text)
+        # Every name with this prefix sorts before text + the highest character
+        end = bisect.bisect_left(self._names, text + "￿", start)
+        return self._names[start:min(end, start + limit)]
+
+    # Method to return up to limit names that look like the text, best match first
+    def fuzzy(self, text, limit=100):
+        query = trigrams(text)
+        # Count shared trigrams starting from the rarest ones, stopping once MAX_HITS have been counted,
+        # so a common piece like "ice" can't make every keystroke look at the whole catalogue
+        postings = sorted((self._trigrams[gram] for gram in query if gram in self._trigrams), key=len)
+        counts = {}
+        budget = MAX_HITS
+        for names in postings:
+            if budget <= 0:
+                break
+            for name in itertools.islice(names, budget):
+                counts[name] = counts.get(name, 0) + 1
+            budget -= len(names)
+        candidates = heapq.nlargest(MAX_CANDIDATES, counts, key=counts.get)
+        # Score the best candidates by how many trigrams they share with the query (Jaccard similarity)
+        scored = []
+        for name in candidates:
+            grams = trigrams(name)
+            shared = len(query & grams)
+            similarity = shared / (len(query) + len(grams) - shared)
+            if similarity >= MIN_SIMILARITY:
+                scored.append((-similarity, name))
+        scored.sort()
+        return [name for _, name in scored[:limit]]
+
+    # Method to search by prefix first, then fill up with fuzzy matches
+    def search(self, text, limit=100):
+        text = text.strip().lower()
+        if not text:
+            return []
+        results = self.prefix(text, limit)
+        # Fuzzy matching needs at least a few letters to mean anything
+        if len(results) < limit and len(text) >= 3:
+            seen = set(results)
+            for name in self.fuzzy(text, limit):
+                if name not in seen:
+                    results.append(name)
+                    if len(results) == limit:
+                        break
+        return results
@@ -0,0 +1,113 @@
+
+import json # For the JSON snapshot format
+import mmap # For reading binary snapshots without copying the whole file into memory first
+import os # For the file size
+import struct # For the binary header
+import sys # For the byte order of the quantity column
+import zlib # For the binary snapshot checksum
+from array import array # For the quantity column
+
+from stream_loader import LoadReport, load_into # Streaming, validating JSON loader
+from inventory import Inventory # Dict-based inventory used with JSON snapshots
+from column_inventory import ColumnInventory # Column-based inventory used with binary snapshots
+
+# Snapshot file formats for the stocktaking app
+# The journal (journal.py) folds changes into a snapshot file every so often; this module reads and
+# writes that file. JsonSnapshot is the original stock_data.json (pretty-printed JSON, parsed and
+# cleaned entry by entry). BinarySnapshot is a compact format for big catalogues:
+#   header   magic "STKS", format version, flags, item count, size of the name table, CRC-32 of the rest
+#   column   one signed 64-bit little-endian quantity per item
+#   names    the item names as UTF-8, separated by NUL bytes, in the same order as the quantities
+# Loading memory-maps the file, checks the checksum, and turns the quantity column and name table
+# into Python objects with one call each instead of parsing text item by item.
+
+# First bytes of every binary snapshot
+MAGIC = b"STKS"
+# Binary format version written by this code (files with a higher version are refused)
+FORMAT_VERSION = 1
+# Header layout: magic, version, flags, item count, name table size, checksum
+HEADER = struct.Struct("<4sHHQQI")
+
+
+# Define the SnapshotError class raised for a binary snapshot that is damaged or not a snapshot at all
+class SnapshotError(IOError):
+    # Raised by BinarySnapshot.load; the app reports it like any other load error.
+    pass
+
+
+# Define the JsonSnapshot class for the original JSON snapshot file
+class JsonSnapshot:
+    # Reads with the streaming loader, writes pretty-printed JSON.
+
+    # Inventory class the stock is loaded into
+    inventory_class = Inventory
+
+    # Method to read a snapshot file into an inventory, returning a LoadReport
+    @staticmethod
+    def load(path, inventory, progress=None):
+        return load_into(path, inventory, progress)
+
+    # Method to return the snapshot file contents for an inventory
+    @staticmethod
+    def dump(inventory):
+        return json.dumps(inventory.to_dict(), indent=4).encode()
+
+
+# Define the BinarySnapshot class for the compact binary snapshot file
+class BinarySnapshot:
+    # Header + quantity column + name table, checked with a CRC-32.
+
+    # Big catalogues are kept in columns too (about a third of the memory of a dict)
+    inventory_class = ColumnInventory
+
+    # Method to read a snapshot file into an inventory, returning a LoadReport
+    @staticmethod
+    def load(path, inventory, progress=None):
+        report = LoadReport()
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < HEADER.size:
+                raise SnapshotError(f"{path} is too short to be a stock snapshot")
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                magic, version, _, count, names_size, checksum = HEADER.unpack_from(data, 0)
+                if magic != MAGIC:
+                    raise SnapshotError(f"{path} is not a binary stock snapshot")
+                if version > FORMAT_VERSION:
+                    raise SnapshotError(f"{path} was written by a newer version (format {version})")
+                names_start = HEADER.size + count * 8
+                if names_start + names_size != size:
+                    raise SnapshotError(f"{path} is damaged (expected {names_start + names_size} bytes, found {size})")
+                view = memoryview(data)
+                try:
+                    if zlib.crc32(view[HEADER.size:]) != checksum:
+                        raise SnapshotError(f"{path} is damaged (checksum mismatch)")
+                    quantities = array("q")
+                    quantities.frombytes(view[HEADER.size:names_start])
+                    names = str(view[names_start:], "utf-8").split("\0") if count else []
+                finally:
+                    # The mapping can't be closed while a view of it is still open
+                    view.release()
+        if len(names) != count:
+            raise SnapshotError(f"{path} is damaged (name table doesn't match the item count)")
+        if sys.byteorder == "big":
+            quantities.byteswap()
+        inventory.set_many(names, quantities)
+        report.loaded = count
+        if progress:
+            progress(size, size)
+        return report
+
+    # Method to return the snapshot file contents for an inventory
+    @staticmethod
+    def dump(inventory):
+        # Written in name order, so loading it can take the names' order as it is
+        items = inventory.sorted_items()
+        names = [name for name, _ in items]
+        quantities = array("q", (quantity for _, quantity in items))
+        table = "\0".join(names).encode()
+        if names and table.count(b"\0") != len(names) - 1:
+            raise ValueError("Item names in a binary snapshot can't contain NUL characters.")
+        if sys.byteorder == "big":
+            quantities.byteswap()
+        body = quantities.tobytes() + table
+        return HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(names), len(table), zlib.crc32(body)) + body
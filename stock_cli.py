@@ -0,0 +1,281 @@
+
+import argparse # For the command line options
+import os # For finding the SKU map next to the stock file
+import sys # For exit codes and error output
+
+from stock_engine import StockEngine, StockError # Headless inventory engine (no tkinter)
+from stock_client import RemoteEngine # Same engine interface, backed by the stock server
+from scan_mode import SkuMap, ScanSession # Barcode scans committed in one batch
+from locations import LocationSet, load_locations, locations_path, transfers_path # Stock kept at several locations
+from reports import ReportPool # Reports across locations generated in worker processes
+from valuation import COSTING_METHODS # Ways of valuing the stock on hand
+from forecast import FORECAST_METHODS, HISTORY_DAYS, COVER_DAYS # Demand forecasting options
+from instrumentation import profiler # Opt-in timing of engine and storage operations (--profile)
+
+# Command line for the stocktaking app
+# Uses the same StockEngine as the GUI, so scripts and nightly batch jobs follow the same rules.
+# Examples:
+#   python stock_cli.py add rice 5
+#   python stock_cli.py remove rice 2
+#   python stock_cli.py list
+#   python stock_cli.py total
+#   python stock_cli.py import count.csv
+#   python stock_cli.py report --days 7          (stock in/out per item over the last week)
+#   python stock_cli.py history rice
+#   python stock_cli.py scan < scans.txt          (one barcode per line, added in one batch at the end)
+#   python stock_cli.py --file stock_data.db export stock.csv
+#   python stock_cli.py export stock.html                   (CSV, HTML or JSON by the extension)
+#   python stock_cli.py export --all-locations stock.html   (one column per location)
+#   python stock_cli.py --server 127.0.0.1:8765 add rice 5   (through a running stock_server.py)
+#   python stock_cli.py --location "back room" list          (one location from locations.json)
+#   python stock_cli.py locations                             (every location's total)
+#   python stock_cli.py transfer rice 5 "back room" "shop floor"
+#   python stock_cli.py add rice 50 --cost 1.20                (received at a unit cost)
+#   python stock_cli.py price rice --cost 1.25 --price 1.99
+#   python stock_cli.py costing fifo                          (or average)
+#   python stock_cli.py import-prices prices.csv              (item,cost,price rows)
+#   python stock_cli.py value --top 20                        (stock value at cost and retail)
+#   python stock_cli.py forecast --top 50                     (nightly: fit demand, suggest reorder quantities)
+#   python stock_cli.py forecast --cached                     (suggestions from the last forecast)
+#   python stock_cli.py --profile import count.csv            (timings printed to standard error at the end)
+
+
+# Function to build the argument parser with one sub-command per operation
+def build_parser():
+    parser = argparse.ArgumentParser(description="Stock Taking System command line")
+    parser.add_argument("--file", default="stock_data.json", help="stock file (.json, or .db for SQLite)")
+    parser.add_argument("--capacity", type=int, default=1000, help="maximum total stock")
+    parser.add_argument("--server", help="use a running stock server (host:port or socket path) instead of --file")
+    parser.add_argument("--location", help="location from locations.json (default: the one kept in --file)")
+    parser.add_argument("--profile", action="store_true", help="print how long the engine and storage took")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = commands.add_parser("add", help="add stock of an item")
+    add_parser.add_argument("item")
+    add_parser.add_argument("quantity", type=int)
+    add_parser.add_argument("--cost", type=float, help="unit cost of this stock (default: the item's current cost)")
+
+    remove_parser = commands.add_parser("remove", help="remove stock of an item")
+    remove_parser.add_argument("item")
+    remove_parser.add_argument("quantity", type=int)
+
+    commands.add_parser("list", help="list every item and its quantity")
+    commands.add_parser("total", help="show the total stock and remaining capacity")
+
+    import_parser = commands.add_parser("import", help="import a CSV or JSON count file")
+    import_parser.add_argument("path")
+
+    export_parser = commands.add_parser("export", help="export the stock to a CSV, HTML or JSON file")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--all-locations", action="store_true", help="one column per location (CSV or HTML)")
+
+    report_parser = commands.add_parser("report", help="show stock in/out per item over the last few days")
+    report_parser.add_argument("--days", type=int, default=7)
+
+    history_parser = commands.add_parser("history", help="show one item's weekly totals and latest movements")
+    history_parser.add_argument("item")
+
+    scan_parser = commands.add_parser("scan", help="read barcodes from standard input and add them in one batch")
+    scan_parser.add_argument("--skus", help="SKU map file (default: sku_map.json next to the stock file)")
+
+    price_parser = commands.add_parser("price", help="set an item's unit cost and/or retail price")
+    price_parser.add_argument("item")
+    price_parser.add_argument("--cost", type=float)
+    price_parser.add_argument("--price", type=float)
+
+    costing_parser = commands.add_parser("costing", help="choose how stock on hand is valued")
+    costing_parser.add_argument("method", choices=COSTING_METHODS)
+
+    import_prices_parser = commands.add_parser("import-prices", help="import unit costs and prices from a CSV file")
+    import_prices_parser.add_argument("path")
+
+    value_parser = commands.add_parser("value", help="show the stock value at cost and at retail")
+    value_parser.add_argument("--top", type=int, default=10, help="number of items to list (0 for none)")
+
+    forecast_parser = commands.add_parser("forecast", help="fit demand from past removals and suggest reorder quantities")
+    forecast_parser.add_argument("--method", choices=FORECAST_METHODS, default="smoothing")
+    forecast_parser.add_argument("--days", type=int, default=HISTORY_DAYS, help="days of history to fit")
+    forecast_parser.add_argument("--cover", type=int, default=COVER_DAYS, help="days of demand to top items up to")
+    forecast_parser.add_argument("--top", type=int, default=20, help="number of suggestions to list (0 for all)")
+    forecast_parser.add_argument("--cached", action="store_true", help="use the last forecast instead of fitting again")
+
+    commands.add_parser("locations", help="show every location's total stock and capacity")
+
+    transfer_parser = commands.add_parser("transfer", help="move stock of an item from one location to another")
+    transfer_parser.add_argument("item")
+    transfer_parser.add_argument("quantity", type=int)
+    transfer_parser.add_argument("source")
+    transfer_parser.add_argument("target")
+    return parser
+
+
+# Function to run one command and return the exit code
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.profile:
+        profiler.enabled = True
+        profiler.instrument_engine(RemoteEngine if args.server else StockEngine)
+    locations = None
+    engine = None
+    try:
+        if args.server:
+            # The server decides the capacity when one is used
+            engine = RemoteEngine(args.server)
+        else:
+            locations = LocationSet(load_locations(locations_path(args.file), args.file, args.capacity), transfers_file=transfers_path(args.file))
+            # Finish or roll back transfers a stopped terminal left halfway
+            for message in locations.recover():
+                print(message, file=sys.stderr)
+            location = locations.find(args.location) if args.location else locations.location_of(args.file)
+            engine = locations.engine(location)
+
+        if args.command in ("locations", "transfer") or getattr(args, "all_locations", False):
+            if locations is None:
+                raise StockError("Locations are kept in the stock files, not on the stock server.", "Error")
+            return run_location_command(args, locations)
+
+        report = engine.load()
+        if report is not None and report.bad:
+            print(report.summary(), file=sys.stderr)
+
+        if args.command == "add":
+            quantity = engine.add(args.item, args.quantity, args.cost)
+            print(f"{engine.check_name(args.item)}: {quantity}")
+            if args.cost is not None:
+                # Keep the new cost (and its cost layer) with the stock
+                engine.save()
+        elif args.command == "remove":
+            remaining = engine.remove(args.item, args.quantity)
+            print(f"{engine.check_name(args.item)}: {remaining}")
+        elif args.command == "list":
+            for item, quantity in engine.sorted_items():
+                print(f"{item}: {quantity}")
+        elif args.command == "total":
+            print(f"Total Stock: {engine.total()}/{engine.capacity} (Remaining: {max(0, engine.remaining())})")
+        elif args.command == "import":
+            result = engine.import_file(args.path)
+            print(result.summary())
+            if not result.applied:
+                return 1
+        elif args.command == "export":
+            count = engine.export_file(args.path)
+            print(f"Exported {count} items to {args.path}")
+        elif args.command == "report":
+            print(f"Movements over the last {args.days} days (in / out):")
+            for item, moved_in, moved_out in engine.movement_report(args.days):
+                print(f"{item}: +{moved_in} / -{moved_out}")
+        elif args.command == "history":
+            history = engine.item_history(args.item)
+            print("Week of      in     out")
+            for monday, moved_in, moved_out in history["weeks"]:
+                print(f"{monday}  {moved_in:>5}  {moved_out:>5}")
+            print("Latest movements:")
+            for when, delta in history["recent"]:
+                print(f"{when:%Y-%m-%d %H:%M}  {delta:+d}")
+        elif args.command == "price":
+            engine.set_item_price(args.item, args.cost, args.price)
+            print(format_item_value(engine, engine.check_name(args.item)))
+        elif args.command == "costing":
+            engine.set_costing(args.method)
+            print(f"Costing: {args.method}")
+            print_value(engine)
+        elif args.command == "import-prices":
+            count = engine.import_prices(args.path)
+            print(f"Priced {count} items from {args.path}")
+            print_value(engine)
+        elif args.command == "value":
+            print_value(engine)
+            if args.top > 0:
+                for item, quantity, cost_value, retail_value in engine.valuation_rows(args.top):
+                    print(f"{item}: {quantity} @ {cost_value / quantity:.2f} = {cost_value:.2f} (retail {retail_value:.2f})")
+        elif args.command == "forecast":
+            if args.days <= 0 or args.cover <= 0:
+                raise StockError("--days and --cover must be at least 1.")
+            forecast = engine.cached_forecast() if args.cached else engine.run_forecast(args.method, args.days)
+            if forecast is None:
+                raise StockError("No forecast yet. Run forecast without --cached first.", "Forecast")
+            print(f"Demand for {len(forecast['rates'])} items ({forecast['method']}, last {forecast['days']} days, {forecast['made']})")
+            suggestions = engine.reorder_suggestions(args.cover)
+            for item, quantity, rate, days_left, order in suggestions[: args.top or None]:
+                print(f"{item}: order {order} (have {quantity}, {rate:.2f}/day, {days_left:.1f} days left)")
+            print(f"{len(suggestions)} items to order, {sum(row[4] for row in suggestions)} units (room: {max(0, engine.remaining())})")
+        elif args.command == "scan":
+            sku_file = args.skus or os.path.join(os.path.dirname(os.path.abspath(args.file)), "sku_map.json")
+            session = ScanSession(SkuMap(sku_file))
+            # A scanner types each code and Enter; stop at the end of input
+            for line in sys.stdin:
+                session.scan(line, engine.inventory)
+            units = session.total()
+            quantities = session.commit(engine)
+            print(f"Added {units} units of {len(quantities)} items.")
+            for code, count in sorted(session.unknown.items()):
+                print(f"Unknown code {code}: {count}", file=sys.stderr)
+            if session.unknown:
+                return 1
+    except StockError as error:
+        print(f"{error.title}: {error}", file=sys.stderr)
+        return 1
+    except (IOError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    finally:
+        if locations is not None:
+            locations.close()
+        elif engine is not None:
+            engine.close()
+        if profiler.enabled:
+            print("\n".join(profiler.summary_lines()), file=sys.stderr)
+    return 0
+
+
+# Function to print the stock value at cost and at retail
+def print_value(engine):
+    cost_value, retail_value = engine.stock_value()
+    print(f"Stock value ({engine.valuation.method}): {cost_value:.2f} at cost, {retail_value:.2f} at retail")
+
+
+# Function to describe one item's quantity, unit costs and price
+def format_item_value(engine, item):
+    quantity, unit_cost, cost, price = engine.valuation.item(item)
+    return f"{item}: {quantity} on hand at {unit_cost:.2f} each (new stock {cost:.2f}, price {price:.2f})"
+
+
+# Function to run the commands that work across locations and return the exit code
+def run_location_command(args, locations):
+    if args.command == "transfer":
+        source = locations.find(args.source)
+        target = locations.find(args.target)
+        left, moved_to = locations.transfer(args.item, args.quantity, source, target)
+        item = StockEngine.check_name(args.item)
+        print(f"{source}: {item}: {left}")
+        print(f"{target}: {item}: {moved_to}")
+        return 0
+    if args.command == "export":
+        if os.path.splitext(args.path)[1].lower() == ".json":
+            raise StockError("Reports across locations are written as CSV or HTML.", "Error")
+        sources = [(name, location["file"], location["capacity"]) for name, location in locations.locations.items()]
+        pool = ReportPool()
+        try:
+            job = pool.wait(pool.submit(args.path, "Stock report - all locations", sources))
+        finally:
+            pool.shutdown()
+        if job.error is not None:
+            raise job.error
+        print(f"Exported {job.rows} items from {len(sources)} locations to {args.path}")
+        return 0
+    failed = False
+    for name, (report, error) in locations.load_all().items():
+        if error is not None:
+            print(f"{name}: could not load: {error}", file=sys.stderr)
+            failed = True
+        elif report is not None and report.bad:
+            print(f"{name}: {report.summary()}", file=sys.stderr)
+    totals = locations.totals()
+    for name, total, capacity in totals:
+        print(f"{name}: {total}/{capacity} (Remaining: {max(0, capacity - total)})")
+    print(f"All locations: {sum(total for _, total, _ in totals)}/{sum(capacity for _, _, capacity in totals)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,378 @@
+
+import itertools # For request ids
+import json # For the newline-delimited JSON messages
+import os # For sending the server absolute import paths
+import queue # For handing replies and notifications between threads
+import socket # For the persistent connection to the server
+import threading # For the reader thread and the connection lock
+from datetime import date, datetime # For the dates in history replies
+
+from inventory import Inventory # Local copy of the server's stock
+from alerts import AlertEngine # Alerts worked out from the local copy
+from undo import UndoHistory # Undo/redo of this window's own edits
+from valuation import Valuation # Stock value worked out from the local copy
+from stock_engine import StockEngine, StockError, CapacityError, run_now # Same interface as the local engine
+from stock_server import DEFAULT_ADDRESS, parse_address, encode # Address format and message encoding
+
+# Clients for the local stock server (stock_server.py)
+# StockClient keeps one connection open and sends requests over it; a reader thread passes replies
+# back to the waiting request and notifications to a callback. ClientPool shares a few connections
+# between the threads of a script. RemoteEngine works like StockEngine, so the window and the command
+# line can use the server instead of the stock file without any other changes.
+
+
+# Define the StockClient class for one persistent connection to the server
+class StockClient:
+    # One connection; requests are sent one at a time, notifications go to on_event.
+
+    # Initialize the StockClient with the server address, a notification callback and a reply timeout
+    def __init__(self, address=DEFAULT_ADDRESS, on_event=None, timeout=10.0):
+        self.address = parse_address(address)
+        # on_event(message) is called on the reader thread for every notification
+        self.on_event = on_event
+        self.timeout = timeout
+        self._socket = None
+        # Replies for the current connection (a new queue per connection so old replies can't mix in)
+        self._replies = None
+        # Only one request at a time goes over the connection
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        # How many times we have connected (a reconnect means notifications may have been missed)
+        self.connections = 0
+
+    # Method to open the connection and start the reader thread
+    def connect(self):
+        if isinstance(self.address, tuple):
+            connection = socket.create_connection(self.address, timeout=self.timeout)
+            # Small request/reply messages; don't wait to fill a packet
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(self.timeout)
+            connection.connect(self.address)
+        # The reader thread blocks on it; request() has its own timeout
+        connection.settimeout(None)
+        self._socket = connection
+        self._replies = queue.Queue()
+        self.connections += 1
+        threading.Thread(target=self._read, args=(connection, self._replies), daemon=True).start()
+
+    # Method run by the reader thread: route each line to the waiting request or to on_event
+    def _read(self, connection, replies):
+        try:
+            with connection.makefile("rb") as file:
+                for line in file:
+                    message = json.loads(line)
+                    if "event" in message:
+                        if self.on_event:
+                            self.on_event(message)
+                    else:
+                        replies.put(message)
+        except (OSError, ValueError):
+            pass
+        # Wake a waiting request and tell the owner the connection is gone
+        replies.put(None)
+        if self.on_event:
+            self.on_event({"event": "disconnected"})
+
+    # Method to send one request and return its result (raises StockError/CapacityError like the engine)
+    def request(self, op, **fields):
+        with self._lock:
+            if self._socket is None:
+                self.connect()
+            try:
+                self._socket.sendall(encode(dict(fields, op=op, id=next(self._ids))))
+                reply = self._replies.get(timeout=self.timeout)
+            except queue.Empty:
+                self._disconnect()
+                raise ConnectionError("the stock server did not reply in time")
+            except OSError:
+                self._disconnect()
+                raise
+            if reply is None:
+                self._disconnect()
+                raise ConnectionError("the connection to the stock server was closed")
+        if reply.get("ok"):
+            return reply.get("result")
+        if reply.get("kind") == "capacity":
+            raise CapacityError(reply["error"])
+        if reply.get("kind") == "stock":
+            raise StockError(reply["error"], reply.get("title", "Input Error"))
+        raise IOError(reply.get("error"))
+
+    # Method to close the connection (lock must be held)
+    def _disconnect(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            finally:
+                self._socket = None
+
+    # Method to close the connection
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+
+# Define the ClientPool class that shares persistent connections between threads
+class ClientPool:
+    # Up to size connections, reused instead of connecting for every request.
+
+    # Initialize the ClientPool with the server address and the most connections to open
+    def __init__(self, address=DEFAULT_ADDRESS, size=4, timeout=10.0):
+        self.address = address
+        self.timeout = timeout
+        # Idle connections, most recently used first
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    # Method to send one request on an idle connection (opening one if needed)
+    def request(self, op, **fields):
+        with self._slots:
+            try:
+                client = self._idle.get_nowait()
+            except queue.Empty:
+                client = StockClient(self.address, timeout=self.timeout)
+            try:
+                return client.request(op, **fields)
+            except OSError:
+                # Don't give a broken connection to the next request
+                client.close()
+                client = None
+                raise
+            finally:
+                if client is not None:
+                    self._idle.put(client)
+
+    # Method to close every idle connection
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# Define the RemoteEngine class that works like StockEngine but keeps the stock on the server
+class RemoteEngine(StockEngine):
+    # StockEngine interface over a StockClient, with a local copy kept up to date by notifications.
+
+    # The client is thread-safe, so the GUI may run saves on its persistence worker
+    background_safe = True
+
+    # Initialize the RemoteEngine with the server address and how storage jobs are run
+    def __init__(self, address=DEFAULT_ADDRESS, runner=run_now):
+        self.stock_file = address
+        self.capacity = 0
+        self.runner = runner
+        self.storage = None
+        # The server keeps the movement history
+        self.history = None
+        # Alerts use the server's settings and are updated from the notifications
+        self.alerts = AlertEngine()
+        self.new_alerts = []
+        # Stock value from the server's prices, updated from the notifications
+        self.valuation = Valuation()
+        # Only this client's edits are undone, by sending the opposite changes to the server
+        self.undo_history = UndoHistory()
+        # Batch state the inherited begin_batch()/end_batch()/record() use (as in StockEngine)
+        self._batch = None
+        self._batch_stored = []
+        self._batch_sync = False
+        self.inventory = Inventory(capacity=0)
+        # Notifications from the reader thread, applied on the caller's thread
+        self._events = queue.Queue()
+        # Number of the last notification included in the local copy
+        self.seq = 0
+        # Items changed by notifications since the last poll_changes(), and whether to reload instead
+        self._changed = set()
+        self._reload = False
+        self.client = StockClient(address, on_event=self._events.put)
+        self._connections = 0
+
+    # Method to download the whole stock and subscribe to changes
+    def load(self, progress=None):
+        # Notifications still queued from before are older than the copy about to be downloaded
+        while not self._events.empty():
+            self._events.get_nowait()
+        reply = self.client.request("load", subscribe=True)
+        self._connections = self.client.connections
+        self.capacity = reply["capacity"]
+        self.inventory = Inventory(reply["items"], reply["capacity"])
+        self.alerts = AlertEngine(reply["alert_settings"])
+        self.alerts.rebuild(self.inventory)
+        self._take_prices(reply["prices"])
+        # Notifications up to this number are already in the copy
+        self.seq = reply["seq"]
+        self._changed = set()
+        self._reload = False
+        return None
+
+    # Method to carry on with an empty copy after load failed (every edit is still sent to the server,
+    # and the copy is loaded again once the client reconnects)
+    def start_empty(self):
+        self.inventory = Inventory(capacity=self.capacity)
+        self.alerts.rebuild(self.inventory)
+        self.valuation.rebuild(self.inventory)
+
+    # Method to send a request, turning a lost connection into a StockError the GUI can show
+    def _call(self, op, **fields):
+        try:
+            result = self.client.request(op, **fields)
+        except (ConnectionError, OSError) as error:
+            raise StockError(f"Lost connection to the stock server: {error}", "Connection Error")
+        if self.client.connections != self._connections:
+            # Reconnected, so notifications were missed and the copy has to be loaded again
+            self._reload = True
+        self._apply_events()
+        return result
+
+    # Method to apply the notifications received so far to the local copy
+    def _apply_events(self):
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                return
+            if event["event"] == "disconnected" or event["event"] == "reload":
+                self._reload = True
+            elif event["seq"] > self.seq:
+                for item, quantity in event["items"].items():
+                    # The server sends the new quantity (0 when the item is gone)
+                    if quantity > 0:
+                        self.inventory.set(item, quantity)
+                    else:
+                        self.inventory.discard(item)
+                    self._changed.add(item)
+                    self.new_alerts.extend(self.alerts.update(item, quantity))
+                    self.valuation.update(item, quantity)
+            if "seq" in event:
+                self.seq = max(self.seq, event["seq"])
+
+    # Method to value the local copy with the prices file contents sent by the server
+    def _take_prices(self, prices):
+        self.valuation = Valuation(prices)
+        self.valuation.rebuild(self.inventory)
+
+    # Method to add stock of an item and return its new quantity (the server checks the capacity)
+    def add(self, name, quantity, unit_cost=None):
+        item = self.check_name(name)
+        quantity = self.check_quantity(quantity)
+        unit_cost = self.check_money(unit_cost)
+        if unit_cost is None:
+            # The notification with the new quantity arrives before the reply, so the copy is already current
+            reply = self._call("add", item=item, quantity=quantity)
+        else:
+            # The notification is valued at the new cost, as on the server
+            self.valuation.update(item, self.inventory.get(item), unit_cost)
+            try:
+                reply = self._call("add", item=item, quantity=quantity, unit_cost=unit_cost)
+            except StockError:
+                # Nothing was added; take back the server's costs (or load everything again if that fails too)
+                try:
+                    self._take_prices(self.client.request("prices"))
+                except (ConnectionError, OSError):
+                    self._reload = True
+                raise
+        self.undo_history.push(f"Add {quantity} {item}", [(item, reply["change"])])
+        return reply["quantity"]
+
+    # Method to remove stock of an item and return what is left
+    def remove(self, name, quantity):
+        self.check_name(name)
+        quantity = self.check_quantity(quantity)
+        reply = self._call("remove", item=name, quantity=quantity)
+        self.undo_history.push(f"Remove {-reply['change']} {reply['item']}", [(reply["item"], reply["change"])])
+        return reply["quantity"]
+
+    # Method to add several items in one request (one undo step here); returns {item: new quantity}
+    def add_many(self, quantities, label):
+        additions = {}
+        for name, quantity in quantities.items():
+            item = self.check_name(name)
+            additions[item] = additions.get(item, 0) + self.check_quantity(quantity)
+        new_quantities = self._call("add_many", quantities=additions, label=label)
+        self.undo_history.push(label, additions.items())
+        return new_quantities
+
+    # Method to apply (item, change) pairs on the server; returns the changes actually made (with
+    # on_stored functions the server syncs them to disk before it replies, so they are called straight away)
+    def apply_changes(self, changes, on_stored=(), sync=False):
+        applied = [tuple(change) for change in self._call("apply", changes=list(changes), sync=sync or bool(on_stored))]
+        for stored in on_stored:
+            stored()
+        return applied
+
+    # Method to ask the server to write a snapshot (on_done runs once it is on disk)
+    def save(self, on_done=None):
+        self.runner(lambda: self.client.request("save"), key="save", on_done=on_done)
+
+    # Method to return the items changed on the server since the last call (None = load again)
+    def poll_changes(self):
+        self._apply_events()
+        if self._reload:
+            self._reload = False
+            return None
+        changed, self._changed = self._changed, set()
+        return changed
+
+    # Method to import a CSV/JSON count file on the server (same machine, so the path is shared)
+    def import_file(self, path):
+        result = RemoteImportResult(self._call("import", path=os.path.abspath(path)))
+        if result.applied:
+            self.undo_history.push(f"Import {os.path.basename(path)}", result.quantities.items())
+        return result
+
+    # Method to send new alert settings to the server and work the alerts out again
+    def apply_alert_settings(self, settings):
+        self._call("alert_settings", settings=settings)
+        self.alerts = AlertEngine(settings)
+        self.alerts.rebuild(self.inventory)
+
+    # Method to set an item's unit cost and/or retail price on the server
+    def set_item_price(self, name, cost=None, price=None):
+        cost = self.check_money(cost)
+        price = self.check_money(price, "Price")
+        self._take_prices(self._call("set_price", item=self.check_name(name), cost=cost, price=price))
+
+    # Method to set the costing method on the server
+    def set_costing(self, method):
+        self._take_prices(self._call("costing", method=method))
+
+    # Method to import unit costs and prices on the server (same machine, so the path is shared)
+    def import_prices(self, path):
+        reply = self._call("import_prices", path=os.path.abspath(path))
+        self._take_prices(reply["prices"])
+        return reply["count"]
+
+    # Method to return [(item, in, out)] for the last few days from the server
+    def movement_report(self, days=7):
+        return [tuple(row) for row in self._call("report", days=days)]
+
+    # Method to return an item's history from the server
+    def item_history(self, name, days=14, weeks=8, limit=20):
+        history = self._call("history", item=self.check_name(name))
+        return {
+            "days": [(date.fromisoformat(day), moved_in, moved_out) for day, moved_in, moved_out in history["days"]],
+            "weeks": [(date.fromisoformat(day), moved_in, moved_out) for day, moved_in, moved_out in history["weeks"]],
+            "recent": [(datetime.fromisoformat(when), delta) for when, delta in history["recent"]],
+        }
+
+    # Method to close the connection
+    def close(self):
+        self.client.close()
+
+
+# Define the RemoteImportResult class with the parts of ImportResult the GUI and CLI use
+class RemoteImportResult:
+    # Whether the server applied the import, and its summary text.
+
+    # Initialize the RemoteImportResult with the server's reply
+    def __init__(self, reply):
+        self.applied = reply["applied"]
+        self.quantities = reply.get("quantities", {})
+        self._summary = reply["summary"]
+
+    # Method to return the summary message
+    def summary(self):
+        return self._summary
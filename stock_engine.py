@@ -0,0 +1,543 @@
+
+import csv # For reading price files
+import json # For JSON export
+import os # For checking the file extension
+import time # For the time of each movement
+from datetime import date, timedelta # For report date ranges
+
+from inventory import Inventory # In-memory stock model with a running total
+from storage import open_storage # JSON (with journal) or SQLite storage backend
+from bulk_import import import_file # Validated, all-or-nothing import of count files
+from history import MovementHistory # Log of every movement with daily/weekly totals
+from alerts import AlertEngine, load_settings, save_settings, check_settings # Reorder levels and category capacities
+from undo import UndoHistory # Undo/redo of stock edits as stored changes
+from reports import write_report # Streaming CSV/HTML reports
+from valuation import Valuation, load_prices, save_prices # Stock value at cost and at retail
+from forecast import HISTORY_DAYS, COVER_DAYS, forecast_rates, save_forecast, load_forecast, suggest_orders # Demand forecasts
+
+# Headless inventory engine for the stocktaking app
+# All the stock rules (names are lowercased, quantities must be positive, the total can't go over the
+# capacity) live here with no tkinter import, so the same code runs behind the GUI, the command line
+# (stock_cli.py), nightly batch jobs and the benchmarks. Problems are raised as StockError with the
+# same wording the GUI shows in its message boxes.
+
+
+# Define the StockError class for any rule the user broke (bad input, unknown item, over capacity)
+class StockError(Exception):
+    # The message is meant to be shown to the user as-is.
+
+    # Initialize the StockError with the message and the title the GUI uses for its popup
+    def __init__(self, message, title="Input Error"):
+        super().__init__(message)
+        self.title = title
+
+
+# Define the CapacityError class for adds that would go over total_capacity (the GUI shows a warning)
+class CapacityError(StockError):
+    # Raised when an add would exceed the capacity.
+
+    # Initialize the CapacityError with the message
+    def __init__(self, message):
+        super().__init__(message, "Capacity Warning")
+
+
+# Function that runs a storage job straight away (the default; the GUI passes its background worker)
+def run_now(job, key=None, on_done=None):
+    result = job()
+    if on_done:
+        on_done(result)
+
+
+# Define the StockEngine class that owns the inventory and its storage
+class StockEngine:
+    # Stock operations with validation, storage and import/export, without any GUI.
+
+    # Initialize the StockEngine with the stock file, the capacity and how storage jobs are run
+    def __init__(self, stock_file="stock_data.json", capacity=1000, runner=run_now):
+        self.stock_file = stock_file
+        self.capacity = capacity
+        # runner(job, key, on_done) runs a storage job; the GUI hands these to its persistence worker
+        self.runner = runner
+        self.storage = open_storage(stock_file)
+        self.inventory = Inventory(capacity=capacity)
+        # Every add/remove/import is also logged with its time for movement reports
+        self.history = MovementHistory(stock_file + ".history")
+        # Reorder levels, categories and category capacities, checked for each item that changes
+        self.alert_settings_file = stock_file + ".alerts.json"
+        self.alerts = AlertEngine(load_settings(self.alert_settings_file))
+        # Unit costs, retail prices and costing method, kept up to date for each item that changes
+        self.prices_file = stock_file + ".prices.json"
+        self.valuation = Valuation(load_prices(self.prices_file))
+        # Demand rates fitted from the movement history (read from the cache file when first needed)
+        self.forecast_file = stock_file + ".forecast.json"
+        self._forecast = None
+        # Alert messages not yet shown to the user (see take_alerts)
+        self.new_alerts = []
+        # Edits that can be undone and redone
+        self.undo_history = UndoHistory()
+        # Changes collected between begin_batch() and end_batch() (None when not batching), the
+        # functions to call once they are stored, and whether they have to be synced to disk
+        self._batch = None
+        self._batch_stored = []
+        self._batch_sync = False
+
+    # Property for whether storage jobs may run on a background thread
+    @property
+    def background_safe(self):
+        return self.storage.background_safe
+
+    # Method to load the stock from storage (returns the load report for the JSON backend, else None)
+    def load(self, progress=None):
+        self.inventory = self.storage.load(self.capacity, progress=progress)
+        # One pass over the stock after loading; after that only changed items are checked
+        self.alerts.rebuild(self.inventory)
+        self.valuation.rebuild(self.inventory)
+        return getattr(self.storage, "report", None)
+
+    # Method to carry on with the storage's empty inventory after load failed, so edits are still stored
+    def start_empty(self):
+        self.inventory = self.storage.empty_inventory(self.capacity)
+        self.alerts.rebuild(self.inventory)
+        self.valuation.rebuild(self.inventory)
+
+    # Method to check a user-entered item name and return the normalised key
+    @staticmethod
+    def check_name(name):
+        item = Inventory.normalise(name) if name is not None else ""
+        if not item:
+            raise StockError("Item name cannot be empty.")
+        return item
+
+    # Method to check a user-entered quantity and return it as an int
+    @staticmethod
+    def check_quantity(quantity):
+        try:
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            raise StockError("Quantity must be a positive integer.")
+        if quantity <= 0:
+            raise StockError("Quantity must be a positive integer.")
+        return quantity
+
+    # Method to check that a quantity of an item fits, raising CapacityError if it doesn't
+    def check_room(self, item, quantity):
+        # O(1) capacity check using the running total
+        if not self.inventory.can_add(quantity):
+            raise CapacityError(
+                f"Adding {quantity} would exceed capacity ({self.capacity}). Max add: {self.inventory.remaining()}."
+            )
+        # O(1) check of the item's category, using the category's running total
+        room = self.alerts.category_room(item)
+        if room is not None and quantity > room:
+            category = self.alerts.category_of(item)
+            capacity = self.alerts.settings["category_capacities"][category]
+            raise CapacityError(
+                f"Adding {quantity} would exceed the '{category}' capacity ({capacity}). Max add: {max(0, room)}."
+            )
+
+    # Method to check a user-entered unit cost or price and return it as a float (None stays None)
+    @staticmethod
+    def check_money(amount, what="Cost"):
+        if amount is None or amount == "":
+            return None
+        try:
+            amount = float(amount)
+        except (TypeError, ValueError):
+            raise StockError(f"{what} must be a number of 0 or more.")
+        # Also turns away NaN and infinity
+        if not 0 <= amount < float("inf"):
+            raise StockError(f"{what} must be a number of 0 or more.")
+        return amount
+
+    # Method to add stock of an item and return its new quantity; unit_cost is what this stock cost
+    # (default: the item's current cost)
+    def add(self, name, quantity, unit_cost=None):
+        item = self.check_name(name)
+        quantity = self.check_quantity(quantity)
+        unit_cost = self.check_money(unit_cost)
+        self.check_room(item, quantity)
+        new_quantity = self.inventory.add(item, quantity)
+        self.record([(item, quantity)])
+        self.undo_history.push(f"Add {quantity} {item}", [(item, quantity)])
+        # Value the new stock at its own cost (check_alerts would use the item's current cost)
+        self.valuation.update(item, new_quantity, unit_cost)
+        self.check_alerts([item])
+        return new_quantity
+
+    # Method to remove stock of an item and return what is left (removing more than there is removes all)
+    def remove(self, name, quantity):
+        item = self.check_name(name)
+        if item not in self.inventory:
+            raise StockError(f"Item '{name}' not found in stock.", "Not Found")
+        quantity = self.check_quantity(quantity)
+        current = self.inventory[item]
+        remaining = self.inventory.remove(item, quantity)
+        # Store the change rather than the result, so other terminals' changes to the item add up
+        self.record([(item, remaining - current)])
+        # The actual change is stored, so undoing a "remove everything" puts back exactly what was there
+        self.undo_history.push(f"Remove {current - remaining} {item}", [(item, remaining - current)])
+        self.check_alerts([item])
+        return remaining
+
+    # Method to check that several additions ({item: quantity}) fit together, in the capacity and in each
+    # item's category, raising CapacityError if they don't
+    def check_room_many(self, additions):
+        added = sum(additions.values())
+        if not self.inventory.can_add(added):
+            raise CapacityError(f"Adding {added} would exceed capacity ({self.capacity}). Max add: {self.inventory.remaining()}.")
+        # Check each category against everything being added to it
+        by_category = {}
+        for item, quantity in additions.items():
+            category = self.alerts.category_of(item)
+            if category is not None:
+                by_category[category] = by_category.get(category, 0) + quantity
+        for category, quantity in by_category.items():
+            capacity = self.alerts.settings["category_capacities"].get(category)
+            if capacity is not None and quantity > capacity - self.alerts.category_totals.get(category, 0):
+                room = capacity - self.alerts.category_totals.get(category, 0)
+                raise CapacityError(
+                    f"Adding {quantity} would exceed the '{category}' capacity ({capacity}). Max add: {max(0, room)}."
+                )
+
+    # Method to return why several additions don't fit (None if they do), for imports
+    def _room_problem(self, additions):
+        try:
+            self.check_room_many(additions)
+        except CapacityError as error:
+            return str(error)
+        return None
+
+    # Method to add several items at once (e.g. a run of barcode scans) as one stored step and one undo
+    # step; all or nothing. Returns {item: new quantity}
+    def add_many(self, quantities, label):
+        additions = {}
+        for name, quantity in quantities.items():
+            item = self.check_name(name)
+            additions[item] = additions.get(item, 0) + self.check_quantity(quantity)
+        self.check_room_many(additions)
+        new_quantities = {item: self.inventory.add(item, quantity) for item, quantity in additions.items()}
+        self.record(list(additions.items()))
+        self.undo_history.push(label, additions.items())
+        self.check_alerts(additions)
+        return new_quantities
+
+    # Method to apply (item, change) pairs as one stored step; returns the changes actually made
+    # (removals stop at what is in stock), used by undo/redo and transfers. on_stored functions are
+    # called (on the storage job's thread) once the step is synced to disk; sync syncs it without any.
+    def apply_changes(self, changes, on_stored=(), sync=False):
+        changes = [(self.check_name(item), int(delta)) for item, delta in changes]
+        # Only the additions can run into the capacity or a category's capacity
+        additions = {}
+        for item, delta in changes:
+            if delta > 0:
+                additions[item] = additions.get(item, 0) + delta
+        self.check_room_many(additions)
+        applied = []
+        for item, delta in changes:
+            if delta > 0:
+                self.inventory.add(item, delta)
+                applied.append((item, delta))
+            elif delta < 0 and item in self.inventory:
+                before = self.inventory[item]
+                applied.append((item, self.inventory.remove(item, -delta) - before))
+        self.record(applied, on_stored, sync)
+        self.check_alerts([item for item, _ in applied])
+        return applied
+
+    # Method to undo the last step; returns (label, items changed)
+    def undo(self):
+        if self.undo_history.undo_label() is None:
+            raise StockError("Nothing to undo.", "Undo")
+        label, changes = self.undo_history.pop_undo()
+        try:
+            applied = self.apply_changes([(item, -delta) for item, delta in reversed(changes)])
+        except StockError:
+            # Leave the step where it was so it can be tried again
+            self.undo_history.push_undo(label, changes)
+            raise
+        # Redo re-applies the opposite of what the undo actually did
+        self.undo_history.push_redo(label, [(item, -delta) for item, delta in reversed(applied)])
+        return label, [item for item, _ in applied]
+
+    # Method to redo the last undone step; returns (label, items changed)
+    def redo(self):
+        if self.undo_history.redo_label() is None:
+            raise StockError("Nothing to redo.", "Redo")
+        label, changes = self.undo_history.pop_redo()
+        try:
+            applied = self.apply_changes(changes)
+        except StockError:
+            self.undo_history.push_redo(label, changes)
+            raise
+        self.undo_history.push_undo(label, applied)
+        return label, [item for item, _ in applied]
+
+    # Method to update the alerts and the stock value for the items that changed (only those items are looked at)
+    def check_alerts(self, items):
+        for item in items:
+            quantity = self.inventory.get(item)
+            self.new_alerts.extend(self.alerts.update(item, quantity))
+            self.valuation.update(item, quantity)
+
+    # Method to return the alert messages raised since the last call
+    def take_alerts(self):
+        messages, self.new_alerts = self.new_alerts, []
+        return messages
+
+    # Method to return [(item, quantity, reorder level)] for items to reorder, most urgent first
+    def reorder_list(self, limit=None):
+        return self.alerts.reorder_list(limit)
+
+    # Method to set an item's reorder level (0 turns its alert off)
+    def set_reorder_level(self, name, level):
+        item = self.check_name(name)
+        settings = self._copy_alert_settings()
+        if int(level) < 0:
+            raise StockError("Reorder level cannot be negative.")
+        settings["reorder_levels"][item] = int(level)
+        self.apply_alert_settings(settings)
+
+    # Method to put an item in a category (an empty category takes it out)
+    def set_category(self, name, category):
+        item = self.check_name(name)
+        settings = self._copy_alert_settings()
+        category = Inventory.normalise(category or "")
+        if category:
+            settings["item_categories"][item] = category
+        else:
+            settings["item_categories"].pop(item, None)
+        self.apply_alert_settings(settings)
+
+    # Method to set a category's capacity (None removes the limit)
+    def set_category_capacity(self, category, capacity):
+        category = self.check_name(category)
+        settings = self._copy_alert_settings()
+        if capacity is None:
+            settings["category_capacities"].pop(category, None)
+        elif int(capacity) < 0:
+            raise StockError("Capacity cannot be negative.")
+        else:
+            settings["category_capacities"][category] = int(capacity)
+        self.apply_alert_settings(settings)
+
+    # Method to return a copy of the alert settings that can be changed without affecting the engine
+    def _copy_alert_settings(self):
+        return {key: (value.copy() if isinstance(value, dict) else value) for key, value in self.alerts.settings.items()}
+
+    # Method to save new alert settings and work the alerts out again
+    def apply_alert_settings(self, settings):
+        try:
+            check_settings(settings)
+        except ValueError as error:
+            raise StockError(str(error))
+        save_settings(self.alert_settings_file, settings)
+        self.alerts = AlertEngine(settings)
+        self.alerts.rebuild(self.inventory)
+
+    # Method to set an item's unit cost and/or retail price (None leaves it as it is); a new cost values the
+    # stock on hand at that cost
+    def set_item_price(self, name, cost=None, price=None):
+        item = self.check_name(name)
+        cost = self.check_money(cost)
+        price = self.check_money(price, "Price")
+        if cost is None and price is None:
+            raise StockError("Enter a cost, a price or both.")
+        self.valuation.set_price(item, self.inventory.get(item), cost, price)
+        save_prices(self.prices_file, self.valuation.to_dict())
+
+    # Method to set the costing method ("average" or "fifo")
+    def set_costing(self, method):
+        try:
+            self.valuation.set_method(method)
+        except ValueError as error:
+            raise StockError(str(error))
+        save_prices(self.prices_file, self.valuation.to_dict())
+
+    # Method to import unit costs and prices from a CSV file of "item,cost,price" rows (either may be left
+    # empty); all or nothing. Returns the number of items priced
+    def import_prices(self, path):
+        prices = {}
+        try:
+            with open(path, "r", newline="", encoding="utf-8-sig") as file:
+                for line, row in enumerate(csv.reader(file), 1):
+                    if not row or (line == 1 and row[0].strip().lower() in ("item", "name")):
+                        continue
+                    row = row + [""] * (3 - len(row))
+                    try:
+                        item = self.check_name(row[0])
+                        prices[item] = (self.check_money(row[1].strip()), self.check_money(row[2].strip(), "Price"))
+                    except StockError as error:
+                        raise StockError(f"Line {line} of {os.path.basename(path)}: {error}", "Import Error")
+        except OSError as error:
+            raise StockError(f"Could not read {path}: {error}", "Import Error")
+        self.valuation.set_prices(prices, self.inventory)
+        save_prices(self.prices_file, self.valuation.to_dict())
+        return len(prices)
+
+    # Method to return (stock value at cost, stock value at retail)
+    def stock_value(self):
+        return self.valuation.total_cost, self.valuation.total_retail
+
+    # Method to return [(item, quantity, value at cost, value at retail)], highest value at cost first
+    def valuation_rows(self, limit=None):
+        return self.valuation.rows(limit)
+
+    # Method to fit every item's demand rate from the movement history and cache it; returns the forecast
+    def run_forecast(self, method="smoothing", days=HISTORY_DAYS, workers=None):
+        if self.history is None:
+            raise StockError("Forecasts are made from the movement history kept with the stock file.", "Forecast")
+        try:
+            rates = forecast_rates(self.history, method, days, workers=workers)
+        except ValueError as error:
+            raise StockError(str(error))
+        self._forecast = save_forecast(self.forecast_file, rates, method, days)
+        return self._forecast
+
+    # Method to return the cached forecast ({"made", "method", "days", "rates"}), or None if there isn't one
+    def cached_forecast(self):
+        if self.history is None:
+            raise StockError("Forecasts are made from the movement history kept with the stock file.", "Forecast")
+        if self._forecast is None:
+            self._forecast = load_forecast(self.forecast_file)
+        return self._forecast
+
+    # Method to read the cached forecast again (after it was worked out in another process)
+    def reload_forecast(self):
+        self._forecast = None
+        return self.cached_forecast()
+
+    # Method to return [(item, quantity, units per day, days left, quantity to order)] from the cached
+    # forecast, within the remaining capacity, the items that run out soonest first
+    def reorder_suggestions(self, cover_days=COVER_DAYS, limit=None):
+        forecast = self.cached_forecast()
+        if forecast is None:
+            raise StockError("No forecast yet. Work out the demand first.", "Forecast")
+        return suggest_orders(forecast["rates"], self.inventory, self.remaining(), self.alerts, cover_days, limit)
+
+    # Method to store a list of (item, change in quantity) pairs, then call the on_stored functions.
+    # Whoever passes on_stored relies on the changes surviving a power cut once they are called, so the
+    # storage syncs them to disk first (as it does when sync is set) instead of in its next batch.
+    def record(self, changes, on_stored=(), sync=False):
+        sync = sync or bool(on_stored)
+        if self._batch is not None:
+            # Stored together by end_batch()
+            self._batch.extend(changes)
+            self._batch_stored.extend(on_stored)
+            self._batch_sync = self._batch_sync or sync
+            return
+        # The time is taken now, not when the (possibly queued) write runs
+        when = time.time()
+
+        # Job that logs the movements and stores the changes; the backend returns True when it is
+        # time to write a full snapshot
+        def write():
+            self.history.record_many(changes, when)
+            needed = self.storage.record_many(changes, sync)
+            for stored in on_stored:
+                stored()
+            return needed
+
+        self.runner(write, on_done=self._compact_if_needed)
+
+    # Method to start collecting changes so several operations are stored with one write
+    def begin_batch(self):
+        self._batch = []
+        self._batch_stored = []
+        self._batch_sync = False
+
+    # Method to store the changes collected since begin_batch() and stop collecting
+    def end_batch(self):
+        changes, self._batch = self._batch, None
+        on_stored, self._batch_stored = self._batch_stored, []
+        sync, self._batch_sync = self._batch_sync, False
+        if changes or on_stored:
+            self.record(changes, on_stored, sync)
+
+    # Method called with the result of record()
+    def _compact_if_needed(self, needed):
+        if needed:
+            self.save()
+
+    # Method to write a full snapshot / commit (on_done runs after the write)
+    def save(self, on_done=None):
+        if self._batch:
+            # Store the collected changes first so the snapshot includes them
+            self.end_batch()
+            self.begin_batch()
+        # The snapshot is built from everything stored so far (including other terminals' changes),
+        # and saves of this stock file waiting under the same key are coalesced into one write
+        # The prices are copied now, on this thread, so the job doesn't read them while they change
+        prices = self.valuation.to_dict() if self.valuation.has_prices() else None
+        self.runner(lambda: self._write_snapshot(prices), key=("save", self.stock_file), on_done=on_done)
+
+    # Method run by save(): write the snapshot, the prices and cost layers, and checkpoint the movement totals
+    def _write_snapshot(self, prices=None):
+        self.storage.save()
+        if prices is not None:
+            save_prices(self.prices_file, prices)
+        self.history.checkpoint()
+
+    # Method to pick up changes other terminals made; returns the changed items (None = reload everything)
+    def poll_changes(self):
+        changed = self.storage.poll(self.inventory)
+        if changed:
+            self.check_alerts(changed)
+        return changed
+
+    # Method to close the storage files/connection
+    def close(self):
+        self.storage.close()
+
+    # Method to return the total quantity of all items
+    def total(self):
+        return self.inventory.total()
+
+    # Method to return how much more stock fits
+    def remaining(self):
+        return self.inventory.remaining()
+
+    # Method to return the quantity of one item (0 if it doesn't exist)
+    def get(self, name):
+        return self.inventory.get(name)
+
+    # Method to return all (item, quantity) pairs sorted by name
+    def sorted_items(self):
+        return self.inventory.sorted_items()
+
+    # Method to return [(item, in, out)] for the last few days, biggest movers out first
+    def movement_report(self, days=7):
+        today = date.today()
+        totals = self.history.totals(today - timedelta(days=days - 1), today)
+        return sorted(((item, moved[0], moved[1]) for item, moved in totals.items()), key=lambda row: (-row[2], row[0]))
+
+    # Method to return an item's daily and weekly (date, in, out) buckets and its latest movements
+    def item_history(self, name, days=14, weeks=8, limit=20):
+        item = self.check_name(name)
+        return {
+            "days": self.history.item_days(item, days),
+            "weeks": self.history.item_weeks(item, weeks),
+            "recent": self.history.recent(item, limit),
+        }
+
+    # Method to import a CSV/JSON count file in one transaction and save once at the end
+    def import_file(self, path):
+        result = import_file(path, self.inventory, self._room_problem)
+        if result.applied:
+            # One journal write for the whole file, then one snapshot
+            self.record(list(result.quantities.items()))
+            # The whole import is one undo step
+            self.undo_history.push(f"Import {os.path.basename(path)}", result.quantities.items())
+            self.check_alerts(result.quantities)
+            self.save()
+        return result
+
+    # Method to export the stock to a CSV, HTML or JSON file (chosen by the file extension);
+    # progress(rows done, rows expected) is called while CSV and HTML rows are written
+    def export_file(self, path, title="Stock report", progress=None):
+        items = self.sorted_items()
+        if os.path.splitext(path)[1].lower() == ".json":
+            with open(path, "w") as file:
+                json.dump(dict(items), file, indent=4)
+            return len(items)
+        # CSV and HTML rows are streamed to the file one at a time
+        return write_report(path, title, ["item", "quantity"], items, progress, len(items))
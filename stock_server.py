@@ -0,0 +1,394 @@
+
+import argparse # For the command line options
+import asyncio # For serving many terminals from one thread
+import json # For the newline-delimited JSON messages
+import os # For removing a stale Unix socket file
+import signal # For stopping cleanly when the service manager asks
+import sys # For exit codes and error output
+import traceback # For logging requests that failed in an unexpected way
+from concurrent.futures import ThreadPoolExecutor # For journal/snapshot writes off the event loop
+
+from stock_engine import StockEngine, StockError, CapacityError # Headless inventory engine (no tkinter)
+from undo import UndoHistory # Undo is kept by each client, so the server's own history holds nothing
+
+# Local stock server for the stocktaking app
+# One process owns the stock (and the stock file); every counter's window and the command line talk to
+# it over a persistent connection instead of each reading and writing stock_data.json. Requests from
+# every connection go through one queue, so adds and removes are applied strictly one after another,
+# and whatever has queued up is applied as one batch with one journal write. After each batch every
+# subscribed window is sent the new quantities of the items that changed.
+#
+# Messages are one JSON object per line:
+#   request:       {"id": 1, "op": "add", "item": "rice", "quantity": 5}
+#   reply:         {"id": 1, "ok": true, "result": {"item": "rice", "quantity": 15}}
+#   error reply:   {"id": 1, "ok": false, "kind": "capacity", "title": "Capacity Warning", "error": "..."}
+#   notification:  {"event": "changed", "seq": 7, "items": {"rice": 15}, "total": 240}
+# Operations: load (with "subscribe": true for notifications), add, remove, total, save, import,
+# report (movement totals for the last "days"), history (one item's buckets and latest movements),
+# alert_settings (replace the reorder levels / categories / category capacities), apply (a list of
+# [item, change] pairs, used for undo/redo and transfers; with "sync": true the reply waits until they
+# are synced to disk), and set_price, costing and import_prices (which reply with
+# the whole prices file so the client can value its copy; prices just returns it). add takes an
+# optional "unit_cost".
+# Notifications are always sent before the replies of the same batch.
+# Examples:
+#   python stock_server.py                                  (127.0.0.1:8765, stock_data.json)
+#   python stock_server.py --file stock_data.db --address /tmp/stock.sock
+
+# Where the server listens unless told otherwise ("host:port", or a Unix socket path)
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+# At most this many queued requests are applied as one batch
+MAX_BATCH = 500
+# How often the stock file is checked for changes made without the server (e.g. stock_cli.py --file)
+POLL_SECONDS = 2.0
+# Longest request line accepted (import paths, long item names)
+LINE_LIMIT = 1024 * 1024
+
+
+# Function to turn "host:port" into a (host, port) tuple; anything else is a Unix socket path
+def parse_address(address):
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit():
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+# Function to return a field of a request, checking its type (a malformed request is a ValueError, which
+# is sent back as an error reply); default is used when the field is missing
+def field(request, name, kinds, default=None):
+    kinds = kinds if isinstance(kinds, tuple) else (kinds,)
+    value = request.get(name, default)
+    # JSON true/false would otherwise pass as the numbers 1 and 0
+    if not isinstance(value, kinds) or (isinstance(value, bool) and bool not in kinds):
+        raise ValueError(f"Bad request: \"{name}\" is missing or has the wrong type.")
+    return value
+
+
+# Function to encode one message as a JSON line
+def encode(message):
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode()
+
+
+# Define the StockServer class that serves one StockEngine to many connections
+class StockServer:
+    # Asyncio server that serialises and batches stock changes and pushes notifications.
+
+    # Initialize the StockServer with the engine it owns and the address to listen on
+    def __init__(self, engine, address=DEFAULT_ADDRESS):
+        self.engine = engine
+        # Storage jobs run on one worker thread so they stay in order without blocking the event loop
+        self.engine.runner = self.run_job
+        self.engine.undo_history = UndoHistory(max_changes=0)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.address = parse_address(address)
+        # Queue of (writer, request) from every connection (created once the event loop is running)
+        self.requests = None
+        # Connections that asked for change notifications
+        self.subscribers = set()
+        # Number of the last notification, so a client can tell which ones its load already includes
+        self.seq = 0
+        # Storage jobs still running on the worker thread
+        self.pending = set()
+        self.server = None
+        self.tasks = []
+
+    # Method the engine uses to run a storage job (on the worker thread if the backend allows it)
+    def run_job(self, job, key=None, on_done=None):
+        if not self.engine.background_safe:
+            result = job()
+            if on_done:
+                on_done(result)
+            return
+        future = asyncio.get_running_loop().run_in_executor(self.executor, job)
+        self.pending.add(future)
+        # Done callbacks run on the event loop thread, where the engine lives
+        future.add_done_callback(lambda done: self._job_done(done, on_done))
+
+    # Method called on the event loop when a storage job has finished
+    def _job_done(self, future, on_done):
+        self.pending.discard(future)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            print(f"Error saving: {error}", file=sys.stderr)
+        elif on_done:
+            on_done(future.result())
+
+    # Method to wait until every queued storage job is written, raising the first error
+    async def wait_for_writes(self):
+        while self.pending:
+            results = await asyncio.gather(*list(self.pending), return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+
+    # Method to start listening and processing requests
+    async def start(self):
+        self.requests = asyncio.Queue()
+        if isinstance(self.address, tuple):
+            self.server = await asyncio.start_server(self.handle, *self.address, limit=LINE_LIMIT)
+        else:
+            # A socket file left by a server that crashed would stop us binding
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+            self.server = await asyncio.start_unix_server(self.handle, self.address, limit=LINE_LIMIT)
+        self.tasks = [asyncio.create_task(self.process()), asyncio.create_task(self.poll_storage())]
+
+    # Property for the address actually listened on ("host:port" with the real port, or the socket path)
+    @property
+    def bound_address(self):
+        name = self.server.sockets[0].getsockname()
+        return f"{name[0]}:{name[1]}" if isinstance(name, tuple) else name
+
+    # Method to stop serving, write everything out and close the stock file
+    async def stop(self):
+        self.server.close()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        for writer in list(self.subscribers):
+            writer.close()
+        self.subscribers.clear()
+        try:
+            self.engine.end_batch()
+            self.engine.save()
+            await self.wait_for_writes()
+        finally:
+            self.executor.shutdown(wait=True)
+            self.engine.close()
+            if not isinstance(self.address, tuple) and os.path.exists(self.address):
+                os.unlink(self.address)
+
+    # Method to serve until cancelled (Ctrl+C), then stop cleanly
+    async def serve(self):
+        await self.start()
+        print(f"Stock server listening on {self.bound_address}", flush=True)
+        try:
+            # Treat "kill"/service stop like Ctrl+C so the stock is saved (not available on Windows)
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except NotImplementedError:
+            pass
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    # Method to read requests from one connection and queue them
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError:
+                    writer.write(encode({"id": None, "ok": False, "kind": "stock", "title": "Input Error", "error": "Bad request."}))
+                    continue
+                if isinstance(request, dict):
+                    await self.requests.put((writer, request))
+        except (ConnectionError, ValueError):
+            # Connection dropped, or a line over LINE_LIMIT
+            pass
+        finally:
+            self.subscribers.discard(writer)
+            writer.close()
+
+    # Method to apply queued requests in batches, one batch at a time
+    async def process(self):
+        while True:
+            batch = [await self.requests.get()]
+            while len(batch) < MAX_BATCH and not self.requests.empty():
+                batch.append(self.requests.get_nowait())
+            changed = set()
+            replies = []
+            # Every change in the batch goes to the journal in one write
+            self.engine.begin_batch()
+            try:
+                for writer, request in batch:
+                    reply = {"id": request.get("id"), "ok": True}
+                    try:
+                        reply["result"] = await self.apply(writer, request, changed)
+                    except CapacityError as error:
+                        reply.update(ok=False, kind="capacity", title=error.title, error=str(error))
+                    except StockError as error:
+                        reply.update(ok=False, kind="stock", title=error.title, error=str(error))
+                    except (IOError, ValueError) as error:
+                        reply.update(ok=False, kind="io", title="Error", error=str(error))
+                    except Exception as error:
+                        # A bug or a request nobody expected: log it and answer, so the loop keeps serving
+                        print(f"Request {request.get('op')!r} failed:", file=sys.stderr)
+                        traceback.print_exc()
+                        reply.update(ok=False, kind="io", title="Error", error=f"The server could not handle the request: {error}")
+                    if writer is not None:
+                        replies.append((writer, reply))
+            finally:
+                self.engine.end_batch()
+                # Alerts are shown by each client from its own copy
+                self.engine.take_alerts()
+            if changed:
+                self.notify("changed", items={item: self.engine.get(item) for item in changed})
+            for writer, reply in replies:
+                await self.send(writer, reply)
+
+    # Method to apply one request and return its result (writer is None for the server's own requests)
+    async def apply(self, writer, request, changed):
+        op = request.get("op")
+        if op == "add":
+            item = self.engine.check_name(field(request, "item", str))
+            quantity = field(request, "quantity", int)
+            new_quantity = self.engine.add(item, quantity, field(request, "unit_cost", (int, float, type(None))))
+            changed.add(item)
+            return {"item": item, "quantity": new_quantity, "change": quantity}
+        if op == "remove":
+            item = self.engine.check_name(field(request, "item", str))
+            current = self.engine.get(item)
+            remaining = self.engine.remove(item, field(request, "quantity", int))
+            changed.add(item)
+            return {"item": item, "quantity": remaining, "change": remaining - current}
+        if op == "add_many":
+            # A committed run of barcode scans, all or nothing
+            quantities = field(request, "quantities", dict)
+            if not all(isinstance(quantity, int) and not isinstance(quantity, bool) for quantity in quantities.values()):
+                raise ValueError("Bad request: \"quantities\" must map each item to a whole number.")
+            quantities = self.engine.add_many(quantities, field(request, "label", str, "Add"))
+            changed.update(quantities)
+            return quantities
+        if op == "load":
+            if request.get("subscribe"):
+                self.subscribers.add(writer)
+            return {
+                "items": self.engine.inventory.to_dict(),
+                "capacity": self.engine.capacity,
+                "alert_settings": self.engine.alerts.settings,
+                "prices": self.engine.valuation.to_dict(),
+                "seq": self.seq,
+            }
+        if op == "total":
+            return {"total": self.engine.total(), "capacity": self.engine.capacity, "remaining": self.engine.remaining()}
+        if op == "save":
+            # Reply only once the snapshot is on disk
+            self.engine.save()
+            await self.wait_for_writes()
+            return None
+        if op == "import":
+            result = self.engine.import_file(field(request, "path", str))
+            if result.applied:
+                changed.update(result.quantities)
+            return {"applied": result.applied, "quantities": result.quantities, "summary": result.summary()}
+        if op == "apply":
+            # Undo/redo from a client (each client keeps its own undo history)
+            changes = field(request, "changes", list)
+            for change in changes:
+                if not (isinstance(change, list) and len(change) == 2 and isinstance(change[0], str)
+                        and isinstance(change[1], int) and not isinstance(change[1], bool)):
+                    raise ValueError("Bad request: \"changes\" must be a list of [item, change] pairs.")
+            sync = field(request, "sync", bool, False)
+            applied = self.engine.apply_changes(changes, sync=sync)
+            changed.update(item for item, _ in applied)
+            if sync:
+                # Store the batch so far now and reply only once it is on disk
+                self.engine.end_batch()
+                self.engine.begin_batch()
+                await self.wait_for_writes()
+            return applied
+        if op == "alert_settings":
+            self.engine.apply_alert_settings(field(request, "settings", dict))
+            return None
+        if op == "set_price":
+            self.engine.set_item_price(
+                field(request, "item", str),
+                field(request, "cost", (int, float, type(None))),
+                field(request, "price", (int, float, type(None))),
+            )
+            return self.engine.valuation.to_dict()
+        if op == "costing":
+            self.engine.set_costing(field(request, "method", str))
+            return self.engine.valuation.to_dict()
+        if op == "import_prices":
+            count = self.engine.import_prices(field(request, "path", str))
+            return {"count": count, "prices": self.engine.valuation.to_dict()}
+        if op == "prices":
+            return self.engine.valuation.to_dict()
+        if op == "report":
+            return self.engine.movement_report(field(request, "days", int, 7))
+        if op == "history":
+            history = self.engine.item_history(field(request, "item", str))
+            # Dates as ISO text for JSON
+            return {
+                "days": [(day.isoformat(), moved_in, moved_out) for day, moved_in, moved_out in history["days"]],
+                "weeks": [(day.isoformat(), moved_in, moved_out) for day, moved_in, moved_out in history["weeks"]],
+                "recent": [(when.isoformat(), delta) for when, delta in history["recent"]],
+            }
+        if op == "poll" and writer is None:
+            await self.apply_poll(changed)
+            return None
+        raise StockError(f"Unknown request '{op}'.")
+
+    # Method to take in changes made to the stock file without the server
+    async def apply_poll(self, changed):
+        items = self.engine.poll_changes()
+        if items is not None:
+            changed.update(items)
+            return
+        # Too much changed to follow; load everything again once our own writes are done
+        self.engine.end_batch()
+        await self.wait_for_writes()
+        self.engine.load()
+        self.engine.begin_batch()
+        self.notify("reload")
+
+    # Method to queue a check of the stock file every POLL_SECONDS (it runs in order with the requests)
+    async def poll_storage(self):
+        while True:
+            await asyncio.sleep(POLL_SECONDS)
+            await self.requests.put((None, {"op": "poll"}))
+
+    # Method to send a notification to every subscribed connection
+    def notify(self, event, **fields):
+        self.seq += 1
+        data = encode(dict(fields, event=event, seq=self.seq, total=self.engine.total()))
+        for writer in list(self.subscribers):
+            if writer.is_closing():
+                self.subscribers.discard(writer)
+            else:
+                writer.write(data)
+
+    # Method to send one reply, ignoring connections that have gone away
+    async def send(self, writer, reply):
+        if writer.is_closing():
+            return
+        try:
+            writer.write(encode(reply))
+            await writer.drain()
+        except ConnectionError:
+            self.subscribers.discard(writer)
+
+
+# Function to run the server from the command line and return the exit code
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stock Taking System server")
+    parser.add_argument("--file", default="stock_data.json", help="stock file (.json, or .db for SQLite)")
+    parser.add_argument("--capacity", type=int, default=1000, help="maximum total stock")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="host:port, or a Unix socket path")
+    args = parser.parse_args(argv)
+
+    engine = StockEngine(args.file, args.capacity)
+    try:
+        report = engine.load()
+    except (IOError, ValueError) as error:
+        print(f"Error loading {args.file}: {error}", file=sys.stderr)
+        return 1
+    if report is not None and report.bad:
+        print(report.summary(), file=sys.stderr)
+    try:
+        asyncio.run(StockServer(engine, args.address).serve())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        # Ctrl+C or SIGTERM; the stock was saved on the way out
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,58 @@
 
 import tkinter as tk # Importing tkinter for GUI
-from tkinter import messagebox, simpledialog # For popups and dialogs
+import importlib # For importing the dialog modules the first time one is shown
 import json # For saving/loading stock data
+import sqlite3 # For catching errors from the SQLite backend
 import os # For file path operations
+import argparse # For the optional stock file / server arguments
+import math # For the rounded corners of the button images
+import time # For checking whether the cached forecast is from today
+import weakref # For sharing button images per window without keeping closed windows alive
+from inventory import Inventory # Stock model with a running total
+from virtual_list import VirtualListbox # List widget that only draws the visible rows
+from search_index import SearchIndex # Prefix and fuzzy search over item names
+from persistence import PersistenceWorker # Runs file writes on a background thread
+from stock_engine import StockError, CapacityError # Headless stock rules (the engines come from locations.py)
+from scan_mode import SkuMap, ScanSession # Barcode scans counted in memory and committed in one batch
+from locations import LocationSet, load_locations, locations_path, transfers_path, DEFAULT_LOCATION # Stock kept at several locations
+from reports import ReportPool, POOL_THRESHOLD # Streaming CSV/HTML reports, big ones written by worker processes
+from instrumentation import profiler # Opt-in timing of callbacks and storage (--profile)
+from forecast import ForecastRunner, COVER_DAYS # Demand forecasts worked out in a background process
+
+# Delay before the startup stages that run on the main loop, so the window shell is drawn first (ms)
+STAGE_MS = 20
+# Rows added to the list per main-loop step when it is filled
+FILL_CHUNK = 5000
+
+
+# Define the LazyModule class that stands in for a module until one of its functions is first used
+class LazyModule:
+    # The dialog modules aren't needed to show the window, so they are imported on the first popup.
+
+    # Initialize the LazyModule with the full name of the module it stands in for
+    def __init__(self, name):
+        self._name = name
+
+    # Method to import the module on first use and keep each function it hands out
+    def __getattr__(self, attribute):
+        value = getattr(importlib.import_module(self._name), attribute)
+        setattr(self, attribute, value)
+        return value
+
+
+# Popups, dialogs and file choosers (imported when first shown)
+messagebox = LazyModule("tkinter.messagebox")
+simpledialog = LazyModule("tkinter.simpledialog")
+filedialog = LazyModule("tkinter.filedialog")
 
 # Define a custom RoundedButton class that inherits from tk.Canvas to create buttons with rounded corners
 class RoundedButton(tk.Canvas):
+    # The rounded background is a pre-rendered image shared by every button of the same size and colour;
+    # each button holds one image item and one text item, created once. Hovering only swaps the image.
+
+    # Shared background images: Tk root -> {(width, height, radius, colour): PhotoImage}
+    _images = weakref.WeakKeyDictionary()
+
     # Initialize the RoundedButton with parameters for parent, text, command, font, size, background and corner radius
     def __init__(self, parent, text, command, font, width, height, bg, corner_radius=10):
         # Calculate approximate pixel width from character width units for better button sizing
@@ -16,10 +63,6 @@ class RoundedButton(tk.Canvas):
         super().__init__(parent, width=pixel_width, height=pixel_height, bg=parent.cget('bg'), highlightthickness=0)
         # Store the command function to execute when button is clicked
         self.command = command
-        # Store the original background color for hover effects
-        self.original_bg = bg
-        # Set the current background color
-        self.bg_color = bg
         # Set the corner radius for rounded corners
         self.radius = corner_radius
         # Store the button text
@@ -29,39 +72,54 @@ class RoundedButton(tk.Canvas):
         # Store the calculated width and height for drawing
         self.w = pixel_width
         self.h = pixel_height
+        # Create the canvas items once: the rounded background image and the text on top of it
+        self.image_item = self.create_image(0, 0, anchor=tk.NW)
+        self.text_item = self.create_text(pixel_width / 2, pixel_height / 2, text=text, font=font, fill="black")
+        # Set the colours (renders the normal and hover images if no other button has yet)
+        self.set_colour(bg)
         # Bind left mouse button click to the on_click method
         self.bind("<Button-1>", self.on_click)
         # Bind mouse enter to on_enter for hover effect
         self.bind("<Enter>", self.on_enter)
         # Bind mouse leave to on_leave to reset hover
         self.bind("<Leave>", self.on_leave)
-        # Draw the button initially
+
+    # Method to set the button colour and get its normal and hover images ready
+    def set_colour(self, bg):
+        # Store the original background color for hover effects
+        self.original_bg = bg
+        # Hover color based on the background color
+        self.bg_color_hover = "#d4edda" if "green" in bg else "#f8d7da" if "coral" in bg else "#d1ecf1" if "blue" in bg else "#fff3cd"
+        # Render (or look up) both images now so hovering never draws anything
+        self.button_image(bg)
+        self.button_image(self.bg_color_hover)
+        # Set the current background color
+        self.bg_color = bg
         self.draw_button()
 
-    # Method to draw the rounded button on the canvas
+    # Method to return the shared rounded-rectangle image in a colour, rendering it the first time
+    def button_image(self, colour):
+        images = RoundedButton._images.setdefault(self._root(), {})
+        key = (self.w, self.h, self.radius, colour)
+        image = images.get(key)
+        if image is None:
+            w = self.w
+            h = self.h
+            # Calculate the corner radius, ensuring it fits within the button size
+            r = min(self.radius, min(w, h) // 4)
+            image = tk.PhotoImage(master=self._root(), width=w, height=h)
+            # Fill one row at a time, leaving the corners outside the arcs transparent
+            for y in range(h):
+                # How far the row is into a corner (0 along the straight middle part)
+                depth = max(r - (y + 0.5), (y + 0.5) - (h - r), 0)
+                inset = round(r - math.sqrt(r * r - depth * depth)) if depth else 0
+                image.put("{" + " ".join([colour] * (w - 2 * inset)) + "}", to=(inset, y))
+            images[key] = image
+        return image
+
+    # Method to show the current background colour (only switches the image; nothing is redrawn)
     def draw_button(self):
-        # Get the width and height of the button
-        w = self.w
-        h = self.h
-        # Calculate the corner radius, ensuring it fits within the button size
-        r = min(self.radius, min(w, h) // 4)  # Ensure radius fits
-        # Clear all previous drawings on the canvas
-        self.delete("all")
-        # Draw the four corner arcs to create rounded corners
-        # Top-left corner arc
-        self.create_arc(0, 0, 2*r, 2*r, start=90, extent=90, style=tk.PIESLICE, fill=self.bg_color, outline="")
-        # Top-right corner arc
-        self.create_arc(w - 2*r, 0, w, 2*r, start=0, extent=90, style=tk.PIESLICE, fill=self.bg_color, outline="")
-        # Bottom-left corner arc
-        self.create_arc(0, h - 2*r, 2*r, h, start=180, extent=90, style=tk.PIESLICE, fill=self.bg_color, outline="")
-        # Bottom-right corner arc
-        self.create_arc(w - 2*r, h - 2*r, w, h, start=270, extent=90, style=tk.PIESLICE, fill=self.bg_color, outline="")
-        # Draw the horizontal rectangle for the top and bottom middle parts
-        self.create_rectangle(r, 0, w - r, h, fill=self.bg_color, outline="")
-        # Draw the vertical rectangle for the left and right middle parts
-        self.create_rectangle(0, r, w, h - r, fill=self.bg_color, outline="")
-        # Draw the button text in the center of the button
-        self.create_text(w / 2, h / 2, text=self.text, font=self.font, fill="black")
+        self.itemconfig(self.image_item, image=self.button_image(self.bg_color))
 
     # Event handler for mouse click on the button
     def on_click(self, event):
@@ -71,36 +129,205 @@ class RoundedButton(tk.Canvas):
 
     # Event handler for mouse entering the button area (hover start)
     def on_enter(self, event):
-        # Determine hover color based on current background color
-        self.bg_color_hover = "#d4edda" if "green" in self.bg_color else "#f8d7da" if "coral" in self.bg_color else "#d1ecf1" if "blue" in self.bg_color else "#fff3cd"
         # Set the background to hover color
         self.bg_color = self.bg_color_hover
-        # Redraw the button with new color
         self.draw_button()
 
     # Event handler for mouse leaving the button area (hover end)
     def on_leave(self, event):
         # Reset background to original color
         self.bg_color = self.original_bg
-        # Redraw the button
         self.draw_button()
 
     # Method to configure button properties dynamically
     def config(self, **kwargs):
         # Update text if provided
         if 'text' in kwargs:
-            self.text = kwargs['text']
+            self.text = kwargs.pop('text')
+            self.itemconfig(self.text_item, text=self.text)
         # Update font if provided
         if 'font' in kwargs:
-            self.font = kwargs['font']
-        # Update background color if provided
+            self.font = kwargs.pop('font')
+            self.itemconfig(self.text_item, font=self.font)
+        # Update background color if provided (the canvas itself keeps the parent's colour behind the corners)
         if 'bg' in kwargs:
-            self.bg_color = kwargs['bg']
-            self.original_bg = kwargs['bg']
+            self.set_colour(kwargs.pop('bg'))
         # Call parent config method for other properties
-        super().config(**kwargs)
-        # Redraw the button after changes
-        self.draw_button()
+        if kwargs:
+            super().config(**kwargs)
+
+
+# Define the ScanWindow class: a non-modal window for a keyboard-wedge barcode scanner
+class ScanWindow(tk.Toplevel):
+    # Focused scan field plus a running tally; nothing is stored until Commit.
+
+    # Initialize the ScanWindow with the app whose engine and SKU map it uses
+    def __init__(self, app):
+        super().__init__(app.root, bg="lightgray")
+        self.app = app
+        self.title("Scan Mode")
+        self.session = ScanSession(app.sku_map)
+        # Scan field: the scanner types the code and presses Enter
+        tk.Label(self, text="Scan (or type a code / item name, \"12*code\" for 12):", bg="lightgray", font=("Arial", 11)).pack(pady=(10, 0))
+        self.scan_text = tk.StringVar()
+        self.scan_entry = tk.Entry(self, textvariable=self.scan_text, width=40, font=("Arial", 14))
+        self.scan_entry.pack(padx=10, pady=5)
+        self.scan_entry.bind("<Return>", self.on_scan)
+        # Last scan and running totals, updated after every scan (no popups while scanning)
+        self.last_label = tk.Label(self, text="Ready.", bg="lightgray", font=("Arial", 11))
+        self.last_label.pack()
+        # Running tally, one row per item (unknown codes are listed first, marked with "?")
+        self.tally_list = VirtualListbox(self, height=12, width=40, empty_text="Nothing scanned yet.")
+        self.tally_list.pack(padx=10, pady=5)
+        button_frame = tk.Frame(self, bg="lightgray")
+        button_frame.pack(pady=10)
+        RoundedButton(button_frame, "Commit", self.commit, ("Arial", 12), 10, 2, "green").pack(side=tk.LEFT, padx=5)
+        RoundedButton(button_frame, "Assign Code", self.assign_code, ("Arial", 12), 12, 2, "blue").pack(side=tk.LEFT, padx=5)
+        RoundedButton(button_frame, "Close", self.on_closing, ("Arial", 12), 10, 2, "coral").pack(side=tk.LEFT, padx=5)
+        self.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.bind("<Control-Return>", lambda event: self.commit())
+        self.update_totals()
+        self.scan_entry.focus_set()
+
+    # Method to count one scan and update its tally row
+    def on_scan(self, event=None):
+        text = self.scan_text.get()
+        self.scan_text.set("")
+        item, code, units = self.session.scan(text, self.app.stock)
+        if not units:
+            return
+        if item is None:
+            self.tally_list.upsert("?" + code, f"? {code}: {self.session.unknown[code]} (unknown code)")
+            self.last_label.config(text=f"Unknown code '{code}' (+{units})", fg="red")
+            self.bell()
+        else:
+            self.tally_list.upsert(item, f"{item}: +{self.session.tally[item]}")
+            self.last_label.config(text=f"{item} +{units}", fg="black")
+        self.update_totals()
+
+    # Method to show the number of scans and units waiting to be committed
+    def update_totals(self):
+        unknown = len(self.session.unknown)
+        text = f"Scans: {self.session.scans}   Units to add: {self.session.total()}   Room: {self.app.engine.remaining()}"
+        if unknown:
+            text += f"   Unknown codes: {unknown}"
+        self.title(f"Scan Mode - {text}")
+
+    # Method to add everything scanned in one batch (one stored step and one undo step)
+    def commit(self):
+        if not self.session.tally:
+            self.last_label.config(text="Nothing to commit.", fg="black")
+            return
+        units = self.session.total()
+        try:
+            quantities = self.session.commit(self.app.engine)
+        except CapacityError as error:
+            messagebox.showwarning(error.title, str(error), parent=self)
+            return
+        except StockError as error:
+            messagebox.showerror(error.title, str(error), parent=self)
+            return
+        # Keep the rows of unknown codes so they can still be assigned
+        self.tally_list.set_rows(
+            ("?" + code, f"? {code}: {units} (unknown code)") for code, units in self.session.unknown.items()
+        )
+        self.last_label.config(text=f"Added {units} units of {len(quantities)} item(s).", fg="green")
+        self.app.refresh_items(quantities)
+        self.update_totals()
+        self.scan_entry.focus_set()
+
+    # Method to map the selected unknown code to an item (its scans move to that item)
+    def assign_code(self):
+        key = self.tally_list.selected_key()
+        if not key or not key.startswith("?"):
+            messagebox.showinfo("Assign Code", "Select an unknown code (marked with ?) first.", parent=self)
+            return
+        code = key[1:]
+        item_name = simpledialog.askstring("Assign Code", f"Item for code '{code}':", parent=self)
+        if not item_name or not item_name.strip():
+            self.scan_entry.focus_set()
+            return
+        try:
+            item = self.session.assign(code, item_name)
+        except (IOError, ValueError) as error:
+            messagebox.showerror("Error", f"Could not save the SKU map: {error}", parent=self)
+            return
+        self.tally_list.discard(key)
+        if item in self.session.tally:
+            self.tally_list.upsert(item, f"{item}: +{self.session.tally[item]}")
+        self.update_totals()
+        self.scan_entry.focus_set()
+
+    # Method to close the window, checking first if there are scans that haven't been committed
+    def on_closing(self):
+        if self.session.tally and not messagebox.askyesno(
+            "Discard Scans?", f"{self.session.total()} scanned units haven't been committed. Close anyway?", parent=self
+        ):
+            return
+        self.app.scan_window = None
+        self.destroy()
+
+
+# Define the DiagnosticsWindow class that shows the --profile timings while the app runs
+class DiagnosticsWindow(tk.Toplevel):
+    # Table of call counts and times, refreshed every second, with Save and Reset buttons.
+
+    # Initialize the DiagnosticsWindow with the app that opened it
+    def __init__(self, app):
+        super().__init__(app.root, bg="lightgray")
+        self.app = app
+        self.title("Diagnostics")
+        self.text = tk.Text(self, width=95, height=25, font=("Courier", 10))
+        scrollbar = tk.Scrollbar(self, command=self.text.yview)
+        self.text.configure(yscrollcommand=scrollbar.set)
+        button_frame = tk.Frame(self, bg="lightgray")
+        button_frame.pack(side=tk.BOTTOM, pady=5)
+        tk.Button(button_frame, text="Save to File...", command=self.save).pack(side=tk.LEFT, padx=5)
+        tk.Button(button_frame, text="Reset", command=self.reset).pack(side=tk.LEFT, padx=5)
+        tk.Button(button_frame, text="Close", command=self.close).pack(side=tk.LEFT, padx=5)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.refresh_job = None
+        self.refresh()
+
+    # Method to show the latest timings (keeping the scroll position) and schedule the next refresh
+    def refresh(self):
+        if profiler.enabled:
+            lines = profiler.summary_lines()
+        else:
+            lines = ["Timing is off. Start the app with --profile to record where the time goes."]
+        top = self.text.yview()[0]
+        self.text.configure(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", "\n".join(lines))
+        self.text.configure(state=tk.DISABLED)
+        self.text.yview_moveto(top)
+        self.refresh_job = self.after(1000, self.refresh)
+
+    # Method to write the timings to a JSON file
+    def save(self):
+        path = filedialog.asksaveasfilename(
+            parent=self, title="Save Timings", defaultextension=".json", filetypes=[("JSON files", "*.json")]
+        )
+        if not path:
+            return  # user cancelled
+        try:
+            profiler.dump(path)
+        except (IOError, OSError) as error:
+            messagebox.showerror("Save Error", f"Could not write {os.path.basename(path)}: {error}", parent=self)
+
+    # Method to start the timings again from now
+    def reset(self):
+        profiler.reset()
+        self.after_cancel(self.refresh_job)
+        self.refresh()
+
+    # Method to close the window
+    def close(self):
+        self.after_cancel(self.refresh_job)
+        self.app.diagnostics_window = None
+        self.destroy()
 
 
 # Define the main StockTakingApp class that manages the GUI and stock operations
@@ -108,140 +335,445 @@ class StockTakingApp:
     # Main class for the Stock Taking System GUI application.
 
     # Initialize the StockTakingApp with the root window
-    def __init__(self, root):
+    def __init__(self, root, stock_file="stock_data.json", server=None):
         # Set up root window: title, size, and background
         self.root = root
-        self.root.title("Stock Taking System - Version 4") # Updated title for version 4
+        self.root.title("Stock Taking System - Version 4 (Loading...)") # Updated title for version 4
         self.root.geometry("600x600") # Increased window size for better layout
         self.root.configure(bg="lightgray") # Set a light gray background for better aesthetics
 
         # Initialize stock data and settings
-        self.stock = {}
-        self.stock_file = "stock_data.json" # File to save stock data
+        self.stock_file = stock_file # File to save stock data (.json, or .db for the SQLite backend)
         self.total_capacity = 1000 # Maximum stock capacity
         self.image_path = os.path.join(os.path.dirname(__file__), "company_logo.gif") # Path to company logo
+        self.saver = PersistenceWorker(self.root, on_error=self.show_save_error) # Background thread for writes
+        # The engine holds the stock and the rules; the GUI only asks for input and shows results
+        if server:
+            # Client mode: one persistent connection to the stock server instead of the stock file
+            # (imported here so a plain start doesn't pay for loading the networking code)
+            from stock_client import RemoteEngine
+            profiler.instrument_engine(RemoteEngine)
+            self.engine = RemoteEngine(server, runner=self.persist)
+            self.locations = None # The server keeps one stock
+            self.location = None
+        else:
+            # One store per location (listed in locations.json next to the stock file, if there is one);
+            # the location shown is loaded first and the others follow in the background
+            try:
+                locations = load_locations(locations_path(self.stock_file), self.stock_file, self.total_capacity)
+            except (IOError, ValueError) as error:
+                messagebox.showerror("Locations Error", f"Could not read the locations: {error}. Using {self.stock_file} only.")
+                locations = {DEFAULT_LOCATION: {"file": self.stock_file, "capacity": self.total_capacity}}
+            self.locations = LocationSet(locations, make_runner=self.runner_for, transfers_file=transfers_path(self.stock_file))
+            self.location = self.locations.location_of(self.stock_file) # Location shown in the window
+            self.engine = self.locations.engine(self.location)
+        self.search_index = SearchIndex() # Built after loading, then updated one item at a time
+        # How often to look for changes made by other terminals (the server pushes them, so checking
+        # what has arrived is cheap and can be done often)
+        self.poll_ms = 200 if server else 2000
+        self.poll_job = None # Pending root.after() id for the next check
+        # Barcode -> item map for scan mode, kept next to the stock file (shared by every stock file there)
+        self.sku_map = SkuMap(os.path.join(os.path.dirname(os.path.abspath(self.stock_file)), "sku_map.json"))
+        self.scan_window = None # Open ScanWindow, if any
+        # Staged startup: the window shell is built first and shown straight away; the stock loads on
+        # the persistence worker (or on the main loop, for backends tied to one thread), then the buttons
+        # and menus are added and the list fills a chunk at a time. The logo is decoded once the window is up.
+        self.loaded = False # True once the stock is loaded and the controls are built
+        self.load_progress = None # (bytes read, total bytes) from the loading thread
+        self.fill_job = None # Pending root.after() id for the next chunk of list rows
+        self.report_pool = None # Worker processes for big reports (started by the first one)
+        self.report_job = None # Pending root.after() id for the next report progress check
+        self.diagnostics_window = None # Open DiagnosticsWindow, if any
+        self.forecast_runner = None # Background process for demand forecasts (started by the first one)
+        self.forecast_job = None # Pending root.after() id for the next forecast check
+        self.forecast_engine = None # Engine whose forecast is being worked out
+        self.forecast_show = False # Whether to show the suggestions once the forecast is done
+        # With --profile, note how late the event loop runs a timer (does nothing otherwise)
+        profiler.watch_event_loop(self.root)
 
-        # Load stock data from file at startup
-        self.load_stock()
-
-        # Create title frame with label and logo
-        title_frame = tk.Frame(self.root, bg="lightgray") # Title frame
-        title_label = tk.Label(title_frame, text="StockTaker", font=("Arial", 16, "bold"), bg="lightgray") # Title label
+        # Create title frame with label (the logo is added by load_logo)
+        self.title_frame = tk.Frame(self.root, bg="lightgray") # Title frame
+        title_label = tk.Label(self.title_frame, text="StockTaker", font=("Arial", 16, "bold"), bg="lightgray") # Title label
         title_label.pack()
+        self.title_frame.pack(pady=10)
+
+        # Create search box that filters the list as you type
+        self.search_frame = tk.Frame(self.root, bg="lightgray")
+        self.search_frame.pack()
+        tk.Label(self.search_frame, text="Search:", bg="lightgray", font=("Arial", 11)).pack(side=tk.LEFT)
+        self.search_text = tk.StringVar()
+        self.search_entry = tk.Entry(self.search_frame, textvariable=self.search_text, width=40)
+        self.search_entry.pack(side=tk.LEFT, padx=5)
+        # Run the search every time the text changes
+        self.search_text.trace_add("write", lambda *args: self.show_search_results())
+
+        # Create listbox for displaying stock
+        self.stock_listbox = VirtualListbox(self.root, height=15, width=50, empty_text="Loading stock...")
+        self.stock_listbox.pack(pady=10)
+
+        # Create buttons frame (the buttons are added once the stock is loaded)
+        self.button_frame = tk.Frame(self.root, bg="lightgray")
+        self.button_frame.pack(pady=10)
+
+        # Create status label for total stock and remaining capacity
+        self.status_label = tk.Label(self.root, text="Loading stock...", bg="lightgray", font=("Arial", 12))
+        self.status_label.pack(pady=10)
+
+        # Bind closing event to auto-save
+        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+
+        # Start loading the stock and schedule the logo
+        if self.engine.background_safe:
+            self.saver.submit(lambda: self.load_job(self.note_load_progress), on_done=self.finish_startup)
+            self.root.after(100, self.show_background_progress)
+        else:
+            # Give the shell a moment to be drawn before the main loop is busy loading
+            self.root.after(STAGE_MS, lambda: self.finish_startup(self.load_job(self.show_load_progress)))
+        self.root.after(STAGE_MS, self.load_logo)
+
+    # Method to decode and show the company logo (after the window is up, so it doesn't delay it)
+    def load_logo(self):
         # Load and display the company logo if available
         try:
             self.logo_image = tk.PhotoImage(file=self.image_path)
-            logo_label = tk.Label(title_frame, image=self.logo_image, bg="lightgray")# Display logo
+            logo_label = tk.Label(self.title_frame, image=self.logo_image, bg="lightgray")# Display logo
             logo_label.pack() #
         except tk.TclError:
             # If logo file not found, skip displaying it
             pass
-        title_frame.pack(pady=10)
 
-        # Create listbox for displaying stock
-        self.stock_listbox = tk.Listbox(self.root, height=15, width=50)
-        self.stock_listbox.pack(pady=10)
+    # Method to add the menus and buttons, show the stock and start polling, once the stock is loaded
+    def finish_startup(self, outcome):
+        self.show_loaded(outcome)
+        self.build_controls()
+        self.loaded = True
+        self.stock_listbox.empty_text = "No stock items available."
+        # Initial refresh to display stock (the list fills in chunks)
+        self.refresh_display()
+        # Start checking for other terminals' changes
+        self.poll_job = self.root.after(self.poll_ms, self.check_for_changes)
+        self.recover_transfers()
+        self.load_other_locations()
 
-        # Create buttons frame with rounded buttons
-        button_frame = tk.Frame(self.root, bg="lightgray")
-        button_frame.pack(pady=10)
+    # Method to create the menu bar, the buttons and the keyboard shortcuts
+    def build_controls(self):
+        # Create the menu bar with a File menu for bulk import, save and exit
+        menu_bar = tk.Menu(self.root)
+        file_menu = tk.Menu(menu_bar, tearoff=0)
+        file_menu.add_command(label="Import Stock...", command=self.import_stock)
+        file_menu.add_command(label="Load SKU Map...", command=self.load_sku_map)
+        file_menu.add_command(label="Export Report...", command=self.export_report)
+        if self.has_locations():
+            file_menu.add_command(label="Export All Locations...", command=self.export_all_locations)
+        file_menu.add_command(label="Save", command=self.save_stock)
+        file_menu.add_separator()
+        file_menu.add_command(label="Exit", command=self.on_closing)
+        menu_bar.add_cascade(label="File", menu=file_menu)
+        # Edit menu for undoing and redoing stock edits (also Ctrl+Z / Ctrl+Y)
+        self.edit_menu = tk.Menu(menu_bar, tearoff=0, postcommand=self.update_edit_menu)
+        self.edit_menu.add_command(label="Undo", command=self.undo_edit, accelerator="Ctrl+Z")
+        self.edit_menu.add_command(label="Redo", command=self.redo_edit, accelerator="Ctrl+Y")
+        menu_bar.add_cascade(label="Edit", menu=self.edit_menu)
+        self.root.bind("<Control-z>", lambda event: self.undo_edit())
+        self.root.bind("<Control-y>", lambda event: self.redo_edit())
+        # Reports menu for stock movements (read from the precomputed daily/weekly totals)
+        report_menu = tk.Menu(menu_bar, tearoff=0)
+        report_menu.add_command(label="Movements This Week", command=self.show_movement_report)
+        report_menu.add_command(label="Item History...", command=self.show_item_history)
+        report_menu.add_separator()
+        report_menu.add_command(label="Diagnostics", command=self.open_diagnostics)
+        menu_bar.add_cascade(label="Reports", menu=report_menu)
+        # Alerts menu for reorder levels and category capacities
+        alert_menu = tk.Menu(menu_bar, tearoff=0)
+        alert_menu.add_command(label="Reorder List", command=self.show_reorder_list)
+        alert_menu.add_command(label="Reorder Suggestions", command=self.show_reorder_suggestions)
+        alert_menu.add_command(label="Update Demand Forecast", command=self.update_forecast)
+        alert_menu.add_command(label="Set Reorder Level...", command=self.set_reorder_level)
+        alert_menu.add_command(label="Set Item Category...", command=self.set_item_category)
+        alert_menu.add_command(label="Set Category Capacity...", command=self.set_category_capacity)
+        menu_bar.add_cascade(label="Alerts", menu=alert_menu)
+
+        price_menu = tk.Menu(menu_bar, tearoff=0)
+        price_menu.add_command(label="Receive Stock at Cost...", command=self.receive_stock)
+        price_menu.add_command(label="Set Cost and Price...", command=self.set_item_price)
+        price_menu.add_command(label="Import Prices...", command=self.import_prices)
+        price_menu.add_command(label="Costing Method...", command=self.set_costing)
+        price_menu.add_command(label="Stock Value", command=self.show_stock_value)
+        menu_bar.add_cascade(label="Prices", menu=price_menu)
+        if self.has_locations():
+            # Locations menu for moving stock between locations and the totals of every location
+            location_menu = tk.Menu(menu_bar, tearoff=0)
+            location_menu.add_command(label="Transfer Stock...", command=self.transfer_stock)
+            location_menu.add_command(label="Location Totals", command=self.show_location_totals)
+            menu_bar.add_cascade(label="Locations", menu=location_menu)
+            # Drop-down next to the search box to switch the location shown
+            self.location_var = tk.StringVar(value=self.location)
+            tk.Label(self.search_frame, text="Location:", bg="lightgray", font=("Arial", 11)).pack(side=tk.LEFT, padx=(10, 0))
+            tk.OptionMenu(self.search_frame, self.location_var, *self.locations.names(), command=self.switch_location).pack(side=tk.LEFT)
+        self.root.config(menu=menu_bar)
 
         # Create add button with green color
-        self.add_button = RoundedButton(button_frame, "Add Stock", self.add_stock, ("Arial", 12), 15, 2, "green")
+        self.add_button = RoundedButton(self.button_frame, "Add Stock", self.add_stock, ("Arial", 12), 15, 2, "green")
         self.add_button.pack(side=tk.LEFT, padx=10)
 
         # Create remove button with coral color
-        self.remove_button = RoundedButton(button_frame, "Remove Stock", self.remove_stock, ("Arial", 12), 15, 2, "coral")
+        self.remove_button = RoundedButton(self.button_frame, "Remove Stock", self.remove_stock, ("Arial", 12), 15, 2, "coral")
         self.remove_button.pack(side=tk.LEFT, padx=10)
 
         # Create refresh button with blue color
-        self.refresh_button = RoundedButton(button_frame, "Refresh", self.refresh_display, ("Arial", 12), 10, 2, "blue")
+        self.refresh_button = RoundedButton(self.button_frame, "Refresh", self.refresh_display, ("Arial", 12), 10, 2, "blue")
         self.refresh_button.pack(side=tk.LEFT, padx=10)
 
         # Create save button with orange color
-        self.save_button = RoundedButton(button_frame, "Save", self.save_stock, ("Arial", 12), 10, 2, "orange")
+        self.save_button = RoundedButton(self.button_frame, "Save", self.save_stock, ("Arial", 12), 10, 2, "orange")
         self.save_button.pack(side=tk.LEFT, padx=10)
 
-        # Create status label for total stock and remaining capacity
-        self.status_label = tk.Label(self.root, text="", bg="lightgray", font=("Arial", 12))
-        self.status_label.pack(pady=10)
-
-        # Bind closing event to auto-save
-        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        # Create scan mode button with light blue color (opens the barcode scanning window)
+        self.scan_button = RoundedButton(self.button_frame, "Scan", self.open_scan_mode, ("Arial", 12), 8, 2, "lightblue")
+        self.scan_button.pack(side=tk.LEFT, padx=10)
 
-        # Initial refresh to display stock
-        self.refresh_display()
+    # Property for the engine's inventory (item quantities plus a running total)
+    @property
+    def stock(self):
+        return self.engine.inventory
 
-    # Method to load stock data from the JSON file
+    # Method to load stock data from the JSON file (used again when the stock has to be reloaded)
     def load_stock(self):
-        # Load stock data from JSON file, coerce quantities to int.
+        self.show_loaded(self.load_job(self.show_load_progress))
+
+    # Method to load the stock and return (load report, error) rather than raising, so it can run on
+    # the persistence worker (reload=False keeps a location that is already loaded as it is)
+    def load_job(self, progress, reload=True):
         try:
-            # Check if the stock file exists
-            if os.path.exists(self.stock_file):
-                # Open the file in read mode
-                with open(self.stock_file, "r") as file:
-                    # Load the JSON data into a dictionary using json.load, which parses JSON into a Python dict
-                    data = json.load(file)
-                    # Coerce values to integers to avoid type errors
-                    # Initialize an empty dictionary for cleaned data
-                    cleaned = {}
-                    # Iterate over each key-value pair in the loaded data
-                    for k, v in data.items():
-                        try:
-                            # Convert the key to string, strip whitespace, and lowercase for case insensitivity, value to int
-                            cleaned[str(k).strip().lower()] = int(v)
-                        except (ValueError, TypeError):
-                            # If a value can't be converted to int, skip or set to 0
-                            cleaned[str(k).strip().lower()] = 0
-                    # Assign the cleaned data to self.stock
-                    self.stock = cleaned
-                # non-intrusive info (useful while testing)
-                # messagebox.showinfo("Load", "Stock data loaded successfully.")
-            else:
-                # If file doesn't exist, initialize stock as empty dictionary
-                self.stock = {}
-        except (json.JSONDecodeError, IOError) as error:
+            # The storage backend cleans names and values (lowercased names, int quantities) and builds
+            # an inventory with its running total; the JSON backend also replays the journal
+            if self.locations is None:
+                return self.engine.load(progress=progress), None
+            return self.locations.load(self.location, progress, reload), None
+        except (json.JSONDecodeError, IOError, sqlite3.Error, StockError) as error:
+            return None, error
+
+    # Method to check whether there is more than one location to choose from
+    def has_locations(self):
+        return self.locations is not None and len(self.locations.names()) > 1
+
+    # Method to return the window title (with the location when there are several)
+    def window_title(self):
+        if self.has_locations():
+            return f"Stock Taking System - Version 4 - {self.location}"
+        return "Stock Taking System - Version 4"
+
+    # Method to show the result of load_job (main thread)
+    def show_loaded(self, outcome):
+        report, error = outcome
+        self.root.title(self.window_title())
+        if error is None:
+            # In client mode the server decides the capacity
+            self.total_capacity = self.engine.capacity
+            # Tell the user about rows whose quantity wasn't a whole number (they are loaded as 0)
+            if report is not None and report.bad:
+                messagebox.showwarning("Load Warning", report.summary())
+            # non-intrusive info (useful while testing)
+            # messagebox.showinfo("Load", "Stock data loaded successfully.")
+        else:
             # If there's an error loading the file, show error message and start with empty stock
             messagebox.showerror("Load Error", f"Error loading data: {error}. Starting empty.")
-            self.stock = {}
+            # The storage's own kind of inventory, so edits are still stored where they belong
+            self.engine.start_empty()
+        # Index every item name for the search box (names in an SQLite table are added a page at a time
+        # as the list fills, so startup doesn't read the whole table)
+        self.search_index.rebuild(() if hasattr(self.stock, "page") else self.stock.keys())
+
+    # Method the loading thread calls with its progress (Tk must only be touched on the main thread)
+    def note_load_progress(self, bytes_read, total_bytes):
+        self.load_progress = (bytes_read, total_bytes)
+
+    # Method to show the loading thread's progress in the window title until the stock is loaded
+    def show_background_progress(self):
+        if self.loaded:
+            return
+        if self.load_progress is not None:
+            bytes_read, total_bytes = self.load_progress
+            if total_bytes:
+                self.root.title(f"Stock Taking System - Version 4 (Loading {min(100, bytes_read * 100 // total_bytes)}%)")
+        self.root.after(100, self.show_background_progress)
+
+    # Method to show how far the stock file has loaded in the window title
+    def show_load_progress(self, bytes_read, total_bytes):
+        if total_bytes:
+            self.root.title(f"Stock Taking System - Version 4 (Loading {min(100, bytes_read * 100 // total_bytes)}%)")
+            # Let Tk redraw the title without processing user events
+            self.root.update_idletasks()
+
+    # Method to return the function a location's engine uses to run its storage jobs
+    def runner_for(self, engine):
+        return lambda job, key=None, on_done=None: self.persist(job, key, on_done, engine)
+
+    # Method the engine uses to run a storage job: on the persistence worker if the backend allows it,
+    # otherwise right away (engine is the one the job belongs to, if not the one shown)
+    def persist(self, job, key=None, on_done=None, engine=None):
+        if (engine or self.engine).background_safe:
+            # The worker runs it off the main loop and calls on_done/show_save_error back on the main thread
+            self.saver.submit(job, key, on_done)
+            return
+        try:
+            result = job()
+        except (IOError, OSError, sqlite3.Error) as error:
+            self.show_save_error(error)
+            return
+        if on_done:
+            on_done(result)
+
+    # Method to show a save error (always called on the main thread)
+    def show_save_error(self, error):
+        messagebox.showerror("Save Error", f"Error saving: {error}")
 
     # Method to save the current stock data to the JSON file
-    def save_stock(self):
+    def save_stock(self, quiet=False):
         # Save current stock data to JSON file
-        try:
-            # Open the file in write mode
-            with open(self.stock_file, "w") as file:
-                # Dump the stock dictionary to JSON with indentation for readability using json.dump
-                json.dump(self.stock, file, indent=4)
-            # Show success message to the user
-            messagebox.showinfo("Save", "Stock data saved successfully.")
-        except IOError as error:
-            # If there's an error saving, show error message
-            messagebox.showerror("Save Error", f"Error saving: {error}")
+        # Show success message to the user once the write has finished (unless saving quietly)
+        on_done = None if quiet else (lambda result: messagebox.showinfo("Save", "Stock data saved successfully."))
+        # The engine copies the stock and queues one coalesced write
+        self.engine.save(on_done=on_done)
 
     # Method to calculate and return the total quantity of all stock items
     def get_total_stock(self):
         # Return total of all stock quantities (int).
-        # Sum up all values in the stock dictionary, ensuring they are integers
-        return sum(int(q) for q in self.stock.values())
+        # The inventory keeps a running total, so this is O(1) instead of summing every item
+        return self.stock.total()
 
     # Method to refresh the display of stock items in the listbox and update the status label
     def refresh_display(self):
         # Update listbox and status label.
-        # Clear all items from the listbox
-        self.stock_listbox.delete(0, tk.END)
-        # Get the total stock quantity
-        total_stock = self.get_total_stock()
+        if self.search_text.get().strip():
+            # A search is active, so show its results instead of every item
+            self.show_search_results()
+        else:
+            # Rebuild the list rows; the virtual list only draws the ones on screen
+            # (it shows "No stock items available." by itself when there are no rows)
+            self.fill_list()
+        # Update the status label
+        self.update_status()
+
+    # Method to show every item in the list, a chunk at a time so a big stock doesn't freeze the window
+    def fill_list(self):
+        self.cancel_fill()
+        self.stock_listbox.set_rows(())
+        if hasattr(self.stock, "page"):
+            # An SQLite table is read a page at a time in name order rather than every name up front
+            self.fill_page("")
+            return
+        # The first chunk is shown straight away; the rest follow from the main loop
+        self.fill_chunk(self.stock.sorted_keys(), 0)
+
+    # Method to add the next page of rows (the items named after `after`) and schedule the one after it
+    def fill_page(self, after):
+        self.fill_job = None
+        rows = self.stock.page(after, FILL_CHUNK)
+        self.stock_listbox.add_sorted_rows((item, f"{item}: {quantity}") for item, quantity in rows)
+        for item, _ in rows:
+            self.search_index.add(item)
+        if len(rows) == FILL_CHUNK:
+            self.fill_job = self.root.after(1, self.fill_page, rows[-1][0])
 
-        # If there are no stock items, display a message
-        if not self.stock:
-            self.stock_listbox.insert(tk.END, "No stock items available.") # Informative message
+    # Method to add the next chunk of rows to the list and schedule the one after it
+    def fill_chunk(self, keys, start):
+        self.fill_job = None
+        # Quantities are read now, so edits made while the list fills are shown correctly
+        self.stock_listbox.add_sorted_rows(
+            (item, f"{item}: {self.stock[item]}") for item in keys[start:start + FILL_CHUNK] if item in self.stock
+        )
+        if start + FILL_CHUNK < len(keys):
+            self.fill_job = self.root.after(1, self.fill_chunk, keys, start + FILL_CHUNK)
+
+    # Method to stop filling the list (its rows are about to be replaced)
+    def cancel_fill(self):
+        if self.fill_job is not None:
+            self.root.after_cancel(self.fill_job)
+            self.fill_job = None
+
+    # Method to show only the items matching the search box (or every item when it is empty)
+    def show_search_results(self):
+        text = self.search_text.get()
+        if not text.strip():
+            self.fill_list()
+            return
+        self.cancel_fill()
+        # Prefix matches first, then fuzzy matches, from the precomputed index
+        matches = self.search_index.search(text, limit=200)
+        self.stock_listbox.set_rows((item, f"{item}: {self.stock.get(item)}") for item in matches)
+        # Select the best match so Remove Stock works on it straight away
+        if matches:
+            self.stock_listbox.select(matches[0])
+
+    # Method to update just the row of one item after it was added or removed, then the status label
+    def refresh_item(self, item_name):
+        # Normalise the name the same way the inventory does
+        item = Inventory.normalise(item_name)
+        # Keep the search index up to date (only new or deleted names change it)
+        if item in self.stock:
+            self.search_index.add(item)
         else:
-            # Sort the stock items alphabetically
-            sorted_items = sorted(self.stock.items())
-            # Insert each item and quantity into the listbox
-            for item, quantity in sorted_items:
-                self.stock_listbox.insert(tk.END, f"{item}: {quantity}")
+            self.search_index.discard(item)
+        if self.search_text.get().strip():
+            # Re-run the search so the results include (or drop) this item
+            self.show_search_results()
+        elif item in self.stock:
+            # Add the row or change its quantity
+            self.stock_listbox.upsert(item, f"{item}: {self.stock[item]}")
+        else:
+            # The item was removed completely
+            self.stock_listbox.discard(item)
+        self.update_status()
+
+    # Method to bring the search index up to date after a batch of changes. Names in an SQLite table are
+    # added or dropped for the changed items only (rebuilding would read the whole table); the rest are
+    # rebuilt from the inventory.
+    def reindex(self, items):
+        if hasattr(self.stock, "page"):
+            for item in items:
+                if item in self.stock:
+                    self.search_index.add(item)
+                else:
+                    self.search_index.discard(item)
+        else:
+            self.search_index.rebuild(self.stock.keys())
+
+    # Method to refresh the rows of several changed items (a big batch redraws everything once)
+    def refresh_items(self, items):
+        if len(items) > 50:
+            self.reindex(items)
+            self.refresh_display()
+        else:
+            for item in items:
+                self.refresh_item(item)
+            self.update_status()
+
+    # Method to pick up changes other terminals made to the shared stock and show them
+    def check_for_changes(self):
+        try:
+            changed = self.engine.poll_changes()
+        except (json.JSONDecodeError, IOError, sqlite3.Error):
+            # The files may be mid-update by another terminal; just try again next time
+            changed = set()
+        if changed is None:
+            # Too much changed to follow line by line; load everything again once our own queued
+            # changes are written (otherwise they would be missing from the reloaded stock)
+            self.saver.flush()
+            self.load_stock()
+            self.refresh_display()
+        elif len(changed) > 50:
+            self.reindex(changed)
+            self.refresh_display()
+        else:
+            for item in changed:
+                self.refresh_item(item)
+        self.poll_job = self.root.after(self.poll_ms, self.check_for_changes)
+
+    # Method to update the status label with the total stock and remaining capacity
+    def update_status(self):
+        # Get the total stock quantity
+        total_stock = self.get_total_stock()
 
         # Calculate remaining capacity
         remaining = self.total_capacity - total_stock
@@ -256,8 +788,27 @@ class StockTakingApp:
 
         # Create status text with total stock and remaining capacity
         status_text = f"Total Stock: {total_stock}/{self.total_capacity} (Remaining: {remaining})"
+        if self.has_locations():
+            status_text = f"{self.location} - {status_text}"
+        # Add the alert counts (kept up to date item by item, so this doesn't look at the whole stock)
+        low_count = self.engine.alerts.low_count()
+        if low_count:
+            status_text += f"\nReorder: {low_count} item{'s' if low_count != 1 else ''}"
+        over = self.engine.alerts.over_capacity()
+        if over:
+            status_text += "\nOver capacity: " + ", ".join(category for category, _, _ in over)
+            color = "red"
+        # Add the stock value (kept up to date item by item as well)
+        if self.engine.valuation.has_prices():
+            cost_value, retail_value = self.engine.stock_value()
+            status_text += f"\nValue: {cost_value:,.2f} at cost, {retail_value:,.2f} at retail"
         # Update the status label with the text and color
         self.status_label.config(text=status_text, fg=color)
+        # Pop up any alert that has just started (an item falling to its reorder level, a category filling up)
+        messages = self.engine.take_alerts()
+        if messages:
+            more = f"\n...and {len(messages) - 10} more." if len(messages) > 10 else ""
+            messagebox.showwarning("Stock Alert", "\n".join(messages[:10]) + more)
 
     # Method to prompt the user to add stock items, validate input, and enforce capacity limits
     def add_stock(self):
@@ -270,46 +821,27 @@ class StockTakingApp:
                 return  # user cancelled
             # Strip whitespace from item name
             item_name = item_name.strip()
-            # Check if item name is empty
-            if not item_name:
-                messagebox.showerror("Input Error", "Item name cannot be empty.\t\t\t\t") #Error message
-                return
+            # Check the name before asking for the quantity (raises StockError if it is empty)
+            self.engine.check_name(item_name)
 
-            # Get the current total stock
-            current_total = self.get_total_stock()
             # Prompt the user for the quantity to add
             quantity = simpledialog.askinteger("Input", "Enter quantity to add:\t\t\t\t") #Used askinteger to make sure the user enters a number for the quantity
             # If user cancelled, return
             if quantity is None:
                 return  # cancelled
-            # Check if quantity is positive
-            if quantity <= 0:
-                messagebox.showerror("Input Error", "Quantity must be a positive integer.") #Error message
-                return
-
-            # Check if adding this quantity would exceed capacity
-            if current_total + quantity > self.total_capacity:
-                # Calculate maximum quantity that can be added
-                max_add = self.total_capacity - current_total
-                messagebox.showwarning(
-                    "Capacity Warning",
-                    f"Adding {quantity} would exceed capacity ({self.total_capacity}). Max add: {max_add}.", #Warning message
-                )
-                return
 
-            # Add or increment the item in the stock dictionary
-            self.stock[item_name.lower()] = self.stock.get(item_name.lower(), 0) + int(quantity)
+            # The engine checks the quantity and the capacity (O(1) using the running total),
+            # adds the stock and saves the change to the journal
+            self.engine.add(item_name, quantity)
             # Show success message
             messagebox.showinfo("Success", f"Added {quantity} of '{item_name}'.")
-            # Auto-save and refresh
-            try:
-                # Attempt to save the stock data
-                self.save_stock()
-            except Exception:
-                # save_stock already handles its own errors; we proceed to refresh anyway.
-                pass
-            # Refresh the display to show updated stock
-            self.refresh_display()
+            # Update only the row of the item that changed
+            self.refresh_item(item_name)
+        except CapacityError as error:
+            # Over capacity is a warning rather than an error
+            messagebox.showwarning(error.title, str(error)) #Warning message
+        except StockError as error:
+            messagebox.showerror(error.title, f"{error}\t\t\t\t") #Error message
         except Exception as e:
             # Show error message for any unexpected errors
             messagebox.showerror("Error", f"An unexpected error occurred: {e}") # General error handling
@@ -318,16 +850,12 @@ class StockTakingApp:
     def remove_stock(self):
         #Prompt user to remove stock. Use selection if available, else ask for item name.
         try:
-            # If user has selected a listbox item, try to parse it (format "Name: qty")
-            sel = self.stock_listbox.curselection()
-            item_name = None
-            if sel:
-                selected_text = self.stock_listbox.get(sel[0])
-                if ":" in selected_text:
-                    item_name = selected_text.split(":", 1)[0].strip()
-                elif selected_text == "No stock items available.": # Handle case where no items are available
-                    messagebox.showinfo("Remove Stock", "No items to remove.\t\t\t\t") # Informative message
-                    return
+            # If there are no items, there is nothing to remove
+            if not self.stock:
+                messagebox.showinfo("Remove Stock", "No items to remove.\t\t\t\t") # Informative message
+                return
+            # If user has selected a list row, use its item name (the row key)
+            item_name = self.stock_listbox.selected_key()
 
             if not item_name:
                 # Ask for item name explicitly if nothing selected
@@ -335,61 +863,607 @@ class StockTakingApp:
                 if item_name is None:
                     return
                 item_name = item_name.strip()
-                if not item_name:
-                    messagebox.showerror("Input Error", "Item name cannot be empty.\t\t\t\t") #Making sure that the user is actually inputting something
-                    return
+                self.engine.check_name(item_name) #Making sure that the user is actually inputting something
 
-            if item_name.lower() not in self.stock:
-                messagebox.showerror("Not Found", f"Item '{item_name}' not found in stock.\t\t\t\t") #Error if item isnt found or doesnt exist
-                return
+            if item_name not in self.stock:
+                raise StockError(f"Item '{item_name}' not found in stock.", "Not Found") #Error if item isnt found or doesnt exist
 
-            current_qty = int(self.stock[item_name.lower()]) #The current quantity of the item to be removed
+            current_qty = int(self.stock[item_name]) #The current quantity of the item to be removed
             # Ask how many to remove
             quantity = simpledialog.askinteger(
                 "Input", f"Enter quantity to remove (current: {current_qty}).\nEnter {current_qty} to remove all:" #Entering the amount to remove
             )
             if quantity is None:
                 return
-            if quantity <= 0:
-                messagebox.showerror("Input Error", "Quantity must be a positive integer.\t\t\t\t") #Error handling for invalid input
-                return
+            # Error handling for invalid input (raises StockError)
+            self.engine.check_quantity(quantity)
 
             if quantity > current_qty:
-                messagebox.showerror("Error", f"Cannot remove {quantity} as only {current_qty} available. Removing all instead.") #Error messagr
+                # Ask rather than quietly removing everything
+                if not messagebox.askyesno("Remove All?", f"Only {current_qty} of '{item_name}' in stock. Remove all of it?"):
+                    return
                 quantity = current_qty
 
-            if quantity >= current_qty:
-                # Remove the item entirely
-                del self.stock[item_name.lower()]
+            # Subtract quantity (the inventory deletes the item when nothing is left) and save the change
+            remaining = self.engine.remove(item_name, quantity)
+            if remaining == 0:
                 messagebox.showinfo("Removed", f"Removed all of '{item_name}'.")
             else:
-                # Subtract quantity
-                self.stock[item_name.lower()] = current_qty - int(quantity)
-                messagebox.showinfo("Removed", f"Removed {quantity} of '{item_name}'. Remaining: {self.stock[item_name.lower()]}") #Success message
+                messagebox.showinfo("Removed", f"Removed {quantity} of '{item_name}'. Remaining: {remaining}") #Success message
 
-            # Auto-save and refresh
-            try:
-                self.save_stock()
-            except Exception:
-                pass
-            self.refresh_display()
+            # Refresh the row of the item
+            self.refresh_item(item_name)
+        except StockError as error:
+            messagebox.showerror(error.title, f"{error}\t\t\t\t")
         except Exception as e:
             messagebox.showerror("Error", f"An unexpected error occurred: {e}") # General error handling
 
+    # Method to show what Undo and Redo would do in the Edit menu
+    def update_edit_menu(self):
+        undo_label = self.engine.undo_history.undo_label()
+        redo_label = self.engine.undo_history.redo_label()
+        self.edit_menu.entryconfig(0, label=f"Undo {undo_label}" if undo_label else "Undo", state=tk.NORMAL if undo_label else tk.DISABLED)
+        self.edit_menu.entryconfig(1, label=f"Redo {redo_label}" if redo_label else "Redo", state=tk.NORMAL if redo_label else tk.DISABLED)
+
+    # Method to undo the last stock edit
+    def undo_edit(self):
+        self.run_undo_step(self.engine.undo)
+
+    # Method to redo the last undone stock edit
+    def redo_edit(self):
+        self.run_undo_step(self.engine.redo)
+
+    # Method to run an undo or redo and refresh the items it changed
+    def run_undo_step(self, step):
+        try:
+            label, items = step()
+        except CapacityError as error:
+            messagebox.showwarning(error.title, str(error))
+            return
+        except StockError as error:
+            messagebox.showinfo(error.title, str(error))
+            return
+        self.refresh_items(items)
+
+    # Method to open the barcode scan window (or bring the open one to the front)
+    def open_scan_mode(self):
+        if self.scan_window is not None:
+            self.scan_window.lift()
+            self.scan_window.scan_entry.focus_set()
+            return
+        self.scan_window = ScanWindow(self)
+
+    # Method to add barcode -> item rows from a CSV file ("code,item") to the SKU map
+    def load_sku_map(self):
+        path = filedialog.askopenfilename(title="Load SKU Map", filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return  # user cancelled
+        try:
+            count = self.sku_map.import_csv(path)
+        except (IOError, ValueError) as error:
+            messagebox.showerror("Import Error", f"Could not read {os.path.basename(path)}: {error}")
+            return
+        messagebox.showinfo("SKU Map", f"Loaded {count} codes ({len(self.sku_map)} in the map).")
+
+    # Method to import a CSV or JSON file of stock counts in one go
+    def import_stock(self):
+        # Ask the user which file to import
+        path = filedialog.askopenfilename(
+            title="Import Stock", filetypes=[("Stock count files", "*.csv *.json"), ("All files", "*.*")]
+        )
+        if not path:
+            return  # user cancelled
+        try:
+            # Every row is checked like add_stock; nothing is added unless the whole file is valid,
+            # and the engine saves once at the end
+            result = self.engine.import_file(path)
+        except (IOError, ValueError) as error:
+            messagebox.showerror("Import Error", f"Could not read {os.path.basename(path)}: {error}")
+            return
+        if not result.applied:
+            messagebox.showerror("Import Error", result.summary())
+            return
+        # Re-index and refresh once for the whole import instead of once per row
+        self.reindex(result.quantities)
+        self.refresh_display()
+        messagebox.showinfo("Import", result.summary())
+
+    # Method to ask where to save a report (None if the user cancelled)
+    def ask_report_path(self, title):
+        return filedialog.asksaveasfilename(
+            title=title, defaultextension=".html", filetypes=[("HTML report", "*.html"), ("CSV file", "*.csv")]
+        ) or None
+
+    # Method to export the stock shown as a CSV or HTML report (a big stock is written by the report processes)
+    def export_report(self):
+        path = self.ask_report_path("Export Report")
+        if not path:
+            return  # user cancelled
+        title = f"Stock report - {self.location}" if self.has_locations() else "Stock report"
+        if self.locations is None or len(self.stock) < POOL_THRESHOLD or path.lower().endswith(".json"):
+            try:
+                # Rows are streamed to the file straight away
+                count = self.engine.export_file(path, title)
+            except (IOError, ValueError) as error:
+                messagebox.showerror("Export Error", f"Could not write {os.path.basename(path)}: {error}")
+                return
+            messagebox.showinfo("Export", f"Exported {count} items to {os.path.basename(path)}.")
+            return
+        location = self.locations.locations[self.location]
+        self.start_report(path, title, [(self.location, location["file"], location["capacity"])])
+
+    # Method to export every location side by side, one column each (each location is loaded in its own process)
+    def export_all_locations(self):
+        path = self.ask_report_path("Export All Locations")
+        if not path:
+            return  # user cancelled
+        if path.lower().endswith(".json"):
+            messagebox.showerror("Export Error", "Reports across locations are written as CSV or HTML.")
+            return
+        sources = [(name, location["file"], location["capacity"]) for name, location in self.locations.locations.items()]
+        self.start_report(path, "Stock report - all locations", sources)
+
+    # Method to hand a report to the report processes and follow its progress
+    def start_report(self, path, title, sources):
+        # The report processes read the stock files, so write every queued change first
+        self.saver.flush()
+        if self.report_pool is None:
+            self.report_pool = ReportPool()
+        self.report_pool.submit(path, title, sources)
+        if self.report_job is None:
+            self.report_job = self.root.after(200, self.check_reports)
+
+    # Method to show the progress of the reports being written in the title, and say when each one is done
+    def check_reports(self):
+        self.report_job = None
+        for job in self.report_pool.poll():
+            if job.error is not None:
+                messagebox.showerror("Export Error", f"Could not write {os.path.basename(job.path)}: {job.error}")
+            else:
+                messagebox.showinfo("Export", f"Exported {job.rows} items to {os.path.basename(job.path)}.")
+        if self.report_pool.jobs:
+            progress = ", ".join(f"{os.path.basename(job.path)} {job.progress_text()}" for job in self.report_pool.jobs.values())
+            self.root.title(f"{self.window_title()} (Exporting {progress})")
+            self.report_job = self.root.after(200, self.check_reports)
+        else:
+            self.root.title(self.window_title())
+
+    # Method to show how much of each item came in and went out over the last 7 days
+    def show_movement_report(self):
+        try:
+            rows = self.engine.movement_report(days=7)
+        except (IOError, StockError) as error:
+            messagebox.showerror("Report Error", f"Could not read the movement history: {error}")
+            return
+        lines = [f"{'Item':<30}{'In':>8}{'Out':>8}"]
+        lines += [f"{item:<30}{moved_in:>8}{moved_out:>8}" for item, moved_in, moved_out in rows]
+        if not rows:
+            lines.append("No stock movements in the last 7 days.")
+        self.show_report("Movements This Week", lines)
+
+    # Method to show one item's daily and weekly movements and its latest changes
+    def show_item_history(self):
+        # Default to the selected item in the list
+        item_name = simpledialog.askstring(
+            "Item History", "Enter item name:", initialvalue=self.stock_listbox.selected_key() or ""
+        )
+        if not item_name:
+            return  # user cancelled
+        try:
+            history = self.engine.item_history(item_name)
+        except (IOError, StockError) as error:
+            messagebox.showerror("Report Error", f"Could not read the movement history: {error}")
+            return
+        lines = [f"{'Week of':<14}{'In':>8}{'Out':>8}"]
+        lines += [f"{monday.isoformat():<14}{moved_in:>8}{moved_out:>8}" for monday, moved_in, moved_out in history["weeks"]]
+        lines += ["", f"{'Day':<14}{'In':>8}{'Out':>8}"]
+        lines += [f"{day.isoformat():<14}{moved_in:>8}{moved_out:>8}" for day, moved_in, moved_out in history["days"]]
+        lines += ["", "Latest movements:"]
+        lines += [f"{when:%Y-%m-%d %H:%M}  {delta:+d}" for when, delta in history["recent"]] or ["None yet."]
+        self.show_report(f"History: {Inventory.normalise(item_name)}", lines)
+
+    # Method to show the items at or below their reorder level, most urgent first
+    def show_reorder_list(self):
+        rows = self.engine.reorder_list(limit=200)
+        lines = [f"{'Item':<30}{'Qty':>8}{'Level':>8}"]
+        lines += [f"{item:<30}{quantity:>8}{level:>8}" for item, quantity, level in rows]
+        if not rows:
+            lines.append("Nothing needs reordering.")
+        self.show_report("Reorder List", lines)
+
+    # Method to check that the stock shown keeps a movement history to forecast from (not through the server)
+    def can_forecast(self):
+        if self.engine.history is None:
+            messagebox.showinfo("Demand Forecast", "Forecasts are made from the movement history kept with the stock file, so they aren't available through the stock server.")
+            return False
+        return True
+
+    # Method to show suggested reorder quantities straight away from the cached forecast (worked out
+    # again in the background when it is missing or from an earlier day)
+    def show_reorder_suggestions(self):
+        if not self.can_forecast():
+            return
+        forecast = self.engine.cached_forecast()
+        if forecast is None:
+            self.update_forecast(show=True)
+            return
+        self.show_suggestions(self.engine, forecast)
+        if not forecast.get("made", "").startswith(time.strftime("%Y-%m-%d")):
+            self.update_forecast(show=False)
+
+    # Method to work out the demand forecast of the stock shown in a background process
+    def update_forecast(self, show=True):
+        if not self.can_forecast():
+            return
+        # The forecast process reads the movement history, so write every queued movement first
+        self.saver.flush()
+        if self.forecast_runner is None:
+            self.forecast_runner = ForecastRunner()
+        if self.forecast_runner.start(self.engine.stock_file, self.engine.forecast_file):
+            self.forecast_engine = self.engine
+        self.forecast_show = self.forecast_show or show
+        self.root.title(f"{self.window_title()} (Forecasting demand...)")
+        if self.forecast_job is None:
+            self.forecast_job = self.root.after(200, self.check_forecast)
+
+    # Method to pick up the forecast once the background process has cached it
+    def check_forecast(self):
+        self.forecast_job = None
+        result = self.forecast_runner.poll()
+        if result is None:
+            self.forecast_job = self.root.after(200, self.check_forecast)
+            return
+        self.root.title(self.window_title())
+        show, self.forecast_show = self.forecast_show, False
+        count, error = result
+        if error is not None:
+            messagebox.showerror("Forecast Error", f"Could not work out the demand forecast: {error}")
+            return
+        forecast = self.forecast_engine.reload_forecast()
+        if show:
+            self.show_suggestions(self.forecast_engine, forecast)
+
+    # Method to show an engine's reorder suggestions (the items that will run out soonest first)
+    def show_suggestions(self, engine, forecast):
+        rows = engine.reorder_suggestions()
+        lines = [
+            f"Forecast {forecast['made']} ({forecast['method']}, {forecast['days']} days)",
+            f"Topping up to {COVER_DAYS} days of demand, within",
+            f"the remaining capacity ({max(0, engine.remaining())}).",
+            "",
+            f"{'Item':<20}{'Qty':>7}{'/day':>7}{'Days':>6}{'Order':>8}",
+        ]
+        lines += [
+            f"{item:<20}{quantity:>7}{rate:>7.1f}{days_left:>6.0f}{order:>8}"
+            for item, quantity, rate, days_left, order in rows[:200]
+        ]
+        if rows:
+            lines += ["", f"{len(rows)} items to order, {sum(row[4] for row in rows)} units in all."]
+        else:
+            lines.append("Nothing needs reordering.")
+        self.show_report("Reorder Suggestions", lines)
+
+    # Method to ask for an item and set its reorder level
+    def set_reorder_level(self):
+        item_name = simpledialog.askstring(
+            "Reorder Level", "Enter item name:", initialvalue=self.stock_listbox.selected_key() or ""
+        )
+        if not item_name:
+            return  # user cancelled
+        level = simpledialog.askinteger("Reorder Level", "Alert when the quantity falls to (0 = never):", minvalue=0)
+        if level is None:
+            return  # cancelled
+        self.change_alert_settings(lambda: self.engine.set_reorder_level(item_name, level))
+
+    # Method to ask for an item and the category it belongs to
+    def set_item_category(self):
+        item_name = simpledialog.askstring(
+            "Item Category", "Enter item name:", initialvalue=self.stock_listbox.selected_key() or ""
+        )
+        if not item_name:
+            return  # user cancelled
+        category = simpledialog.askstring("Item Category", "Enter category (leave empty for none):")
+        if category is None:
+            return  # cancelled
+        self.change_alert_settings(lambda: self.engine.set_category(item_name, category))
+
+    # Method to ask for a category and its capacity
+    def set_category_capacity(self):
+        category = simpledialog.askstring("Category Capacity", "Enter category:")
+        if not category:
+            return  # user cancelled
+        capacity = simpledialog.askinteger("Category Capacity", "Maximum total stock in this category:", minvalue=0)
+        if capacity is None:
+            return  # cancelled
+        self.change_alert_settings(lambda: self.engine.set_category_capacity(category, capacity))
+
+    # Method to apply an alert settings change and show the new alert state
+    def change_alert_settings(self, change):
+        try:
+            change()
+        except StockError as error:
+            messagebox.showerror(error.title, str(error))
+            return
+        except (IOError, ValueError) as error:
+            messagebox.showerror("Error", f"Could not save the alert settings: {error}")
+            return
+        self.update_status()
+
+    # Method to ask for an item, a quantity and what it cost, and add it at that cost
+    def receive_stock(self):
+        item_name = simpledialog.askstring(
+            "Receive Stock", "Enter item name:", initialvalue=self.stock_listbox.selected_key() or ""
+        )
+        if not item_name:
+            return  # user cancelled
+        quantity = simpledialog.askinteger("Receive Stock", "Quantity received:", minvalue=1)
+        if quantity is None:
+            return  # cancelled
+        unit_cost = simpledialog.askfloat("Receive Stock", "Cost per unit:", minvalue=0)
+        if unit_cost is None:
+            return  # cancelled
+        try:
+            self.engine.add(item_name, quantity, unit_cost)
+        except CapacityError as error:
+            messagebox.showwarning(error.title, str(error))
+            return
+        except StockError as error:
+            messagebox.showerror(error.title, str(error))
+            return
+        self.refresh_item(Inventory.normalise(item_name))
+
+    # Method to ask for an item and set its unit cost and/or retail price
+    def set_item_price(self):
+        item_name = simpledialog.askstring(
+            "Cost and Price", "Enter item name:", initialvalue=self.stock_listbox.selected_key() or ""
+        )
+        if not item_name:
+            return  # user cancelled
+        current = self.engine.valuation.item(Inventory.normalise(item_name))
+        cost = simpledialog.askstring(
+            "Cost and Price", "Cost per unit (leave empty to keep it):\nStock on hand is valued at the new cost.",
+            initialvalue=f"{current[2]:.2f}" if current else "",
+        )
+        if cost is None:
+            return  # cancelled
+        price = simpledialog.askstring(
+            "Cost and Price", "Retail price (leave empty to keep it):", initialvalue=f"{current[3]:.2f}" if current else ""
+        )
+        if price is None:
+            return  # cancelled
+        self.change_prices(lambda: self.engine.set_item_price(item_name, cost.strip() or None, price.strip() or None))
+
+    # Method to ask for a CSV file of item,cost,price rows and import it
+    def import_prices(self):
+        path = filedialog.askopenfilename(title="Import Prices", filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return  # user cancelled
+        count = self.change_prices(lambda: self.engine.import_prices(path))
+        if count is not None:
+            messagebox.showinfo("Import Prices", f"Priced {count} items from {os.path.basename(path)}.")
+
+    # Method to choose between average and FIFO costing
+    def set_costing(self):
+        method = simpledialog.askstring(
+            "Costing Method",
+            "Value stock on hand by:\n  average - weighted average cost\n  fifo - first in, first out",
+            initialvalue=self.engine.valuation.method,
+        )
+        if not method:
+            return  # user cancelled
+        self.change_prices(lambda: self.engine.set_costing(method.strip().lower()))
+
+    # Method to apply a prices change and show the new stock value; returns what the change returned
+    def change_prices(self, change):
+        try:
+            result = change()
+        except StockError as error:
+            messagebox.showerror(error.title, str(error))
+            return None
+        except (IOError, ValueError) as error:
+            messagebox.showerror("Error", f"Could not save the prices: {error}")
+            return None
+        self.update_status()
+        return result
+
+    # Method to show the stock value and the items worth the most
+    def show_stock_value(self):
+        cost_value, retail_value = self.engine.stock_value()
+        lines = [
+            f"Costing: {self.engine.valuation.method}",
+            f"At cost:   {cost_value:>14,.2f}",
+            f"At retail: {retail_value:>14,.2f}",
+            "",
+            f"{'Item':<20}{'Qty':>8}{'Cost':>11}{'Retail':>11}",
+        ]
+        rows = self.engine.valuation_rows(limit=200)
+        lines += [f"{item:<20}{quantity:>8}{cost:>11,.2f}{retail:>11,.2f}" for item, quantity, cost, retail in rows]
+        if not rows:
+            lines.append("No priced items in stock.")
+        self.show_report("Stock Value", lines)
+
+    # Method to finish or roll back transfers a stopped terminal left halfway (on the main thread, since
+    # they may change SQLite locations)
+    def recover_transfers(self):
+        if not self.has_locations():
+            return
+        try:
+            messages = self.locations.recover()
+        except (IOError, ValueError, sqlite3.Error, StockError) as error:
+            messagebox.showerror("Transfer Error", f"Could not finish an interrupted transfer: {error}")
+            return
+        if messages:
+            messagebox.showwarning("Transfer", "Interrupted transfers:\n" + "\n".join(messages))
+            self.refresh_display()
+
+    # Method to load the locations not shown, in parallel from the persistence worker, so switching to
+    # them or moving stock to them is instant later (SQLite ones load when first used instead)
+    def load_other_locations(self):
+        if not self.has_locations():
+            return
+        # Engines are opened here, on the main thread, which SQLite connections are tied to
+        others = [name for name in self.locations.names() if name != self.location and self.locations.engine(name).background_safe]
+        if others:
+            self.saver.submit(lambda: self.locations.load_all(others), on_done=self.show_location_errors)
+
+    # Method to report locations that could not be loaded in the background
+    def show_location_errors(self, results):
+        errors = [f"{name}: {error}" for name, (report, error) in results.items() if error is not None]
+        if errors:
+            messagebox.showerror("Load Error", "Could not load:\n" + "\n".join(errors))
+
+    # Method to show another location's stock (loads it first if it hasn't loaded yet)
+    def switch_location(self, name):
+        if name == self.location:
+            return
+        self.location = name
+        self.location_var.set(name)
+        self.engine = self.locations.engine(name)
+        if self.locations.is_loaded(name):
+            self.show_loaded((None, None))
+        else:
+            # Waits for the background load if it is loading this location right now
+            self.show_loaded(self.load_job(self.show_load_progress, reload=False))
+        self.refresh_display()
+
+    # Method to move stock of an item from the location shown to another one
+    def transfer_stock(self):
+        others = [name for name in self.locations.names() if name != self.location]
+        item_name = simpledialog.askstring(
+            "Transfer Stock", "Enter item name:", initialvalue=self.stock_listbox.selected_key() or ""
+        )
+        if not item_name:
+            return  # user cancelled
+        quantity = simpledialog.askinteger("Transfer Stock", f"Quantity to move from {self.location}:", minvalue=1)
+        if quantity is None:
+            return  # cancelled
+        target = simpledialog.askstring(
+            "Transfer Stock", "Move to which location?\n" + "\n".join(others), initialvalue=others[0]
+        )
+        if not target:
+            return  # cancelled
+        try:
+            target = self.locations.find(target)
+            # Both sides are checked before either changes
+            left, moved_to = self.locations.transfer(item_name, quantity, self.location, target)
+        except CapacityError as error:
+            messagebox.showwarning(error.title, str(error))
+            return
+        except StockError as error:
+            messagebox.showerror(error.title, str(error))
+            return
+        except (IOError, ValueError, sqlite3.Error) as error:
+            messagebox.showerror("Load Error", f"Could not load {target}: {error}")
+            return
+        item = Inventory.normalise(item_name)
+        messagebox.showinfo("Transfer", f"Moved {quantity} of '{item}' to {target} ({moved_to} there now, {left} left here).")
+        self.refresh_item(item)
+
+    # Method to show each location's total and, if an item is selected, how much of it each one has
+    def show_location_totals(self):
+        totals = self.locations.totals()
+        lines = [f"{'Location':<24}{'Stock':>10}{'Capacity':>10}"]
+        lines += [f"{name:<24}{total:>10}{capacity:>10}" for name, total, capacity in totals]
+        lines.append(f"{'All locations':<24}{sum(row[1] for row in totals):>10}{sum(row[2] for row in totals):>10}")
+        loading = [name for name in self.locations.names() if not self.locations.is_loaded(name)]
+        if loading:
+            lines += ["", "Not loaded yet: " + ", ".join(loading)]
+        item = self.stock_listbox.selected_key()
+        if item:
+            quantities = self.locations.item_totals(item)
+            lines += ["", f"{item}:"]
+            lines += [f"  {name:<22}{quantity:>10}" for name, quantity in quantities.items()]
+            lines.append(f"  {'All locations':<22}{sum(quantities.values()):>10}")
+        self.show_report("Location Totals", lines)
+
+    # Method to open the diagnostics window (or bring the open one to the front)
+    def open_diagnostics(self):
+        if self.diagnostics_window is not None:
+            self.diagnostics_window.lift()
+            return
+        self.diagnostics_window = DiagnosticsWindow(self)
+
+    # Method to show report lines in a read-only text window
+    def show_report(self, title, lines):
+        window = tk.Toplevel(self.root)
+        window.title(title)
+        text = tk.Text(window, width=50, height=25, font=("Courier", 11))
+        scrollbar = tk.Scrollbar(window, command=text.yview)
+        text.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        text.insert("1.0", "\n".join(lines))
+        text.configure(state=tk.DISABLED)
+
     # Method to handle the window closing event, auto-saving stock data before destroying the root window
     def on_closing(self):
         #Auto-save on window close, then destroy root.
+        if self.poll_job is not None:
+            self.root.after_cancel(self.poll_job)
+        self.cancel_fill()
+        if self.report_job is not None:
+            self.root.after_cancel(self.report_job)
+        if self.report_pool is not None:
+            # Reports already being written are finished by their processes
+            self.report_pool.shutdown()
+        if self.forecast_job is not None:
+            self.root.after_cancel(self.forecast_job)
+        if self.forecast_runner is not None:
+            self.forecast_runner.shutdown()
+        if profiler.enabled:
+            # Keep this session's timings next to the stock file
+            try:
+                profiler.dump(os.path.join(os.path.dirname(os.path.abspath(self.stock_file)), "stock_profile.json"))
+            except (IOError, OSError):
+                pass
+        if not self.loaded:
+            # Closed while still loading: nothing has been changed, so there is nothing to save
+            self.saver.stop(timeout=0)
+            self.root.destroy()
+            return
         try:
-            # Attempt to save silently (don't spam user with error on close)
-            with open(self.stock_file, "w") as file:
-                json.dump(self.stock, file, indent=4)
+            # Attempt to save silently (don't spam user with error on close); with locations, every
+            # loaded location is saved, since transfers change the one not shown too
+            if self.locations is not None:
+                self.locations.save()
+            else:
+                self.save_stock(quiet=True)
+            # Wait a bounded time for the worker to finish every queued write
+            if not self.saver.stop(timeout=5.0):
+                raise IOError("saving took too long")
+            # Report any write that failed while we were waiting
+            self.saver.report_finished()
+            if self.locations is not None:
+                self.locations.close()
+            else:
+                self.engine.close()
         except Exception:
             # If save fails, still attempt to close gracefully after informing user.
             messagebox.showwarning("Save Warning", "Could not save stock data on exit.") # Warning message
         finally:
             self.root.destroy()
 
+# Function to turn on timing of the GUI callbacks, the engine and storage (stock_v4.py --profile)
+def enable_profiling():
+    profiler.enabled = True
+    profiler.instrument(StockTakingApp, [
+        "add_stock", "remove_stock", "refresh_display", "refresh_item", "save_stock", "load_stock", "load_job",
+        "fill_chunk", "show_search_results", "check_for_changes", "update_status", "undo_edit", "redo_edit",
+        "switch_location", "export_report",
+    ])
+    profiler.instrument(RoundedButton, ["draw_button"])
+    profiler.instrument_engine()
+
 if __name__ == "__main__":
+    # Optional stock file argument, e.g. "python stock_v4.py stock_data.db" for the SQLite backend,
+    # or "python stock_v4.py --server 127.0.0.1:8765" to use a running stock_server.py
+    parser = argparse.ArgumentParser(description="Stock Taking System")
+    parser.add_argument("stock_file", nargs="?", default="stock_data.json")
+    parser.add_argument("--server", help="stock server address (host:port or socket path)")
+    parser.add_argument("--profile", action="store_true", help="time callbacks and storage (Reports > Diagnostics)")
+    args = parser.parse_args()
+    if args.profile:
+        enable_profiling()
     root = tk.Tk()
-    app = StockTakingApp(root)
+    app = StockTakingApp(root, args.stock_file, args.server)
     root.mainloop()
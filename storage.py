@@ -0,0 +1,346 @@
+
+import os # For checking if files exist
+import sqlite3 # For the SQLite backend (part of the standard library)
+import sys # For the migration command line
+
+from inventory import Inventory # In-memory stock model with a running total
+from journal import StockJournal # Append-only log of changes for the JSON backend
+from snapshot import JsonSnapshot, BinarySnapshot # Snapshot file formats
+from stream_loader import LoadReport # Counts of loaded and bad rows
+
+# Pluggable storage for the stocktaking app
+# Every backend has the same methods, so StockTakingApp doesn't care where the stock lives:
+#   load(capacity, progress)  -> returns the inventory object the app works with
+#   empty_inventory(capacity) -> the inventory to carry on with when load failed
+#   record_many(changes, sync) -> called with (item, change in quantity) pairs after items changed;
+#                                sync means they must be on disk (not just written) when it returns;
+#                                returns True when it is time to save a full snapshot
+#   save()                    -> called when the user clicks Save or closes the window
+#   poll(inventory)           -> picks up changes made by other terminals (set of changed items,
+#                                or None if the whole stock has to be loaded again)
+#   close()                   -> releases files/connections
+# background_safe says whether record/save may run on the persistence worker thread
+# (an sqlite3 connection can only be used from the thread that opened it).
+# JsonStorage keeps the original stock_data.json format (plus the write-ahead journal).
+# BinaryStorage works the same way but keeps the snapshot in the compact binary format
+# (snapshot.py), which loads and saves big catalogues much faster.
+# SqliteStorage keeps items in an indexed SQLite table, so lookups, adds, removes and the total are
+# queries instead of whole-dict operations and nothing has to be parsed at startup. The items running
+# low are found with an index on the quantity, so the alerts don't read the whole table either.
+
+# File extensions that mean "use the SQLite backend"
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+# File extensions that mean "use the binary snapshot backend"
+BINARY_EXTENSIONS = (".stock",)
+
+
+# Define the JsonStorage class that loads stock_data.json and journals changes next to it
+class JsonStorage:
+    # Storage backend for the original JSON snapshot file.
+
+    # Journal appends and snapshots are plain file writes, so they can run on the worker thread
+    background_safe = True
+    # How the snapshot file is read and written
+    snapshot_format = JsonSnapshot
+
+    # Initialize the JsonStorage with the path of the JSON file
+    def __init__(self, path):
+        self.path = path
+        self.journal = StockJournal(path, snapshot_format=self.snapshot_format)
+        # Report from the last load (counts of loaded and bad rows)
+        self.report = LoadReport()
+
+    # Method to stream the JSON snapshot into an Inventory and replay the journal on top of it
+    def load(self, capacity, progress=None):
+        # Raises json.JSONDecodeError / IOError for the app to report
+        # progress(bytes_read, total_bytes) is called while the snapshot is read
+        inventory = self.snapshot_format.inventory_class(capacity=capacity)
+        # Entries go straight into the inventory one at a time; bad quantities become 0 and are counted
+        self.report = self.journal.load(inventory, progress)
+        return inventory
+
+    # Method to return an empty inventory of the kind load returns (changes still go to the journal)
+    def empty_inventory(self, capacity):
+        return self.snapshot_format.inventory_class(capacity=capacity)
+
+    # Method to append item changes to the journal
+    def record_many(self, changes, sync=False):
+        # Returns True when the journal should be folded back into the snapshot
+        return self.journal.record_many(changes, sync)
+
+    # Method to fold every terminal's journalled changes into a fresh snapshot
+    def save(self):
+        self.journal.compact()
+
+    # Method to apply changes other terminals have journalled since the last poll
+    def poll(self, inventory):
+        return self.journal.poll(inventory)
+
+    # Method to close the journal file
+    def close(self):
+        self.journal.close()
+
+
+# Define the BinaryStorage class: the same snapshot + journal scheme with a binary snapshot file
+class BinaryStorage(JsonStorage):
+    # Storage backend for the compact binary snapshot (e.g. stock_data.stock).
+
+    snapshot_format = BinarySnapshot
+
+
+# Define the SqliteInventory class that works like Inventory but keeps the items in an SQLite table
+class SqliteInventory:
+    # Inventory whose items live in an indexed table; the total is kept by triggers.
+
+    # Initialize the SqliteInventory with an open connection and the capacity limit
+    def __init__(self, connection, capacity=1000):
+        self.connection = connection
+        self.capacity = capacity
+
+    # Method to turn a user-entered item name into the key used in the table
+    normalise = staticmethod(Inventory.normalise)
+
+    # Method to return the total quantity from the one-row total table (O(1))
+    def total(self):
+        return self.connection.execute("SELECT total FROM stock_total WHERE id = 0").fetchone()[0]
+
+    # Method to return how much more stock can be added before hitting the capacity
+    def remaining(self):
+        return self.capacity - self.total()
+
+    # Method to check whether a quantity can be added without exceeding the capacity
+    def can_add(self, quantity):
+        return self.total() + int(quantity) <= self.capacity
+
+    # Method to get the quantity of an item with a primary key lookup
+    def get(self, name, default=0):
+        row = self.connection.execute("SELECT quantity FROM stock WHERE item = ?", (self.normalise(name),)).fetchone()
+        return row[0] if row else default
+
+    # Method to set the quantity of an item directly
+    def set(self, name, quantity):
+        quantity = int(quantity)
+        self.connection.execute(
+            "INSERT INTO stock (item, quantity) VALUES (?, ?) ON CONFLICT(item) DO UPDATE SET quantity = excluded.quantity",
+            (self.normalise(name), quantity),
+        )
+        return quantity
+
+    # Method to delete an item completely, returning the quantity it had
+    def discard(self, name):
+        quantity = self.get(name)
+        self.connection.execute("DELETE FROM stock WHERE item = ?", (self.normalise(name),))
+        return quantity
+
+    # Method to add a quantity to an item and return the new quantity
+    def add(self, name, quantity):
+        key = self.normalise(name)
+        self.connection.execute(
+            "INSERT INTO stock (item, quantity) VALUES (?, ?) ON CONFLICT(item) DO UPDATE SET quantity = quantity + excluded.quantity",
+            (key, int(quantity)),
+        )
+        return self.get(key)
+
+    # Method to remove a quantity from an item and return what is left (0 means the item was deleted)
+    def remove(self, name, quantity):
+        key = self.normalise(name)
+        if key not in self:
+            raise KeyError(key)
+        # Subtract in SQL so a change another terminal committed in between isn't overwritten
+        self.connection.execute("UPDATE stock SET quantity = MAX(quantity - ?, 0) WHERE item = ?", (int(quantity), key))
+        remaining = self.get(key)
+        if remaining <= 0:
+            self.connection.execute("DELETE FROM stock WHERE item = ?", (key,))
+            return 0
+        return remaining
+
+    # Method to recount the total from the table and check it matches the trigger-kept total
+    def check_consistency(self):
+        recount = self.connection.execute("SELECT COALESCE(SUM(quantity), 0) FROM stock").fetchone()[0]
+        if recount != self.total():
+            raise AssertionError(f"Running total {self.total()} does not match recount {recount}")
+        return True
+
+    # Method to return [(item, quantity)] for the items with at most this quantity (uses the quantity index)
+    def at_or_below(self, level):
+        return self.connection.execute("SELECT item, quantity FROM stock WHERE quantity <= ?", (int(level),)).fetchall()
+
+    # Method to return one page of items in name order (uses the primary key index)
+    def page(self, after="", limit=100):
+        return self.connection.execute(
+            "SELECT item, quantity FROM stock WHERE item > ? ORDER BY item LIMIT ?", (after, limit)
+        ).fetchall()
+
+    # Method to return a plain dictionary copy of every item
+    def to_dict(self):
+        return dict(self.items())
+
+    # Dictionary-style helpers so the app can use it the same way as Inventory
+    def __contains__(self, name):
+        return self.get(name, None) is not None
+
+    def __getitem__(self, name):
+        quantity = self.get(name, None)
+        if quantity is None:
+            raise KeyError(name)
+        return quantity
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM stock").fetchone()[0]
+
+    def __iter__(self):
+        return (row[0] for row in self.connection.execute("SELECT item FROM stock ORDER BY item"))
+
+    def __bool__(self):
+        return self.connection.execute("SELECT 1 FROM stock LIMIT 1").fetchone() is not None
+
+    def items(self):
+        return self.connection.execute("SELECT item, quantity FROM stock ORDER BY item").fetchall()
+
+    def keys(self):
+        return list(self)
+
+    # The table is read in primary key order already
+    def sorted_keys(self):
+        return list(self)
+
+    def sorted_items(self):
+        return self.items()
+
+    def values(self):
+        return [row[1] for row in self.items()]
+
+
+# Define the SqliteStorage class that opens the database and hands out a SqliteInventory
+class SqliteStorage:
+    # Storage backend that keeps items in an indexed SQLite table.
+
+    # The connection belongs to the main thread; commits are small and cheap in WAL mode anyway
+    background_safe = False
+
+    # Initialize the SqliteStorage with the database path, creating the tables if needed
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        # WAL with normal sync makes each small commit cheap while staying crash-safe
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.create_tables()
+
+    # Method to create the stock table, the total table and the triggers that keep the total
+    def create_tables(self):
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS stock (
+                item TEXT PRIMARY KEY,
+                quantity INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS stock_quantity ON stock (quantity);
+            CREATE TABLE IF NOT EXISTS stock_total (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                total INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO stock_total (id, total) VALUES (0, 0);
+            CREATE TRIGGER IF NOT EXISTS stock_insert AFTER INSERT ON stock BEGIN
+                UPDATE stock_total SET total = total + NEW.quantity WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS stock_update AFTER UPDATE OF quantity ON stock BEGIN
+                UPDATE stock_total SET total = total - OLD.quantity + NEW.quantity WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS stock_delete AFTER DELETE ON stock BEGIN
+                UPDATE stock_total SET total = total - OLD.quantity WHERE id = 0;
+            END;
+            """
+        )
+        self.connection.commit()
+
+    # Method to return the inventory (nothing is read up front; every operation is a query)
+    def load(self, capacity, progress=None):
+        self._data_version = self._read_data_version()
+        return SqliteInventory(self.connection, capacity)
+
+    # Method to return the inventory when load failed: the table itself, since every change is written
+    # straight to it
+    def empty_inventory(self, capacity):
+        return SqliteInventory(self.connection, capacity)
+
+    # Method to commit the changes that the inventory already wrote to the table
+    def record_many(self, changes, sync=False):
+        self.connection.commit()
+        if sync:
+            # With synchronous=NORMAL a WAL commit isn't synced until the next checkpoint, and the safety
+            # level can't change inside the transaction, so checkpoint now (the WAL is synced first)
+            self.connection.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        # Our own commit doesn't change data_version for this connection
+        return False
+
+    # Method to commit any outstanding changes
+    def save(self):
+        self.connection.commit()
+
+    # Method to check for commits by other terminals; SQLite's locking already merges them, so the
+    # inventory is always current and only the display needs refreshing (None means "refresh it all")
+    def poll(self, inventory):
+        data_version = self._read_data_version()
+        if data_version == self._data_version:
+            return set()
+        self._data_version = data_version
+        return None
+
+    # Method to read SQLite's counter that changes whenever another connection commits
+    def _read_data_version(self):
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    # Method to commit and close the database
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+# Function to pick the storage backend from the file name
+def open_storage(path):
+    if path.lower().endswith(SQLITE_EXTENSIONS):
+        return SqliteStorage(path)
+    if path.lower().endswith(BINARY_EXTENSIONS):
+        return BinaryStorage(path)
+    return JsonStorage(path)
+
+
+# Function to copy an existing stock_data.json (and its journal) into an SQLite database
+def migrate_json_to_sqlite(json_path, db_path):
+    # Load the JSON data exactly the way the app does, so names and bad values are cleaned the same way
+    source = JsonStorage(json_path)
+    items = source.load(capacity=0).to_dict()
+    source.close()
+    target = SqliteStorage(db_path)
+    # Insert everything in one transaction
+    with target.connection:
+        target.connection.executemany(
+            "INSERT INTO stock (item, quantity) VALUES (?, ?) ON CONFLICT(item) DO UPDATE SET quantity = excluded.quantity",
+            items.items(),
+        )
+    target.close()
+    return len(items)
+
+
+# Function to copy an existing stock_data.json (and its journal) into a binary snapshot
+def migrate_json_to_binary(json_path, binary_path):
+    source = JsonStorage(json_path)
+    inventory = source.load(capacity=0)
+    source.close()
+    with open(binary_path + ".tmp", "wb") as file:
+        file.write(BinarySnapshot.dump(inventory))
+    os.replace(binary_path + ".tmp", binary_path)
+    return len(inventory)
+
+
+if __name__ == "__main__":
+    # Usage: python storage.py stock_data.json stock_data.db   (or stock_data.stock for the binary format)
+    if len(sys.argv) != 3:
+        print("Usage: python storage.py <stock_data.json> <stock_data.db | stock_data.stock>")
+        sys.exit(1)
+    if sys.argv[2].lower().endswith(BINARY_EXTENSIONS):
+        count = migrate_json_to_binary(sys.argv[1], sys.argv[2])
+    else:
+        count = migrate_json_to_sqlite(sys.argv[1], sys.argv[2])
+    print(f"Migrated {count} items from {sys.argv[1]} to {sys.argv[2]}")
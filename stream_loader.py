@@ -0,0 +1,146 @@
+
+import json # For decoding a block of entries at a time
+import os # For the file size used in progress reports
+
+# Streaming loader for stock_data.json
+# json.load reads the whole file into one big dict before the app cleans it into a second dict.
+# This loader reads the file in chunks, decodes the "name": quantity entries of each chunk in one go
+# and puts them straight into the inventory, so memory stays at about one copy of the catalogue. Rows whose
+# quantity isn't a whole number are counted and reported instead of silently becoming 0.
+
+# Size of each chunk read from the file
+CHUNK_SIZE = 1024 * 1024
+# How many commas from the end of a chunk are tried as the end of its block before reading more
+MAX_CUT_TRIES = 8
+# How many bad rows to keep as examples in the report
+MAX_BAD_EXAMPLES = 20
+
+# Whitespace characters allowed before the opening brace
+_WHITESPACE = " \t\n\r"
+
+
+# Define the LoadReport class that sums up what happened during a load
+class LoadReport:
+    # Counts of loaded and bad rows plus a few bad examples.
+
+    # Initialize the LoadReport with zero counts
+    def __init__(self):
+        # Number of rows put into the inventory
+        self.loaded = 0
+        # Number of rows whose quantity couldn't be turned into a whole number
+        self.bad = 0
+        # A few (name, raw value) examples of bad rows to show the user
+        self.bad_examples = []
+
+    # Method to note a bad row
+    def add_bad(self, name, value):
+        self.bad += 1
+        if len(self.bad_examples) < MAX_BAD_EXAMPLES:
+            self.bad_examples.append((name, value))
+
+    # Method to make a short message for the user
+    def summary(self):
+        text = f"Loaded {self.loaded} items."
+        if self.bad:
+            examples = ", ".join(f"{name!r}={value!r}" for name, value in self.bad_examples[:5])
+            text += f" {self.bad} rows had invalid quantities and were set to 0 (e.g. {examples})."
+        return text
+
+
+# Function to turn a raw JSON value into a whole-number quantity (None if it isn't one)
+def clean_quantity(value):
+    # Booleans are ints in Python but are never a valid quantity
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            return None
+    return None
+
+
+# Function to yield dictionaries of entries from a file holding one JSON object, one block at a time
+def iter_json_blocks(file, progress=None, total_bytes=None, chunk_size=CHUNK_SIZE):
+    # Each block of text up to its last comma is decoded in one json.loads call (so the parsing runs in
+    # C, not one Python call per entry). A comma inside a name or a nested value can't be mistaken for
+    # the end of an entry: the text up to it would leave a string or bracket open and fail to decode,
+    # so an earlier comma is tried, or more text is read first.
+    buffer = ""
+    position = 0
+    bytes_read = 0
+    started = False
+    # Whether the text before position ended at a comma
+    cut_before = False
+    while True:
+        chunk = file.read(chunk_size)
+        if chunk:
+            # Drop the part already decoded so the buffer never grows past a chunk or two
+            buffer = buffer[position:] + chunk
+            position = 0
+            bytes_read += len(chunk)
+            if progress:
+                progress(bytes_read, total_bytes)
+        if not started:
+            # The opening brace, before the first block
+            start = len(buffer) - len(buffer.lstrip(_WHITESPACE))
+            if start == len(buffer) and chunk:
+                continue
+            if buffer[start:start + 1] != "{":
+                raise json.JSONDecodeError("Expecting '{' at the start of the stock file", buffer, start)
+            position = start + 1
+            started = True
+        if not chunk:
+            # The rest holds the last entries and the closing brace (raises a real error if it's broken)
+            rest = json.loads("{" + buffer[position:])
+            # After a block's comma another entry has to follow ("{"a": 1,}" isn't JSON)
+            if not isinstance(rest, dict) or (cut_before and not rest):
+                raise json.JSONDecodeError("Expecting one JSON object", buffer, position)
+            if rest:
+                yield rest
+            return
+        cut = len(buffer)
+        for _ in range(MAX_CUT_TRIES):
+            cut = buffer.rfind(",", position, cut)
+            if cut < 0:
+                break
+            try:
+                block = json.loads("{" + buffer[position:cut] + "}")
+            except ValueError:
+                continue
+            if not block:
+                # Nothing between two commas, or between the brace and a comma
+                raise json.JSONDecodeError("Expecting item name", buffer, cut)
+            position = cut + 1
+            cut_before = True
+            yield block
+            break
+
+
+# Function to yield (name, raw value) pairs from a file holding one JSON object, one entry at a time
+def iter_json_object(file, progress=None, total_bytes=None, chunk_size=CHUNK_SIZE):
+    for block in iter_json_blocks(file, progress, total_bytes, chunk_size):
+        yield from block.items()
+
+
+# Function to stream a stock JSON file into an inventory, returning a LoadReport
+def load_into(path, inventory, progress=None):
+    # progress(bytes_read, total_bytes) is called after each chunk so the GUI can show a progress bar
+    report = LoadReport()
+    total_bytes = os.path.getsize(path)
+    with open(path, "r") as file:
+        for block in iter_json_blocks(file, progress, total_bytes):
+            for name, value in block.items():
+                # Whole numbers (the usual case) skip clean_quantity
+                quantity = value if type(value) is int else clean_quantity(value)
+                if quantity is None:
+                    # Keep the old behaviour (the item stays with 0) but count it so the user finds out
+                    report.add_bad(name, value)
+                    quantity = 0
+                inventory.set(name, quantity)
+            report.loaded += len(block)
+    return report
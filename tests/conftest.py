@@ -0,0 +1,24 @@
+import pytest # For the shared fixtures
+
+from stock_engine import StockEngine # Headless stock rules and storage
+
+# Shared fixtures for the stocktaking app tests
+# Every test works in its own temporary folder, so stock files, journals, history and settings from one
+# test never leak into another.
+
+
+# Fixture that returns a function making loaded engines on files in the test's folder (closed afterwards)
+@pytest.fixture
+def make_engine(tmp_path):
+    engines = []
+
+    # Function to open and load an engine on a stock file in the test's folder
+    def make(name="stock_data.json", capacity=1000):
+        engine = StockEngine(str(tmp_path / name), capacity)
+        engine.load()
+        engines.append(engine)
+        return engine
+
+    yield make
+    for engine in engines:
+        engine.close()
@@ -0,0 +1,78 @@
+import time # For movement times
+from datetime import date, timedelta # For report date ranges
+
+from history import MovementHistory # Movement log with daily/weekly totals
+
+# Tests for the movement history: the bucket totals add up every movement, each item's record chain
+# finds its latest movements, and a restart (with or without a checkpoint) reads the same totals.
+
+
+# Test that the daily totals add up the movements in and out
+def test_daily_totals(tmp_path):
+    history = MovementHistory(str(tmp_path / "stock.history"))
+    now = time.time()
+    history.record_many([("rice", 5), ("dal", 2)], now)
+    history.record_many([("rice", -3), ("rice", 4)], now)
+    today = date.today()
+    assert history.totals(today, today) == {"rice": (9, 3), "dal": (2, 0)}
+    assert history.totals(today - timedelta(days=3), today - timedelta(days=1)) == {}
+
+
+# Test that an item's recent movements come back newest first by following its record chain
+def test_recent_follows_item_chain(tmp_path):
+    history = MovementHistory(str(tmp_path / "stock.history"))
+    now = time.time()
+    for delta in (1, 2, 3):
+        history.record_many([("rice", delta), ("dal", 10 * delta)], now)
+    assert [delta for _, delta in history.recent("rice")] == [3, 2, 1]
+    assert [delta for _, delta in history.recent("dal", limit=2)] == [30, 20]
+    assert history.recent("salt") == []
+
+
+# Test that a restart reads the same totals, from the log alone and from a checkpoint plus newer records
+def test_totals_survive_restart(tmp_path):
+    path = str(tmp_path / "stock.history")
+    history = MovementHistory(path)
+    now = time.time()
+    history.record_many([("rice", 5)], now)
+    assert MovementHistory(path).totals(date.today(), date.today()) == {"rice": (5, 0)}
+    history.checkpoint()
+    history.record_many([("rice", -2)], now)
+    reloaded = MovementHistory(path)
+    assert reloaded.totals(date.today(), date.today()) == {"rice": (5, 2)}
+    assert [delta for _, delta in reloaded.recent("rice")] == [-2, 5]
+
+
+# Test that two terminals writing the same history keep one chain per item
+def test_two_writers_share_history(tmp_path):
+    path = str(tmp_path / "stock.history")
+    first, second = MovementHistory(path), MovementHistory(path)
+    now = time.time()
+    first.record_many([("rice", 1)], now)
+    second.record_many([("rice", 2)], now)
+    first.record_many([("rice", 3)], now)
+    assert [delta for _, delta in second.recent("rice")] == [3, 2, 1]
+    assert first.totals(date.today(), date.today()) == {"rice": (6, 0)}
+
+
+# Test that the engine's movement report and item history come from the buckets
+def test_engine_reports(make_engine):
+    engine = make_engine()
+    engine.add("rice", 10)
+    engine.remove("rice", 4)
+    engine.add("dal", 3)
+    assert engine.movement_report(days=1) == [("rice", 10, 4), ("dal", 3, 0)]
+    history = engine.item_history("rice", days=1)
+    assert history["days"] == [(date.today(), 10, 4)]
+    assert [delta for _, delta in history["recent"]] == [-4, 10]
+
+
+# Test that a movement too big for 32 bits is recorded and read back whole
+def test_large_movement(tmp_path):
+    path = str(tmp_path / "stock.history")
+    history = MovementHistory(path)
+    big = 5 * 10 ** 12
+    history.record_many([("rice", big), ("rice", -(big - 1))], time.time())
+    reloaded = MovementHistory(path)
+    assert reloaded.totals(date.today(), date.today()) == {"rice": (big, big - 1)}
+    assert [delta for _, delta in reloaded.recent("rice")] == [-(big - 1), big]
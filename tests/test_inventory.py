@@ -0,0 +1,133 @@
+import random # For a repeatable mix of adds, removes and deletes
+import sqlite3 # For the SQLite inventory
+
+import pytest # For running the same checks on every backend
+
+from column_inventory import ColumnInventory # Column-based inventory
+from inventory import Inventory # Dict-based inventory
+from stock_engine import StockEngine # Engine that picks the inventory for its backend
+from storage import SqliteInventory, SqliteStorage # SQLite-backed inventory
+
+# Tests for the inventory models: the running total has to match a full recount after any mix of
+# changes, and every backend has to answer the same questions the same way.
+
+
+# Inventory kinds every shared test runs on
+KINDS = ["dict", "column", "sqlite"]
+
+
+# Function to make an empty inventory of the given kind (the SQLite one in the test's folder)
+def make_inventory(kind, tmp_path, capacity=10 ** 9):
+    if kind == "sqlite":
+        return SqliteStorage(str(tmp_path / "stock.db")).load(capacity)
+    return {"dict": Inventory, "column": ColumnInventory}[kind](capacity=capacity)
+
+
+# Test that the running total matches a recount after thousands of random changes, on every backend
+@pytest.mark.parametrize("kind", KINDS)
+def test_running_total_matches_recount(kind, tmp_path):
+    inventory = make_inventory(kind, tmp_path)
+    expected = {}
+    chooser = random.Random(7)
+    for _ in range(3000):
+        item = f"item {chooser.randint(0, 300)}"
+        action = chooser.random()
+        if action < 0.5:
+            quantity = chooser.randint(1, 20)
+            inventory.add(item, quantity)
+            expected[item] = expected.get(item, 0) + quantity
+        elif action < 0.85 and item in expected:
+            left = inventory.remove(item, chooser.randint(1, 30))
+            if left:
+                expected[item] = left
+            else:
+                del expected[item]
+        else:
+            inventory.discard(item)
+            expected.pop(item, None)
+    assert inventory.check_consistency()
+    assert inventory.total() == sum(expected.values())
+    assert inventory.to_dict() == expected
+    assert list(inventory.sorted_items()) == sorted(expected.items())
+    assert list(inventory.sorted_keys()) == sorted(expected)
+
+
+# Test that the consistency check catches a running total that drifted from the items
+def test_consistency_check_catches_drift():
+    inventory = Inventory({"rice": 5}, capacity=100)
+    inventory._total += 1
+    with pytest.raises(AssertionError):
+        inventory.check_consistency()
+
+
+# Test that the capacity checks use the running total
+@pytest.mark.parametrize("kind", KINDS)
+def test_capacity_checks(kind, tmp_path):
+    inventory = make_inventory(kind, tmp_path, capacity=10)
+    inventory.add("Rice ", 7)
+    assert inventory.get("rice") == 7
+    assert inventory.remaining() == 3
+    assert inventory.can_add(3)
+    assert not inventory.can_add(4)
+
+
+# Test that removing more than there is deletes the item and raises KeyError for unknown items
+@pytest.mark.parametrize("kind", KINDS)
+def test_remove_clamps_and_deletes(kind, tmp_path):
+    inventory = make_inventory(kind, tmp_path)
+    inventory.add("rice", 4)
+    assert inventory.remove("rice", 10) == 0
+    assert "rice" not in inventory
+    assert inventory.total() == 0
+    with pytest.raises(KeyError):
+        inventory.remove("rice", 1)
+
+
+# Test that every backend finds the same items at or below a level
+@pytest.mark.parametrize("kind", KINDS)
+def test_at_or_below(kind, tmp_path):
+    inventory = make_inventory(kind, tmp_path)
+    for item, quantity in {"a": 1, "b": 5, "c": 2, "d": 9}.items():
+        inventory.set(item, quantity)
+    inventory.discard("c")
+    assert sorted(inventory.at_or_below(5)) == [("a", 1), ("b", 5)]
+    # A deleted item is not left behind at quantity 0
+    assert inventory.at_or_below(0) == []
+
+
+# Test that a bulk-loaded column inventory keeps its name order and lookups through later changes
+def test_column_order_after_bulk_load():
+    inventory = ColumnInventory(capacity=0)
+    inventory.set_many(["pear", "apple", "fig"], [3, 1, 2])
+    assert inventory.get("fig") == 2
+    inventory.add("banana", 4)
+    inventory.discard("apple")
+    assert inventory.sorted_items() == [("banana", 4), ("fig", 2), ("pear", 3)]
+
+
+# Test that the SQLite table's trigger-kept total survives reopening the database
+def test_sqlite_total_survives_reopen(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "stock.db"))
+    inventory = storage.load(100)
+    inventory.add("rice", 6)
+    inventory.add("dal", 2)
+    storage.close()
+    connection = sqlite3.connect(str(tmp_path / "stock.db"))
+    reopened = SqliteInventory(connection, 100)
+    assert reopened.total() == 8
+    assert reopened.check_consistency()
+    connection.close()
+
+
+# Test that an engine whose load failed carries on with its own backend's inventory and still stores edits
+@pytest.mark.parametrize("name, kind", [("stock.json", Inventory), ("stock.db", SqliteInventory)])
+def test_start_empty_keeps_backend(tmp_path, name, kind):
+    engine = StockEngine(str(tmp_path / name), 100)
+    engine.start_empty()
+    assert isinstance(engine.inventory, kind)
+    engine.add("rice", 3)
+    engine.close()
+    reopened = StockEngine(str(tmp_path / name), 100)
+    reopened.load()
+    assert reopened.get("rice") == 3
+    reopened.close()
@@ -0,0 +1,111 @@
+import shutil # For putting back a journal as an interrupted compaction would leave it
+
+from journal import StockJournal # Snapshot + append-only journal
+from inventory import Inventory # In-memory stock model
+
+# Tests for the write-ahead journal: changes from several terminals on the same files add up, survive a
+# restart without a snapshot, and are never lost or counted twice by compaction or a crash.
+
+
+# Test that each terminal picks up the other's changes and that they add up instead of overwriting
+def test_two_engines_merge_changes(make_engine):
+    first = make_engine()
+    second = make_engine()
+    first.add("rice", 5)
+    second.add("rice", 3)
+    second.add("dal", 2)
+    assert first.poll_changes() == {"rice", "dal"}
+    assert second.poll_changes() == {"rice"}
+    assert first.get("rice") == second.get("rice") == 8
+    assert first.get("dal") == second.get("dal") == 2
+    assert first.total() == second.total() == 10
+
+
+# Test that a new terminal sees every change replayed from the journal, with no snapshot written
+def test_journal_replays_on_load(make_engine):
+    first = make_engine()
+    first.add("rice", 5)
+    first.remove("rice", 2)
+    first.add("dal", 4)
+    reloaded = make_engine()
+    assert reloaded.inventory.to_dict() == {"rice": 3, "dal": 4}
+
+
+# Test that compacting in one terminal keeps another terminal's changes it never polled
+def test_compaction_keeps_other_terminals_changes(make_engine):
+    first = make_engine()
+    second = make_engine()
+    first.add("rice", 5)
+    second.add("dal", 2)
+    assert second.poll_changes() == {"rice"}
+    # first never polled, so dal is not in its memory
+    first.save()
+    assert make_engine().inventory.to_dict() == {"rice": 5, "dal": 2}
+    # second carries on after the compaction and reads the new journal from the start
+    first.add("rice", 1)
+    assert second.poll_changes() == {"rice"}
+    assert second.get("rice") == 6
+
+
+# Test that a terminal that missed more than one compaction is told to load everything again
+def test_poll_after_missed_compactions(make_engine):
+    first = make_engine()
+    second = make_engine()
+    first.add("rice", 5)
+    first.save()
+    first.add("rice", 1)
+    first.save()
+    assert second.poll_changes() is None
+    second.load()
+    assert second.get("rice") == 6
+
+
+# Test that a partial line left by a crash mid-append is skipped and later changes still load
+def test_partial_line_after_crash(make_engine, tmp_path):
+    first = make_engine()
+    first.add("rice", 5)
+    with open(tmp_path / "stock_data.json.journal", "a") as file:
+        file.write('{"v":99,"by":"crashed","item":"rice","del')
+    second = make_engine()
+    assert second.get("rice") == 5
+    second.add("dal", 1)
+    assert make_engine().inventory.to_dict() == {"rice": 5, "dal": 1}
+
+
+# Test that a journal already folded into the snapshot is not replayed again
+def test_interrupted_compaction_not_counted_twice(tmp_path):
+    snapshot = str(tmp_path / "stock_data.json")
+    journal = StockJournal(snapshot)
+    journal.load(Inventory(capacity=0))
+    journal.record_many([("rice", 5), ("dal", 2)])
+    shutil.copy(journal.journal_file, str(tmp_path / "kept"))
+    journal.compact()
+    # As if the crash came after the new snapshot was in place but before the journal was swapped
+    shutil.copy(str(tmp_path / "kept"), journal.journal_file)
+    inventory = Inventory(capacity=0)
+    StockJournal(snapshot).load(inventory)
+    assert inventory.to_dict() == {"rice": 5, "dal": 2}
+
+
+# Test that version numbers keep rising across terminals so every change has its own place
+def test_versions_increase_across_writers(tmp_path):
+    snapshot = str(tmp_path / "stock_data.json")
+    first, second = StockJournal(snapshot), StockJournal(snapshot)
+    first.load(Inventory(capacity=0))
+    second.load(Inventory(capacity=0))
+    first.record("rice", 1)
+    second.record("rice", 1)
+    first.record("rice", 1)
+    assert first.version == 3
+    assert second.version == 2
+
+
+# Test that appends are fsynced in batches unless the caller needs them on disk straight away
+def test_sync_on_request(tmp_path):
+    journal = StockJournal(str(tmp_path / "stock_data.json"), sync_every=20, sync_interval=60)
+    journal.load(Inventory(capacity=0))
+    journal.record_many([("rice", 1)])
+    journal.record_many([("rice", 1)])
+    assert journal._unsynced == 2
+    journal.record_many([("dal", 1)], sync=True)
+    assert journal._unsynced == 0
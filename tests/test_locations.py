@@ -0,0 +1,158 @@
+import os # For the id of a process that is still running
+import subprocess # For the id of a process that has ended
+import sys # For running that process
+
+import pytest # For checking the errors raised
+
+import locations as locations_module # For the transfer timeout
+from locations import LocationSet, load_locations # Stock kept at several locations
+from stock_engine import CapacityError, StockError # Errors the engine raises
+
+# Tests for multi-location stock: a transfer changes both sides or neither, and a transfer cut off
+# halfway is finished or rolled back from the transfer log when the locations are opened again.
+
+
+# Function to return a LocationSet of a shop (JSON) and a godown (binary snapshot) in the test's folder
+def open_locations(tmp_path, shop_capacity=100):
+    locations = {
+        "Shop": {"file": str(tmp_path / "shop.json"), "capacity": shop_capacity},
+        "Godown": {"file": str(tmp_path / "godown.stock"), "capacity": 1000},
+    }
+    return LocationSet(locations, transfers_file=str(tmp_path / "locations.transfers"))
+
+
+# Function to return the id of a process that has ended
+def ended_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+# Function to return a LocationSet whose transfers look like an earlier run's (its process has ended)
+def open_stopped_run(tmp_path, shop_capacity=100):
+    locations = open_locations(tmp_path, shop_capacity)
+    locations.transfers.pid = ended_pid()
+    return locations
+
+
+# Test that a transfer moves the stock and leaves the transfer log empty
+def test_transfer(tmp_path):
+    locations = open_locations(tmp_path)
+    locations.load_all()
+    locations.engines["Godown"].add("rice", 50)
+    assert locations.transfer("Rice", 20, "Godown", "Shop") == (30, 20)
+    assert (tmp_path / "locations.transfers").read_text() == ""
+    # Each side was synced to disk before it was marked stored in the transfer log
+    assert [locations.engines[name].storage.journal._unsynced for name in ("Godown", "Shop")] == [0, 0]
+    locations.close()
+    reopened = open_locations(tmp_path)
+    reopened.load_all()
+    assert reopened.item_totals("rice") == {"Shop": 20, "Godown": 30}
+    reopened.close()
+
+
+# Test that a transfer that doesn't fit either side changes neither
+def test_transfer_checked_on_both_sides(tmp_path):
+    locations = open_locations(tmp_path, shop_capacity=10)
+    locations.load_all()
+    locations.engines["Godown"].add("rice", 50)
+    with pytest.raises(CapacityError):
+        locations.transfer("rice", 20, "Godown", "Shop")
+    with pytest.raises(StockError, match="Only 50"):
+        locations.transfer("rice", 60, "Godown", "Shop")
+    assert locations.item_totals("rice") == {"Shop": 0, "Godown": 50}
+    locations.close()
+
+
+# Test that a transfer cut off after the source was stored is finished at the target on the next start
+def test_recover_finishes_half_done_transfer(tmp_path):
+    locations = open_stopped_run(tmp_path)
+    locations.load_all()
+    godown = locations.engines["Godown"]
+    godown.add("rice", 50)
+    # What transfer() does, stopping before the target changes
+    transfer_id = locations.transfers.begin("rice", 20, "Godown", "Shop")
+    godown.apply_changes([("rice", -20)], [lambda: locations.transfers.mark(transfer_id, "from")])
+    locations.close()
+    reopened = open_locations(tmp_path)
+    assert reopened.recover() == ["Finished moving 20 of 'rice' from Godown to Shop."]
+    assert reopened.item_totals("rice") == {"Shop": 20, "Godown": 30}
+    assert reopened.recover() == []
+    reopened.close()
+
+
+# Test that a transfer cut off before either side was stored is rolled back (nothing to undo)
+def test_recover_rolls_back_unstarted_transfer(tmp_path):
+    locations = open_stopped_run(tmp_path)
+    locations.load_all()
+    locations.engines["Godown"].add("rice", 50)
+    locations.transfers.begin("rice", 20, "Godown", "Shop")
+    locations.close()
+    reopened = open_locations(tmp_path)
+    assert reopened.recover() == ["Rolled back moving 20 of 'rice' from Godown to Shop."]
+    reopened.load_all()
+    assert reopened.item_totals("rice") == {"Shop": 0, "Godown": 50}
+    reopened.close()
+
+
+# Test that a half-done transfer whose target has no room any more is put back at the source
+def test_recover_puts_stock_back_without_room(tmp_path):
+    locations = open_stopped_run(tmp_path, shop_capacity=10)
+    locations.load_all()
+    godown = locations.engines["Godown"]
+    godown.add("rice", 50)
+    transfer_id = locations.transfers.begin("rice", 8, "Godown", "Shop")
+    godown.apply_changes([("rice", -8)], [lambda: locations.transfers.mark(transfer_id, "from")])
+    locations.engines["Shop"].add("dal", 5)
+    locations.close()
+    reopened = open_locations(tmp_path, shop_capacity=10)
+    assert reopened.recover() == ["Rolled back moving 8 of 'rice' from Godown to Shop: no room at Shop."]
+    assert reopened.item_totals("rice") == {"Shop": 0, "Godown": 50}
+    reopened.close()
+
+
+# Test that a transfer another running terminal is storing is left alone until it times out
+def test_recover_waits_for_running_terminal(tmp_path, monkeypatch):
+    locations = open_locations(tmp_path)
+    locations.load_all()
+    locations.engines["Godown"].add("rice", 50)
+    # A transfer started by another process that is still running (this test's parent)
+    locations.transfers.pid = os.getppid()
+    locations.transfers.begin("rice", 20, "Godown", "Shop")
+    locations.close()
+    reopened = open_locations(tmp_path)
+    assert reopened.recover() == []
+    monkeypatch.setattr(locations_module, "TRANSFER_TIMEOUT", -1)
+    assert reopened.recover() == ["Rolled back moving 20 of 'rice' from Godown to Shop."]
+    reopened.close()
+
+
+# Test that the locations file is read in order with paths relative to it, and bad entries are refused
+def test_load_locations(tmp_path):
+    path = tmp_path / "locations.json"
+    path.write_text('{"Shop Floor": {"file": "shop.json", "capacity": 5}, "Godown": {"file": "g.stock"}}')
+    locations = load_locations(str(path), capacity=7)
+    assert list(locations) == ["Shop Floor", "Godown"]
+    assert locations["Godown"] == {"file": str(tmp_path / "g.stock"), "capacity": 7}
+    path.write_text('{"Shop": {"file": "shop.json", "capacity": -1}}')
+    with pytest.raises(ValueError):
+        load_locations(str(path))
+
+
+# Test that load_all loads every location and reports a broken one without stopping the others
+def test_load_all(tmp_path):
+    (tmp_path / "shop.json").write_text('{"rice": 4}')
+    (tmp_path / "back.json").write_text('{"rice": ')
+    locations = LocationSet({
+        "Shop": {"file": str(tmp_path / "shop.json"), "capacity": 100},
+        "Back Room": {"file": str(tmp_path / "back.json"), "capacity": 100},
+        "Godown": {"file": str(tmp_path / "godown.db"), "capacity": 100},
+    }, transfers_file=str(tmp_path / "locations.transfers"))
+    results = locations.load_all()
+    assert list(results) == ["Shop", "Back Room", "Godown"]
+    assert results["Shop"][1] is None and results["Godown"][1] is None
+    assert isinstance(results["Back Room"][1], ValueError)
+    assert locations.item_totals("rice") == {"Shop": 4, "Godown": 0}
+    # Only the one that failed is tried again
+    assert list(locations.load_all()) == ["Back Room"]
+    locations.close()
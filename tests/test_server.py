@@ -0,0 +1,121 @@
+import asyncio # For running the server and a client in the test
+import json # For the newline-delimited JSON requests
+
+import pytest # For the parametrized bad requests
+
+from stock_client import RemoteEngine # Engine interface over a server connection
+from stock_engine import StockEngine # Engine the server owns
+from stock_server import StockServer # Asyncio stock server
+
+# Tests for the stock server's replies: every bad request gets an error reply of the right kind, and the
+# server keeps answering (and keeps the stock unchanged) afterwards.
+
+
+# Function to start a server on a free port, send each request line in turn and return the replies
+def exchange(stock_file, lines, capacity=10):
+    async def run():
+        engine = StockEngine(stock_file, capacity)
+        engine.load()
+        server = StockServer(engine, "127.0.0.1:0")
+        await server.start()
+        try:
+            host, port = server.bound_address.rsplit(":", 1)
+            reader, writer = await asyncio.open_connection(host, int(port))
+            replies = []
+            for line in lines:
+                writer.write(line.encode() + b"\n")
+                await writer.drain()
+                replies.append(json.loads(await asyncio.wait_for(reader.readline(), 10)))
+            writer.close()
+            return replies
+        finally:
+            await server.stop()
+
+    return asyncio.run(run())
+
+
+# Function to turn a request into a request line
+def request(op, **fields):
+    return json.dumps(dict(fields, op=op, id=1))
+
+
+# Test that each kind of malformed request gets an error reply and the server still answers afterwards
+@pytest.mark.parametrize("line, kind", [
+    ("this is not json", "stock"),
+    (request("fly"), "stock"),
+    (request("add", item="rice", quantity="lots"), "io"),
+    (request("add", item="rice", quantity=True), "io"),
+    (request("add", item=5, quantity=1), "io"),
+    (request("remove", item="rice"), "io"),
+    (request("import", path=None), "io"),
+    (request("apply", changes=5), "io"),
+    (request("apply", changes=[["rice"]]), "io"),
+    (request("apply", changes=[["rice", "1"]]), "io"),
+    (request("add_many", quantities=["rice", 1]), "io"),
+    (request("add_many", quantities={"rice": 1.5}), "io"),
+    (request("alert_settings", settings=None), "io"),
+    (request("alert_settings", settings={}), "stock"),
+    (request("set_price", item="rice", cost="cheap"), "io"),
+    (request("report", days="week"), "io"),
+    (request("history", item=None), "io"),
+])
+def test_bad_request_gets_error_reply(tmp_path, line, kind):
+    reply, total = exchange(str(tmp_path / "stock.json"), [line, request("total")])
+    assert reply["ok"] is False
+    assert reply["kind"] == kind
+    assert reply["error"]
+    assert total == {"id": 1, "ok": True, "result": {"total": 0, "capacity": 10, "remaining": 10}}
+
+
+# Test that stock rules come back as stock and capacity errors with the engine's wording
+def test_rule_errors(tmp_path):
+    replies = exchange(str(tmp_path / "stock.json"), [
+        request("add", item="rice", quantity=8),
+        request("add", item="dal", quantity=5),
+        request("remove", item="salt", quantity=1),
+        request("add", item="rice", quantity=0),
+        request("add_many", quantities={"dal": 1, "salt": 2}),
+    ])
+    assert replies[0]["result"] == {"item": "rice", "quantity": 8, "change": 8}
+    assert replies[1]["kind"] == "capacity"
+    assert "Max add: 2" in replies[1]["error"]
+    assert (replies[2]["kind"], replies[2]["title"]) == ("stock", "Not Found")
+    assert replies[3]["kind"] == "stock"
+    assert replies[4]["kind"] == "capacity"
+
+
+# Test that an undo/redo step applied through the server checks the capacity too
+def test_apply_checks_capacity(tmp_path):
+    replies = exchange(str(tmp_path / "stock.json"), [
+        request("add", item="rice", quantity=6),
+        request("apply", changes=[["rice", -2], ["dal", 7]]),
+        request("apply", changes=[["rice", -2], ["dal", 4]]),
+        request("total"),
+    ])
+    assert replies[1]["kind"] == "capacity"
+    assert replies[2]["result"] == [["rice", -2], ["dal", 4]]
+    assert replies[3]["result"]["total"] == 8
+
+
+# Test that a synced apply (a transfer side from a client) is stored before the reply comes back
+def test_synced_apply(tmp_path):
+    replies = exchange(str(tmp_path / "stock.json"), [
+        request("add", item="rice", quantity=6),
+        request("apply", changes=[["rice", -2]], sync=True),
+        request("apply", changes=[["rice", -1]], sync="yes"),
+    ])
+    assert replies[1]["result"] == [["rice", -2]]
+    assert replies[2]["kind"] == "io"
+    engine = StockEngine(str(tmp_path / "stock.json"), 10)
+    engine.load()
+    assert engine.get("rice") == 4
+    engine.close()
+
+
+# Test that a RemoteEngine can end a batch it never began, like StockEngine (nothing is sent)
+def test_remote_engine_batch_state():
+    # Nothing connects until the first request
+    engine = RemoteEngine("127.0.0.1:1")
+    engine.end_batch()
+    engine.begin_batch()
+    engine.end_batch()
@@ -0,0 +1,75 @@
+import json # For writing the JSON stock file
+import os # For the repository folder
+import subprocess # For importing the GUI in a fresh interpreter
+import sys # For running that interpreter
+import time # For timing the engine loads
+
+import pytest # For the backends and skipping without a display
+
+import benchmark # Startup and load timings
+from stock_engine import StockEngine # Headless engine the GUI loads through
+
+# Tests for startup time: the GUI shows its window shell before the stock is loaded and listed, leaves
+# the dialog modules until they are needed, and loading a catalogue of a good size stays well inside a
+# budget on every storage backend.
+
+# Catalogue size for the timing tests
+STARTUP_ITEMS = 20000
+# Generous limit (seconds) for loading STARTUP_ITEMS items, so a slow machine doesn't fail the suite
+LOAD_BUDGET = 5.0
+
+
+# Function to write a stock file of STARTUP_ITEMS items for a backend and return its path
+def write_catalogue(tmp_path, backend):
+    catalogue = benchmark.make_catalogue(STARTUP_ITEMS)
+    path = str(tmp_path / f"stock.{benchmark.EXTENSIONS[backend]}")
+    if backend == "json":
+        with open(path, "w") as file:
+            json.dump(catalogue, file)
+        return path
+    engine = StockEngine(path, sum(catalogue.values()))
+    engine.load()
+    engine.add_many(catalogue, "catalogue")
+    engine.save()
+    engine.close()
+    return path
+
+
+# Test that loading a catalogue is within the budget and gives every item back on each backend
+@pytest.mark.parametrize("backend", ["json", "binary", "sqlite"])
+def test_load_time(tmp_path, backend):
+    path = write_catalogue(tmp_path, backend)
+    engine = StockEngine(path, 0)
+    start = time.perf_counter()
+    engine.load()
+    seconds = time.perf_counter() - start
+    assert len(engine.inventory) == STARTUP_ITEMS
+    assert engine.total() == sum(benchmark.make_catalogue(STARTUP_ITEMS).values())
+    engine.close()
+    assert seconds < LOAD_BUDGET
+
+
+# Test that the GUI window shell is up before the stock is loaded and listed (needs a display)
+def test_gui_shell_before_stock(tmp_path):
+    path = write_catalogue(tmp_path, "json")
+    startup = benchmark.time_startup(path, timeout=60.0)
+    if startup is None:
+        pytest.skip("no display for the GUI startup timing")
+    shell, ready = startup
+    assert shell < ready < 60.0
+
+
+# Test that importing the GUI leaves the dialog modules to be imported when the first one is shown
+def test_dialogs_imported_on_first_use():
+    code = (
+        "import sys, stock_v4\n"
+        "dialogs = ('tkinter.messagebox', 'tkinter.simpledialog', 'tkinter.filedialog')\n"
+        "print(sum(name in sys.modules for name in dialogs))\n"
+        "stock_v4.messagebox.showinfo\n"
+        "print(sum(name in sys.modules for name in dialogs))\n"
+    )
+    folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", code], cwd=folder, capture_output=True, text=True)
+    if "No module named 'tkinter'" in result.stderr or "_tkinter" in result.stderr:
+        pytest.skip("tkinter is not installed")
+    assert result.stdout.split() == ["0", "1"]
@@ -0,0 +1,58 @@
+import io # For feeding the loader text in small chunks
+import json # For the expected results and the decode errors
+
+import pytest # For the parametrized documents
+
+from inventory import Inventory # In-memory stock model
+from stream_loader import iter_json_object, load_into # Block-wise JSON loader
+
+# Tests for the streaming loader: whatever chunk size the file is read in, it gives the same entries as
+# json.loads, reports bad quantities, and refuses anything that isn't one JSON object.
+
+# Chunk sizes from one character (every possible split) up to the real one
+CHUNK_SIZES = [1, 2, 3, 7, 64, 1024 * 1024]
+
+
+# Test that every chunk size gives the same entries as json.loads, with commas, quotes and nested values
+@pytest.mark.parametrize("document", [
+    "{}",
+    "  \n{ }\n",
+    '{"rice": 5}',
+    '{"a,b": 1, "c\\",\\"d": 2.5, "e": {"x": 1, "y": [1, 2]}, "f": "7", "g": true, "h": null, "i": -3e2}',
+    '\n{\n    "rice" : 1 ,\n    "dal" : 2\n}\n',
+    '{"caf\\u00e9,": 12345678901234567890}',
+])
+def test_matches_json_loads(document):
+    expected = list(json.loads(document).items())
+    for chunk_size in CHUNK_SIZES:
+        assert list(iter_json_object(io.StringIO(document), chunk_size=chunk_size)) == expected
+
+
+# Test that broken files raise JSONDecodeError at any chunk size
+@pytest.mark.parametrize("document", [
+    "", "[1, 2]", '{"a": 1', '{"a" 1}', '{"a": 1,}', '{"a": 1,, "b": 2}', '{, "a": 1}', '{"a": 1}}', 'x{}',
+])
+def test_broken_files_raise(document):
+    for chunk_size in CHUNK_SIZES:
+        with pytest.raises(json.JSONDecodeError):
+            list(iter_json_object(io.StringIO(document), chunk_size=chunk_size))
+
+
+# Test that bad quantities are loaded as 0 and counted in the report
+def test_bad_quantities_reported(tmp_path):
+    path = tmp_path / "stock.json"
+    path.write_text('{"rice": 5, "dal": "3", "salt": 1.5, "oil": true, "sugar": 2.0}')
+    inventory = Inventory(capacity=0)
+    report = load_into(str(path), inventory)
+    assert inventory.to_dict() == {"rice": 5, "dal": 3, "salt": 0, "oil": 0, "sugar": 2}
+    assert (report.loaded, report.bad) == (5, 2)
+    assert report.bad_examples == [("salt", 1.5), ("oil", True)]
+
+
+# Test that progress is reported up to the file size
+def test_progress(tmp_path):
+    path = tmp_path / "stock.json"
+    path.write_text(json.dumps({f"item {number}": number for number in range(1000)}))
+    calls = []
+    load_into(str(path), Inventory(capacity=0), lambda done, total: calls.append((done, total)))
+    assert calls[-1] == (path.stat().st_size, path.stat().st_size)
@@ -0,0 +1,95 @@
+import pytest # For checking the errors raised
+
+from stock_engine import CapacityError, StockError # Errors the engine raises
+from undo import UndoHistory # Undo/redo stacks of stored changes
+
+# Tests for undo and redo: a step is undone as stored changes, a step that no longer fits stays where it
+# was, and the history never holds more changes than its limit.
+
+
+# Test that undo and redo reverse exactly what each step changed
+def test_undo_redo_round_trip(make_engine):
+    engine = make_engine(capacity=100)
+    engine.add("rice", 5)
+    engine.remove("rice", 8)
+    assert "rice" not in engine.inventory
+    # Removing "everything" is undone by putting back what was there, not what was asked for
+    assert engine.undo() == ("Remove 5 rice", ["rice"])
+    assert engine.get("rice") == 5
+    engine.undo()
+    assert engine.total() == 0
+    engine.redo()
+    engine.redo()
+    assert "rice" not in engine.inventory
+    with pytest.raises(StockError):
+        engine.redo()
+
+
+# Test that an undo that would go over the capacity is refused and kept for later
+def test_undo_blocked_by_capacity(make_engine):
+    engine = make_engine(capacity=10)
+    other_terminal = make_engine(capacity=10)
+    engine.add("rice", 6)
+    engine.remove("rice", 6)
+    other_terminal.add("dal", 8)
+    engine.poll_changes()
+    with pytest.raises(CapacityError):
+        engine.undo()
+    assert engine.undo_history.undo_label() == "Remove 6 rice"
+    assert engine.total() == 8
+    # Once there is room again, the same step can be undone
+    other_terminal.remove("dal", 8)
+    engine.poll_changes()
+    engine.undo()
+    assert engine.get("rice") == 6
+    assert engine.inventory.check_consistency()
+
+
+# Test that an undo that would go over a category's capacity is refused too
+def test_undo_blocked_by_category_capacity(make_engine):
+    engine = make_engine(capacity=100)
+    engine.set_category("rice", "grain")
+    engine.add("rice", 4)
+    engine.remove("rice", 4)
+    engine.set_category_capacity("grain", 2)
+    with pytest.raises(CapacityError, match="'grain' capacity"):
+        engine.undo()
+    assert engine.get("rice") == 0
+    engine.set_category_capacity("grain", 4)
+    engine.undo()
+    assert engine.get("rice") == 4
+
+
+# Test that a redo that no longer fits is refused and kept for later
+def test_redo_blocked_by_capacity(make_engine):
+    engine = make_engine(capacity=10)
+    other_terminal = make_engine(capacity=10)
+    engine.add("rice", 6)
+    engine.undo()
+    other_terminal.add("dal", 5)
+    engine.poll_changes()
+    with pytest.raises(CapacityError):
+        engine.redo()
+    assert engine.undo_history.redo_label() == "Add 6 rice"
+
+
+# Test that a run of scans added together is one undo step
+def test_add_many_is_one_step(make_engine):
+    engine = make_engine(capacity=100)
+    engine.add_many({"rice": 2, "dal": 3, "Rice": 1}, "Scan")
+    assert engine.get("rice") == 3
+    label, items = engine.undo()
+    assert label == "Scan"
+    assert sorted(items) == ["dal", "rice"]
+    assert engine.total() == 0
+
+
+# Test that the oldest steps are dropped once the history holds more changes than its limit
+def test_history_keeps_within_limit():
+    history = UndoHistory(max_changes=5)
+    for number in range(4):
+        history.push(f"Step {number}", [("rice", 1), ("dal", 1)])
+    labels = []
+    while history.undo_label() is not None:
+        labels.append(history.pop_undo()[0])
+    assert labels == ["Step 3", "Step 2"]
@@ -0,0 +1,93 @@
+import pytest # For comparing money totals
+
+from valuation import Valuation # Stock value at cost and at retail
+
+# Tests for stock valuation: FIFO uses up the oldest cost layers first, weighted average blends them,
+# the running totals match a full revaluation, and cost layers survive a restart.
+
+
+# Test that FIFO takes stock going out from the oldest delivery first
+def test_fifo_uses_oldest_layers_first(make_engine):
+    engine = make_engine()
+    engine.set_costing("fifo")
+    engine.add("rice", 10, unit_cost=2.0)
+    engine.add("rice", 10, unit_cost=3.0)
+    engine.remove("rice", 15)
+    # The 5 left all came in the second delivery
+    assert engine.stock_value()[0] == pytest.approx(15.0)
+    engine.add("rice", 5, unit_cost=4.0)
+    engine.remove("rice", 6)
+    # 5 at 3.0 went first, then 1 at 4.0; 4 at 4.0 are left
+    assert engine.stock_value()[0] == pytest.approx(16.0)
+
+
+# Test that weighted average costing blends deliveries and keeps the average when stock goes out
+def test_average_costing(make_engine):
+    engine = make_engine()
+    engine.add("rice", 10, unit_cost=2.0)
+    engine.add("rice", 10, unit_cost=3.0)
+    engine.remove("rice", 15)
+    assert engine.stock_value()[0] == pytest.approx(12.5)
+
+
+# Test that the retail value follows the price and the quantity
+def test_retail_value(make_engine):
+    engine = make_engine()
+    engine.set_item_price("rice", cost=2.0, price=5.0)
+    engine.add("rice", 4)
+    engine.remove("rice", 1)
+    assert engine.stock_value() == (pytest.approx(6.0), pytest.approx(15.0))
+
+
+# Test that the totals kept change by change match a full revaluation of the columns
+def test_running_totals_match_revalue():
+    valuation = Valuation({"costing": "fifo"})
+    quantities = {}
+    for step in range(200):
+        item = f"item {step % 7}"
+        quantities[item] = max(0, quantities.get(item, 0) + (5 if step % 3 else -4))
+        valuation.update(item, quantities[item], unit_cost=1.0 + step % 5)
+    running = (valuation.total_cost, valuation.total_retail)
+    assert valuation.revalue() == (pytest.approx(running[0]), pytest.approx(running[1]))
+
+
+# Test that FIFO cost layers are saved with the prices and used again after a restart
+def test_fifo_layers_survive_restart(make_engine):
+    engine = make_engine()
+    engine.set_costing("fifo")
+    engine.add("rice", 10, unit_cost=2.0)
+    engine.add("rice", 10, unit_cost=3.0)
+    engine.save()
+    reloaded = make_engine()
+    assert reloaded.valuation.method == "fifo"
+    assert reloaded.stock_value()[0] == pytest.approx(50.0)
+    reloaded.remove("rice", 12)
+    assert reloaded.stock_value()[0] == pytest.approx(24.0)
+
+
+# Test that switching costing method keeps the value of the stock on hand
+def test_switching_method_keeps_value(make_engine):
+    engine = make_engine()
+    engine.set_costing("fifo")
+    engine.add("rice", 10, unit_cost=2.0)
+    engine.add("rice", 10, unit_cost=3.0)
+    engine.set_costing("average")
+    assert engine.stock_value()[0] == pytest.approx(50.0)
+    engine.remove("rice", 10)
+    assert engine.stock_value()[0] == pytest.approx(25.0)
+
+
+# Test that a delivery's cost values that delivery only and leaves the item's cost for later ones
+@pytest.mark.parametrize("method, left", [("average", 160.0 / 3), ("fifo", 60.0)])
+def test_delivery_cost_only_values_delivery(make_engine, method, left):
+    engine = make_engine()
+    engine.set_costing(method)
+    engine.set_item_price("rice", cost=2.0)
+    engine.add("rice", 10)
+    engine.add("rice", 10, unit_cost=4.0)
+    engine.add("rice", 10)
+    assert engine.valuation.item("rice")[2] == 2.0
+    assert engine.stock_value()[0] == pytest.approx(80.0)
+    # Average: 20 left at 80 / 30 each. FIFO: the first 10 at 2.0 go, 10 at 4.0 and 10 at 2.0 are left
+    engine.remove("rice", 10)
+    assert engine.stock_value()[0] == pytest.approx(left)
@@ -0,0 +1,78 @@
+
+from collections import deque # For dropping the oldest steps cheaply
+
+# Undo/redo history for the stocktaking app
+# Every step is stored as the changes it made ("rice" +5, "dal" -2), never as a copy of the stock,
+# so undoing means applying the opposite changes. An edit of several items at once (a bulk import, a
+# run of barcode scans) is pushed as one step. The history holds at most MAX_CHANGES changes in total;
+# the oldest steps are forgotten first.
+
+# Most (item, change) pairs kept across all undo and redo steps
+MAX_CHANGES = 100000
+
+
+# Define the UndoHistory class that holds the undo and redo stacks
+class UndoHistory:
+    # Undo/redo stacks of (label, changes) steps with a size limit.
+
+    # Initialize the UndoHistory with the most changes to keep
+    def __init__(self, max_changes=MAX_CHANGES):
+        self.max_changes = max_changes
+        # Steps that can be undone (oldest first) and redone (most recent undo last)
+        self._undo = deque()
+        self._redo = []
+        # Number of changes held in both stacks
+        self._size = 0
+
+    # Method to record a new step (the redo stack is cleared, as in any editor)
+    def push(self, label, changes):
+        changes = tuple((item, delta) for item, delta in changes if delta)
+        if not changes:
+            return
+        for _, redo_changes in self._redo:
+            self._size -= len(redo_changes)
+        self._redo.clear()
+        self._push_undo(label, changes)
+
+    # Method to put a step on the undo stack, forgetting the oldest steps if over the limit
+    def _push_undo(self, label, changes):
+        self._undo.append((label, tuple(changes)))
+        self._size += len(changes)
+        while self._size > self.max_changes and self._undo:
+            _, oldest = self._undo.popleft()
+            self._size -= len(oldest)
+
+    # Method to take the most recent step off the undo stack
+    def pop_undo(self):
+        label, changes = self._undo.pop()
+        self._size -= len(changes)
+        return label, changes
+
+    # Method to put a step back on the undo stack (after a redo, or a failed undo) without clearing redo
+    def push_undo(self, label, changes):
+        if changes:
+            self._push_undo(label, changes)
+
+    # Method to put an undone step on the redo stack
+    def push_redo(self, label, changes):
+        if changes:
+            self._redo.append((label, tuple(changes)))
+            self._size += len(changes)
+
+    # Method to take the most recently undone step off the redo stack
+    def pop_redo(self):
+        label, changes = self._redo.pop()
+        self._size -= len(changes)
+        return label, changes
+
+    # Method to return the label of the step Undo would undo (None if there is none)
+    def undo_label(self):
+        return self._undo[-1][0] if self._undo else None
+
+    # Method to return the label of the step Redo would redo (None if there is none)
+    def redo_label(self):
+        return self._redo[-1][0] if self._redo else None
+
+    # Method to return how many changes are held
+    def __len__(self):
+        return self._size
@@ -0,0 +1,256 @@
+
+import json # For the prices file
+import operator # For multiplying two columns without a Python loop
+import os # For atomic replace of the prices file
+from array import array # For the quantity, unit cost and price columns
+from collections import deque # For the FIFO cost layers of an item
+
+# NumPy turns the full revaluation into two dot products; without it the same array columns are
+# multiplied with map() and summed, which is still one pass in C
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Stock valuation for the stocktaking app
+# Items can have a unit cost (what new stock is bought at) and a retail price, kept in
+# stock_data.json.prices.json. The stock on hand is valued at cost with one of two methods:
+#   average  weighted average cost: stock coming in at a different cost moves the item's average
+#   fifo     first in, first out: each delivery is a cost layer and stock going out uses up the oldest
+# Stock added without a cost comes in at the item's current cost; a cost given with a delivery values
+# that delivery only (a new FIFO layer, or blended into the average), and only setting an item's cost
+# changes its current cost (and values the stock on hand at it). Only items with a cost or price are tracked. Their quantities, the cost
+# per unit of the stock on hand and their prices are kept in three columns, so revaluing the whole
+# catalogue is two vector operations, and each add or remove only moves the totals by that item's change.
+
+# Costing methods that can be chosen
+COSTING_METHODS = ("average", "fifo")
+
+
+# Function to load the prices file (an empty dictionary if there isn't one)
+def load_prices(path):
+    try:
+        with open(path, "r") as file:
+            saved = json.load(file)
+    except FileNotFoundError:
+        return {}
+    return saved if isinstance(saved, dict) else {}
+
+
+# Function to write the prices file without ever leaving a half-written one
+def save_prices(path, prices):
+    with open(path + ".tmp", "w") as file:
+        json.dump(prices, file, indent=4, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+# Define the Valuation class that keeps the stock value at cost and at retail
+class Valuation:
+    # Column store of quantity, on-hand unit cost, current cost and price, plus running totals.
+
+    # Initialize the Valuation from the contents of a prices file
+    def __init__(self, prices=None):
+        prices = prices or {}
+        self.method = prices.get("costing", "average")
+        if self.method not in COSTING_METHODS:
+            self.method = "average"
+        # Item -> position in the columns (items without a cost or price aren't in them)
+        self._index = {}
+        self._names = []
+        self._quantities = array("q")
+        # Cost per unit of the stock on hand, cost of new stock, and retail price
+        self._unit_costs = array("d")
+        self._costs = array("d")
+        self._prices = array("d")
+        # Item -> deque of [quantity, unit cost], oldest first (FIFO only, and only for items with stock at
+        # more than one cost; any other item is one layer of its quantity at its on-hand unit cost)
+        self._layers = {}
+        # Stock value at cost and at retail
+        self.total_cost = 0.0
+        self.total_retail = 0.0
+        for item, fields in prices.get("items", {}).items():
+            position = self._column(item)
+            self._costs[position] = self._unit_costs[position] = float(fields.get("cost", 0))
+            self._prices[position] = float(fields.get("price", 0))
+        # Cost layers saved with the prices; matched to the loaded stock by rebuild()
+        self._saved_layers = prices.get("layers", {})
+
+    # Method to return an item's column, adding an empty one if it has none
+    def _column(self, item):
+        position = self._index.get(item)
+        if position is None:
+            position = self._index[item] = len(self._names)
+            self._names.append(item)
+            self._quantities.append(0)
+            self._unit_costs.append(0.0)
+            self._costs.append(0.0)
+            self._prices.append(0.0)
+        return position
+
+    # Method to check whether any item has a cost or a price
+    def has_prices(self):
+        return bool(self._names)
+
+    # Method to take in the quantities of the loaded stock (once, after loading) and revalue everything;
+    # saved cost layers are used as far as they still match the quantities
+    def rebuild(self, inventory):
+        layers, self._saved_layers = self._saved_layers, {}
+        self._layers = {}
+        for item, position in self._index.items():
+            quantity = inventory.get(item)
+            self._quantities[position] = quantity
+            saved = layers.get(item)
+            if not saved:
+                # Nothing saved: all of it is valued at the item's cost
+                self._unit_costs[position] = self._costs[position]
+                continue
+            if len(saved) == 1 and saved[0][0] == quantity:
+                # One cost saved for the same quantity (the usual case)
+                self._unit_costs[position] = float(saved[0][1])
+                continue
+            saved = deque([int(amount), float(cost)] for amount, cost in layers[item] if int(amount) > 0)
+            # Stock the saved layers don't account for comes in at the item's cost; extra layers are used up
+            self._apply_layers(saved, quantity - sum(amount for amount, _ in saved), self._costs[position])
+            value = sum(amount * cost for amount, cost in saved)
+            self._unit_costs[position] = value / quantity if quantity else self._costs[position]
+            if self.method == "fifo" and len(saved) > 1:
+                self._layers[item] = saved
+        self.revalue()
+
+    # Method to work out both totals from scratch with one pass over the columns
+    def revalue(self):
+        if numpy is not None and self._names:
+            quantities = numpy.frombuffer(self._quantities, dtype=numpy.int64)
+            self.total_cost = float(numpy.dot(quantities, numpy.frombuffer(self._unit_costs)))
+            self.total_retail = float(numpy.dot(quantities, numpy.frombuffer(self._prices)))
+        else:
+            self.total_cost = sum(map(operator.mul, self._quantities, self._unit_costs))
+            self.total_retail = sum(map(operator.mul, self._quantities, self._prices))
+        return self.total_cost, self.total_retail
+
+    # Method to add or use up cost layers for a change in quantity (oldest layers are used first)
+    @staticmethod
+    def _apply_layers(layers, change, cost):
+        if change > 0:
+            if layers and layers[-1][1] == cost:
+                layers[-1][0] += change
+            else:
+                layers.append([change, cost])
+            return
+        left = -change
+        while left and layers:
+            used = min(left, layers[0][0])
+            layers[0][0] -= used
+            left -= used
+            if not layers[0][0]:
+                layers.popleft()
+
+    # Method to take in an item's new quantity after an add or remove; unit_cost is what the stock
+    # that came in cost (default: the item's current cost). Adjusts the totals by this item only.
+    def update(self, item, quantity, unit_cost=None):
+        position = self._index.get(item)
+        if position is None:
+            if unit_cost is None:
+                return  # No cost or price, so no value
+            # An item first priced by a delivery starts with that delivery's cost
+            position = self._column(item)
+            self._costs[position] = unit_cost
+        old_quantity = self._quantities[position]
+        change = quantity - old_quantity
+        if not change:
+            return
+        old_value = old_quantity * self._unit_costs[position]
+        # What the stock coming in cost; the item's own cost is left for later deliveries
+        cost = self._costs[position] if unit_cost is None else unit_cost
+        if self.method == "fifo":
+            layers = self._layers.pop(item, None) or deque([[old_quantity, self._unit_costs[position]]] if old_quantity else [])
+            self._apply_layers(layers, change, cost)
+            value = sum(amount * layer_cost for amount, layer_cost in layers)
+            if len(layers) > 1:
+                self._layers[item] = layers
+        elif change > 0:
+            value = old_value + change * cost
+        else:
+            # Stock going out doesn't change the average cost
+            value = quantity * self._unit_costs[position]
+        self._quantities[position] = quantity
+        self._unit_costs[position] = value / quantity if quantity else self._costs[position]
+        self.total_cost += value - old_value
+        self.total_retail += change * self._prices[position]
+
+    # Method to set an item's cost and/or retail price (None leaves it as it is); a new cost values the
+    # stock on hand at that cost. quantity is the item's current quantity.
+    def set_price(self, item, quantity, cost=None, price=None):
+        position = self._column(item)
+        if self._quantities[position] != quantity:
+            self.update(item, quantity)
+        if cost is not None:
+            self.total_cost += quantity * (cost - self._unit_costs[position])
+            self._costs[position] = self._unit_costs[position] = cost
+            self._layers.pop(item, None)
+        if price is not None:
+            self.total_retail += quantity * (price - self._prices[position])
+            self._prices[position] = price
+
+    # Method to set the cost and/or price of many items at once ({item: (cost, price)}, None to leave one
+    # as it is), then revalue everything in one pass
+    def set_prices(self, prices, inventory):
+        for item, (cost, price) in prices.items():
+            position = self._column(item)
+            quantity = inventory.get(item)
+            self._quantities[position] = quantity
+            if cost is not None:
+                self._costs[position] = self._unit_costs[position] = cost
+                self._layers.pop(item, None)
+            if price is not None:
+                self._prices[position] = price
+        return self.revalue()
+
+    # Method to switch between average and FIFO costing (the value of the stock on hand stays the same)
+    def set_method(self, method):
+        if method not in COSTING_METHODS:
+            raise ValueError(f"Costing must be one of: {', '.join(COSTING_METHODS)}")
+        if method == self.method:
+            return
+        self.method = method
+        # What is on hand becomes one layer at its average cost
+        self._layers = {}
+
+    # Method to return (quantity, unit cost of the stock on hand, cost, price) of an item
+    def item(self, item):
+        position = self._index.get(item)
+        if position is None:
+            return None
+        return self._quantities[position], self._unit_costs[position], self._costs[position], self._prices[position]
+
+    # Method to return [(item, quantity, value at cost, value at retail)] for the items in stock,
+    # highest value at cost first
+    def rows(self, limit=None):
+        if numpy is not None and self._names:
+            quantities = numpy.frombuffer(self._quantities, dtype=numpy.int64)
+            cost_values = (quantities * numpy.frombuffer(self._unit_costs)).tolist()
+            retail_values = (quantities * numpy.frombuffer(self._prices)).tolist()
+            quantities = quantities.tolist()
+        else:
+            quantities = self._quantities
+            cost_values = list(map(operator.mul, quantities, self._unit_costs))
+            retail_values = list(map(operator.mul, quantities, self._prices))
+        rows = sorted(
+            (row for row in zip(self._names, quantities, cost_values, retail_values) if row[1] > 0),
+            key=lambda row: (-row[2], row[0]),
+        )
+        return rows[:limit] if limit is not None else rows
+
+    # Method to return the prices file contents (costing method, item costs and prices, cost layers)
+    def to_dict(self):
+        layers = {
+            item: ([list(layer) for layer in self._layers[item]] if item in self._layers else [[self._quantities[position], self._unit_costs[position]]])
+            for item, position in self._index.items() if self._quantities[position]
+        }
+        return {
+            "costing": self.method,
+            "items": {
+                item: {"cost": self._costs[position], "price": self._prices[position]} for item, position in self._index.items()
+            },
+            "layers": layers,
+        }
@@ -0,0 +1,233 @@
+
+import tkinter as tk # Importing tkinter for GUI
+import bisect # For keeping the row keys sorted without re-sorting everything
+
+# Virtualized list widget for the stocktaking app
+# A tk.Listbox holds one Tcl item per row, so refreshing a big catalogue means deleting and re-inserting
+# every row. This widget only draws the rows that fit on screen and keeps a sorted index of keys,
+# so adding or removing one item only touches that item's row.
+
+# Define the VirtualListbox class that inherits from tk.Frame and holds a canvas plus a scrollbar
+class VirtualListbox(tk.Frame):
+    # List of sorted rows where only the visible ones are drawn on the canvas.
+
+    # Initialize the VirtualListbox with the parent, size in rows/characters and the text shown when empty
+    def __init__(self, parent, height=15, width=50, font=("Arial", 10), row_height=18, empty_text=""):
+        super().__init__(parent, bg=parent.cget('bg'))
+        # Number of rows that fit on the screen
+        self.visible_rows = height
+        # Height of one row in pixels
+        self.row_height = row_height
+        # Font used for the row text
+        self.font = font
+        # Text to show when there are no rows
+        self.empty_text = empty_text
+        # Sorted list of row keys (the index used for bisect lookups)
+        self._keys = []
+        # Dictionary of key -> row text
+        self._rows = {}
+        # Index of the first row on screen
+        self._top = 0
+        # Key of the selected row (None if nothing is selected)
+        self._selected = None
+
+        # Canvas that the visible rows are drawn on
+        self.canvas = tk.Canvas(self, width=width * 7, height=height * row_height, bg="white", highlightthickness=1, highlightbackground="gray")
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        # Scrollbar that drives our own yview method
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        # Create the highlight rectangle and a fixed pool of text items once; scrolling only changes their text
+        self._highlight = self.canvas.create_rectangle(0, 0, 0, 0, fill="#cce5ff", outline="", state=tk.HIDDEN)
+        self._text_items = []
+        for row in range(height):
+            self._text_items.append(self.canvas.create_text(4, row * row_height + row_height / 2, anchor=tk.W, text="", font=font))
+
+        # Bind clicks for selection and the mouse wheel / arrow keys for scrolling
+        self.canvas.bind("<Button-1>", self.on_click)
+        self.canvas.bind("<MouseWheel>", self.on_mousewheel)
+        self.canvas.bind("<Button-4>", lambda event: self.yview("scroll", -3, "units"))  # Linux wheel up
+        self.canvas.bind("<Button-5>", lambda event: self.yview("scroll", 3, "units"))  # Linux wheel down
+        self.canvas.bind("<Up>", lambda event: self.move_selection(-1))
+        self.canvas.bind("<Down>", lambda event: self.move_selection(1))
+
+        # Draw the empty list
+        self.redraw()
+
+    # Method to replace all rows at once (used when stock is first loaded); rows is an iterable of (key, text)
+    def set_rows(self, rows):
+        self._rows = dict(rows)
+        self._keys = sorted(self._rows)
+        self._top = 0
+        self._selected = None
+        self.redraw()
+
+    # Method to add a run of rows given in key order (used to fill the list a chunk at a time); rows
+    # after the current last row are appended, anything else is inserted in place
+    def add_sorted_rows(self, rows):
+        for key, text in rows:
+            if key in self._rows:
+                self._rows[key] = text
+            elif not self._keys or key > self._keys[-1]:
+                self._keys.append(key)
+                self._rows[key] = text
+            else:
+                index = bisect.bisect_left(self._keys, key)
+                self._keys.insert(index, key)
+                self._rows[key] = text
+                if index < self._top:
+                    self._top += 1
+        self.redraw()
+
+    # Method to add a new row or change the text of an existing one
+    def upsert(self, key, text):
+        if key in self._rows:
+            # Existing row: only the text changes, redraw only if it is on screen
+            self._rows[key] = text
+            index = bisect.bisect_left(self._keys, key)
+            if self._is_visible(index):
+                self.redraw()
+            return
+        # New row: insert the key into its sorted position
+        index = bisect.bisect_left(self._keys, key)
+        self._keys.insert(index, key)
+        self._rows[key] = text
+        # Rows above the screen push the visible rows down, so keep the same rows on screen
+        if index < self._top:
+            self._top += 1
+        self.redraw()
+
+    # Method to remove a row by key (does nothing if the key isn't in the list)
+    def discard(self, key):
+        if key not in self._rows:
+            return
+        index = bisect.bisect_left(self._keys, key)
+        del self._keys[index]
+        del self._rows[key]
+        if self._selected == key:
+            self._selected = None
+        # Rows above the screen pull the visible rows up, so keep the same rows on screen
+        if index < self._top:
+            self._top -= 1
+        self.redraw()
+
+    # Method to return the number of rows
+    def size(self):
+        return len(self._keys)
+
+    # Method to return the index of the row with the given key (or None)
+    def index_of(self, key):
+        index = bisect.bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            return index
+        return None
+
+    # Method to return the selected index as a tuple, the same as tk.Listbox.curselection
+    def curselection(self):
+        if self._selected is None:
+            return ()
+        return (self.index_of(self._selected),)
+
+    # Method to return the text of the row at an index, the same as tk.Listbox.get
+    def get(self, index):
+        if not self._keys:
+            return self.empty_text
+        return self._rows[self._keys[index]]
+
+    # Method to return the key of the selected row (None if nothing is selected)
+    def selected_key(self):
+        return self._selected
+
+    # Method to select a row by key and scroll it into view
+    def select(self, key):
+        index = self.index_of(key)
+        if index is None:
+            return
+        self._selected = key
+        self.see(index)
+        self.redraw()
+
+    # Method to scroll so the row at the index is on screen
+    def see(self, index):
+        if index < self._top:
+            self._top = index
+        elif index >= self._top + self.visible_rows:
+            self._top = index - self.visible_rows + 1
+        self._clamp_top()
+
+    # Method used by the scrollbar ("moveto" fraction or "scroll" n units/pages)
+    def yview(self, *args):
+        if not args:
+            return self._fractions()
+        if args[0] == "moveto":
+            self._top = int(float(args[1]) * len(self._keys))
+        elif args[0] == "scroll":
+            step = int(args[1])
+            if args[2] == "pages":
+                step *= self.visible_rows
+            self._top += step
+        self._clamp_top()
+        self.redraw()
+
+    # Event handler for the mouse wheel (Windows and macOS)
+    def on_mousewheel(self, event):
+        self.yview("scroll", -3 if event.delta > 0 else 3, "units")
+
+    # Event handler for clicking a row to select it
+    def on_click(self, event):
+        self.canvas.focus_set()
+        index = self._top + int(event.y // self.row_height)
+        if 0 <= index < len(self._keys):
+            self._selected = self._keys[index]
+        else:
+            self._selected = None
+        self.redraw()
+
+    # Method to move the selection up or down with the arrow keys
+    def move_selection(self, step):
+        if not self._keys:
+            return
+        index = self.index_of(self._selected) if self._selected is not None else -1
+        index = max(0, min(len(self._keys) - 1, index + step))
+        self.select(self._keys[index])
+
+    # Method to redraw only the rows that are on the screen
+    def redraw(self):
+        self._clamp_top()
+        # Show the empty text if there are no rows
+        if not self._keys:
+            for row, item in enumerate(self._text_items):
+                self.canvas.itemconfig(item, text=self.empty_text if row == 0 else "")
+            self.canvas.itemconfig(self._highlight, state=tk.HIDDEN)
+            self.scrollbar.set(0, 1)
+            return
+        # Fill the fixed pool of text items with the rows from _top onwards
+        for row, item in enumerate(self._text_items):
+            index = self._top + row
+            self.canvas.itemconfig(item, text=self._rows[self._keys[index]] if index < len(self._keys) else "")
+        # Move the highlight rectangle to the selected row if it is on screen
+        selected_index = self.index_of(self._selected) if self._selected is not None else None
+        if selected_index is not None and self._is_visible(selected_index):
+            y = (selected_index - self._top) * self.row_height
+            self.canvas.coords(self._highlight, 0, y, int(self.canvas.cget("width")) + 2, y + self.row_height)
+            self.canvas.itemconfig(self._highlight, state=tk.NORMAL)
+        else:
+            self.canvas.itemconfig(self._highlight, state=tk.HIDDEN)
+        # Update the scrollbar position
+        self.scrollbar.set(*self._fractions())
+
+    # Method to check whether a row index is on the screen
+    def _is_visible(self, index):
+        return self._top <= index < self._top + self.visible_rows
+
+    # Method to keep _top within the range of rows
+    def _clamp_top(self):
+        self._top = max(0, min(self._top, len(self._keys) - self.visible_rows))
+
+    # Method to work out the scrollbar fractions for the rows on screen
+    def _fractions(self):
+        count = len(self._keys)
+        if count <= self.visible_rows:
+            return (0.0, 1.0)
+        return (self._top / count, (self._top + self.visible_rows) / count)